@@ -1,7 +1,11 @@
 import uuid
 
+from .entity import Entity
+
+
+class ContentBlock(Entity):
+    __slots__ = ()
 
-class ContentBlock:
     def clear_resources(self):
         pass
 
@@ -12,16 +16,25 @@ class ContentBlock:
 
 
 class TextBlock(ContentBlock):
+    __slots__ = ('content_text',)
+
     def __init__(self, content_text):
         self.content_text = content_text
 
 
 class Heading(ContentBlock):
+    __slots__ = ('content_text',)
+
     def __init__(self, content_text):
         self.content_text = content_text
 
 
 class Image(ContentBlock):
+    __slots__ = (
+        'image_id', 'original_path_small', 'original_path_fullsize', 'extension', 'caption', 'image_small', 'image_fullsize',
+        'resource_small', 'resource_fullsize'
+    )
+
     def __init__(self, original_path_small, original_path_fullsize, caption, image_small, image_fullsize):
         self.image_id = str(uuid.uuid4())
 
@@ -34,6 +47,10 @@ class Image(ContentBlock):
         self.image_small = image_small
         self.image_fullsize = image_fullsize
 
+        # Where the images are saved among the resources, once they have been
+        self.resource_small = '{0}.small.{1}'.format(self.image_id, self.extension)
+        self.resource_fullsize = '{0}.{1}'.format(self.image_id, self.extension)
+
     def _find_extension(self, path):
         if '.' in path:
             path = path[path.rfind('.')+1:]
@@ -45,13 +62,15 @@ class Image(ContentBlock):
         self.image_small, self.image_fullsize = None, None
 
     def get_small_resource_path(self):
-        return '{0}.small.{1}'.format(self.image_id, self.extension)
+        return self.resource_small
 
     def get_fullsize_resource_path(self):
-        return '{0}.{1}'.format(self.image_id, self.extension)
+        return self.resource_fullsize
 
 
 class Map(ContentBlock):
+    __slots__ = ('map_id', 'original_id', 'caption', 'gpx_data', 'json_data', 'original_url', 'resource_gpx', 'resource_json')
+
     def __init__(self, original_id, caption, gpx_data=None, json_data=None, url=None):
         self.map_id = str(uuid.uuid4())
         self.original_id = original_id
@@ -60,6 +79,10 @@ class Map(ContentBlock):
         self.json_data = json_data
         self.original_url = url
 
+        # Where the track is saved among the resources, once it has been
+        self.resource_gpx = '{0}.gpx'.format(self.map_id)
+        self.resource_json = '{0}.json'.format(self.map_id)
+
     def set_gpx_data(self, gpx_data):
         self.gpx_data = gpx_data
 
@@ -74,4 +97,23 @@ class Map(ContentBlock):
         self.json_data = None
 
     def get_resource_path(self):
-        return '{0}.gpx'.format(self.map_id)
+        return self.resource_gpx
+
+    def get_json_resource_path(self):
+        return self.resource_json
+
+
+@Image.migration(0)
+def _image_from_unversioned(fields):
+    # Images were saved under their ID
+    fields['resource_small'] = '{0}.small.{1}'.format(fields['image_id'], fields['extension'])
+    fields['resource_fullsize'] = '{0}.{1}'.format(fields['image_id'], fields['extension'])
+    return fields
+
+
+@Map.migration(0)
+def _map_from_unversioned(fields):
+    # Maps were saved under their ID
+    fields['resource_gpx'] = '{0}.gpx'.format(fields['map_id'])
+    fields['resource_json'] = '{0}.json'.format(fields['map_id'])
+    return fields
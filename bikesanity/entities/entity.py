@@ -0,0 +1,137 @@
+import operator
+
+
+_migrations = {}
+
+
+def pack_entities(entities):
+    """
+    A list of entities in the compact form they're pickled in: each class once, with its version and the names
+    of its fields, then for each entity the position of its class and the values of its fields.
+    """
+    classes, positions = [], {}
+    kinds, values = [], []
+    for entity in entities:
+        cls = type(entity)
+        if cls not in positions:
+            positions[cls] = len(classes)
+            classes.append((cls, cls.VERSION, cls.SAVED_FIELDS))
+        kinds.append(positions[cls])
+
+        entity_values = entity.saved_values()
+        if cls.PACKED:
+            entity_values = tuple(
+                pack_entities(value) if name in cls.PACKED else value for name, value in zip(cls.SAVED_FIELDS, entity_values)
+            )
+        values.append(entity_values)
+    return tuple(classes), kinds, values
+
+
+def unpack_entities(packed):
+    classes, kinds, values = packed
+    # Entities saved with the fields their class has now are set directly, and any others migrated
+    restorers = [
+        (cls, version, names, version == cls.VERSION and names == cls.SAVED_FIELDS) for cls, version, names in classes
+    ]
+
+    entities = []
+    for kind, entity_values in zip(kinds, values):
+        cls, version, names, current = restorers[kind]
+        entity = cls.__new__(cls)
+        if current:
+            for name, value in zip(names, entity_values): setattr(entity, name, value)
+            if cls.TRANSIENT or cls.PACKED: entity._restore_unsaved()
+        else:
+            entity.__setstate__((version, dict(zip(names, entity_values))))
+        entities.append(entity)
+    return entities
+
+
+def _restore(packed):
+    # Rebuild an entity pickled by Entity.__reduce_ex__
+    return unpack_entities(packed)[0]
+
+
+class Entity:
+    """
+    Base of the journal model. Fields are held in __slots__ rather than a dict per object, which matters with
+    tens of thousands of text blocks, and entities are pickled as their class's version with the values of
+    their fields, the names of which are pickled once for each class. Lists of entities, such as a page's
+    contents, are pickled together in that form rather than one entity at a time.
+
+    Entities saved at an older version are brought up to date as they're loaded by the migrations registered
+    for each version in between - version 0 being how they were pickled, as a dict, before being versioned.
+    """
+
+    __slots__ = ()
+
+    # Bump, registering a migration from the version before, whenever the fields saved change
+    VERSION = 1
+    # Fields that are never saved, and are None once loaded
+    TRANSIENT = ()
+    # Fields holding lists of entities, saved packed together
+    PACKED = ()
+
+    # Every field, and those saved, in order - worked out for each class as it's defined
+    FIELDS = ()
+    SAVED_FIELDS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = []
+        for klass in reversed(cls.__mro__):
+            fields.extend(name for name in klass.__dict__.get('__slots__', ()) if name not in fields)
+        cls.FIELDS = tuple(fields)
+        cls.SAVED_FIELDS = tuple(name for name in fields if name not in cls.TRANSIENT)
+
+        # A getter for a single field returns just its value
+        getter = operator.attrgetter(*cls.SAVED_FIELDS) if cls.SAVED_FIELDS else (lambda entity: ())
+        cls._get_saved_values = staticmethod(getter if len(cls.SAVED_FIELDS) != 1 else lambda entity: (getter(entity),))
+
+    @classmethod
+    def migration(cls, from_version):
+        """Register a function bringing the fields saved at one version up to the next"""
+        def register(migrate):
+            _migrations[(cls, from_version)] = migrate
+            return migrate
+        return register
+
+    def saved_values(self):
+        """The value of every field saved, in the order of SAVED_FIELDS"""
+        return self._get_saved_values(self)
+
+    def get_fields(self):
+        """The value of every field saved, by name"""
+        return dict(zip(self.SAVED_FIELDS, self.saved_values()))
+
+    def _restore_unsaved(self):
+        for name in self.TRANSIENT: setattr(self, name, None)
+        for name in self.PACKED: setattr(self, name, unpack_entities(getattr(self, name)))
+
+    def __reduce_ex__(self, protocol):
+        return _restore, (pack_entities([self]),)
+
+    def __setstate__(self, state):
+        version, fields = state if isinstance(state, tuple) else (0, dict(state))
+        if version > self.VERSION:
+            raise ValueError('{0} was saved by a newer version ({1}, expected up to {2})'.format(
+                type(self).__name__, version, self.VERSION
+            ))
+
+        # Lists saved packed are read back first, so migrations see the entities themselves
+        if version:
+            for name in self.PACKED:
+                if name in fields: fields[name] = unpack_entities(fields[name])
+
+        # Versions with no migration registered saved the same fields as the next
+        for from_version in range(version, self.VERSION):
+            migrate = _migrations.get((type(self), from_version))
+            if migrate: fields = migrate(fields)
+
+        for name in self.FIELDS:
+            if name in self.TRANSIENT:
+                setattr(self, name, None)
+            elif name in fields:
+                setattr(self, name, fields[name])
+            else:
+                raise ValueError('{0} was saved without {1}'.format(type(self).__name__, name))
@@ -1,26 +1,78 @@
+import os
+
 from .content_blocks import Image
-from .page import Page
+from .entity import Entity
+from .page import Page, read_html_source, relative_source, resolve_source
+
+
+class TocEntry(Entity):
+    __slots__ = ('original_id', 'title', 'url', '_page', '_stored_pages', '_position')
 
+    # Where a page is stored is only known to the journal it was loaded into
+    TRANSIENT = ('_stored_pages', '_position')
 
-class TocEntry:
     def __init__(self, original_id, title, url):
         self.original_id = original_id
         self.title = title
         self.url = url
-        self.page = None
+        self._page = None
+
+        # Where the page is kept on disk, when it's read only as it's needed
+        self._stored_pages = None
+        self._position = None
+
+    @property
+    def page(self):
+        if self._page is None and self._stored_pages is not None: return self._stored_pages.get(self._position)
+        return self._page
+
+    @page.setter
+    def page(self, page):
+        self._page = page
+        self._stored_pages = None
 
     def set_page(self, page):
         self.page = page
 
+    def set_stored_page(self, stored_pages, position):
+        self._page = None
+        self._stored_pages = stored_pages
+        self._position = position
+
+    def has_page(self):
+        # Whether there's a page, without reading it in
+        return self._page is not None or self._stored_pages is not None
+
+    def saved_values(self):
+        # A page left in the store is read in, so it's saved wherever the entry is
+        return self.original_id, self.title, self.url, self.page
+
 
-class Journal:
+class Journal(Entity):
+    __slots__ = (
+        'journal_id', '_original_html', 'postprocessed_html', 'html_source', 'html_released', 'journal_title',
+        'journal_subtitle', 'journal_author', 'distance_statement', 'locales', 'cover_image', 'toc', 'single_page',
+        'js', 'css', 'html_directory', 'html_root'
+    )
+
+    VERSION = 2
+    # Where the journal's directory is found depends on where it's loaded from
+    TRANSIENT = ('html_root',)
+    PACKED = ('toc',)
 
     def __init__(self, journal_id, original_html):
         self.journal_id = journal_id
 
-        self.original_html = original_html
+        self._original_html = original_html
         self.postprocessed_html = None
 
+        # The file the index was read from, so the HTML can be dropped once interpreted, relative to the directory
+        # of the journal. That directory is saved relative to where the journal is, and found again once loaded
+        self.html_source = None
+        self.html_released = False
+        self.html_directory = None
+        self.html_root = None
+
         self.journal_title = None
         self.journal_subtitle = None
         self.journal_author = None
@@ -35,6 +87,41 @@ class Journal:
         self.js = {}
         self.css = {}
 
+    @property
+    def original_html(self):
+        if self.html_released: return read_html_source(self.html_source_path)
+        return self._original_html
+
+    @property
+    def html_source_path(self):
+        return resolve_source(self.html_source, self.html_root)
+
+    def set_html_source(self, path, root):
+        # Once the HTML is dropped, the source is only ever moved to where it's been found again
+        if self.html_released and not path: return
+        self.html_source = relative_source(path, root)
+        if root: self.html_root = os.path.abspath(root)
+
+    def locate_html_directory(self, base_path):
+        # Saved relative to where the journal is saved, so moving both together keeps the HTML found
+        if self.html_root: self.html_directory = relative_source(self.html_root, base_path)
+
+    def resolve_html_root(self, base_path):
+        """The journal's directory, for a journal saved below base_path, which the HTML of its pages is read from too"""
+        if self.html_directory: self.html_root = resolve_source(self.html_directory, base_path)
+        for toc in self.toc:
+            if toc._page is not None: toc._page.html_root = self.html_root
+        return self.html_root
+
+    def release_html(self):
+        """Drop the raw HTML, if it can be read back from where it came from"""
+        if self.html_released: return True
+        if not self.html_source: return False
+
+        self._original_html, self.postprocessed_html = None, None
+        self.html_released = True
+        return True
+
     def add_toc_entry(self, original_id, title, url):
         toc_entry = TocEntry(original_id, title, url)
         self.toc.append(toc_entry)
@@ -48,8 +135,9 @@ class Journal:
         self.cover_image = image
 
     def save_original_source(self, local_handler):
-        # Save the HTML itself
+        # Save the HTML itself, which can be read back from there from now on
         local_handler.save_html_original('index.html', self.postprocessed_html if self.postprocessed_html else self.original_html)
+        self.set_html_source(local_handler.get_path('index.html'), local_handler.get_base_path())
 
         # Save the cover image if one exists
         if self.cover_image: local_handler.save_image_original(self.cover_image)
@@ -60,6 +148,11 @@ class Journal:
         for css, content in self.css.items():
             local_handler.save_css_resource(css, content)
 
+    def has_js_css_resources(self):
+        # Every script and stylesheet was retrieved
+        contents = list(self.js.values()) + list(self.css.values())
+        return bool(contents) and all(content is not None for content in contents)
+
     def save_resources(self, local_handler):
         # Save the cover image if one exists
         if self.cover_image: local_handler.save_image_resource(self.cover_image)
@@ -74,5 +167,26 @@ class Journal:
             if css:
                 css.close()
 
-    def update_data_model(self):
-        if not hasattr(self, 'single_page'): self.single_page = False
+
+@TocEntry.migration(0)
+def _toc_entry_from_unversioned(fields):
+    # The page was a plain attribute, before it could be left in the store
+    if 'page' in fields: fields['_page'] = fields.pop('page')
+    return fields
+
+
+@Journal.migration(0)
+def _journal_from_unversioned(fields):
+    # The earliest journals had no single page flag, and the HTML was held before it could be read back
+    fields.setdefault('single_page', False)
+    if 'original_html' in fields: fields['_original_html'] = fields.pop('original_html')
+    fields.setdefault('html_source', None)
+    fields.setdefault('html_released', False)
+    return fields
+
+
+@Journal.migration(1)
+def _journal_without_html_directory(fields):
+    # Sources were saved as absolute paths, and are still read from there
+    fields.setdefault('html_directory', None)
+    return fields
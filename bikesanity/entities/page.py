@@ -1,21 +1,66 @@
 import logging
+import os
+from concurrent.futures import Future
+
 from .content_blocks import ContentBlock, Image, Map
+from .entity import Entity
 
 log = logging.getLogger(__name__)
 
 
-class Page:
+def relative_source(path, root):
+    # Sources are saved relative to the directory of the journal they came from, so they still resolve once it moves
+    if not path: return None
+    if not root: return os.path.abspath(path)
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(root)).replace(os.sep, '/')
+
+
+def resolve_source(source, root):
+    # Sources saved by earlier versions are absolute, and are read from wherever they were
+    if not source or os.path.isabs(source): return source
+    return os.path.normpath(os.path.join(root, *source.split('/'))) if root else None
+
+
+def read_html_source(path):
+    # HTML read back from where it was saved comes as bytes, however it was first read
+    if not path:
+        log.warning('Unable to read HTML back, as where it was saved is unknown')
+        return None
+    try:
+        with open(path, 'rb') as handle:
+            return handle.read()
+    except OSError as exc:
+        log.warning('Unable to read HTML back from {0}: {1}'.format(path, exc))
+        return None
+
+
+class Page(Entity):
+    __slots__ = (
+        'journal_id', 'original_id', '_original_html', 'postprocessed_html', '_additional_html_pages',
+        'additional_postprocessed_html', 'html_sources', 'html_released', 'title', 'date_statement', 'page_distance',
+        'total_distance', 'contents', 'maps', 'parsed_document', 'html_root'
+    )
+
+    # The parsed tree is only ever held between retrieval and interpretation, and where the journal is found when loaded
+    TRANSIENT = ('parsed_document', 'html_root')
+    PACKED = ('contents', 'maps')
 
     def __init__(self, journal_id, original_id, original_html):
         self.journal_id = journal_id
         self.original_id = original_id
 
-        self.original_html = original_html
+        self._original_html = original_html
         self.postprocessed_html = None
 
-        self.additional_html_pages = []
+        self._additional_html_pages = []
         self.additional_postprocessed_html = []
 
+        # The files the page and its additional parts were read from, so the HTML can be dropped once interpreted,
+        # relative to the directory of the journal they belong to
+        self.html_sources = []
+        self.html_released = False
+        self.html_root = None
+
         self.title = None
         self.date_statement = None
         self.page_distance = None
@@ -24,12 +69,56 @@ class Page:
         self.contents = []
         self.maps = []
 
+        # Parsed tree of the original HTML, held only between retrieval and interpretation
+        self.parsed_document = None
+
+    @property
+    def original_html(self):
+        if self.html_released: return read_html_source(self.html_source_paths[0])
+        return self._original_html
+
+    @property
+    def additional_html_pages(self):
+        if self.html_released: return [read_html_source(path) for path in self.html_source_paths[1:]]
+        return self._additional_html_pages
+
+    @property
+    def html_source_paths(self):
+        return [resolve_source(source, self.html_root) for source in self.html_sources]
+
     def add_additional_html(self, additional_html):
-        self.additional_html_pages.append(additional_html)
+        self._additional_html_pages.append(additional_html)
+
+    def add_html_source(self, path, root):
+        # Sources that can't be found are kept as None, so the HTML is never dropped without somewhere to read it back
+        self.html_sources.append(relative_source(path, root))
+        if root: self.html_root = os.path.abspath(root)
+
+    def release_html(self):
+        """Drop the raw HTML, if every part of it can be read back from where it came from"""
+        if self.html_released: return True
+        if len(self.html_sources) != len(self._additional_html_pages) + 1 or None in self.html_sources: return False
+
+        self._original_html, self._additional_html_pages = None, []
+        self.postprocessed_html, self.additional_postprocessed_html = None, []
+        self.html_released = True
+        return True
+
+    def set_parsed_document(self, doc):
+        self.parsed_document = doc
+
+    def take_parsed_document(self):
+        # Interpretation consumes the tree, so hand it over just the once
+        doc, self.parsed_document = self.parsed_document, None
+        return doc
 
     def add_content(self, content_block: ContentBlock):
         self.contents.append(content_block)
 
+    def resolve_pending_contents(self):
+        # Blocks still being retrieved are held as futures, so swap in their results in order
+        self.contents = [content.result() if isinstance(content, Future) else content for content in self.contents]
+
     def parse_distance_statement(self, distance_statement):
         if not distance_statement: return
 
@@ -52,23 +141,46 @@ class Page:
             elif isinstance(content, Map):
                 persist_map(content)
 
+    def has_missing_images(self):
+        return any(
+            isinstance(content, Image) and not (content.image_small and content.image_fullsize)
+            for content in self.contents
+        )
+
     def save_resources(self, local_handler):
         self._persist_resources(local_handler.save_image_resource, local_handler.save_map_resource)
 
     def save_originals(self, local_handler):
         # Save the page HTML, including any additional sections
         local_handler.save_html_original(self.original_id + '.html', self.postprocessed_html if self.postprocessed_html else self.original_html)
+        html_sources = [self.original_id + '.html']
         part = 2
 
         additional_html_pages = self.additional_postprocessed_html if self.additional_postprocessed_html else self.additional_html_pages
         for additional_html in additional_html_pages:
             filename = '{0}_{1}.html'.format(self.original_id, part)
             local_handler.save_html_original(filename, additional_html)
+            html_sources.append(filename)
             part += 1
 
+        # From now on the HTML can be read back from the saved copies
+        if not self.html_released:
+            self.html_sources = []
+            for filename in html_sources: self.add_html_source(local_handler.get_path(filename), local_handler.get_base_path())
+
         # Save the associated image and map originals
         self._persist_resources(local_handler.save_image_original, local_handler.save_map_original)
 
     def clear_resources(self):
         for content in self.contents:
             content.clear_resources()
+
+
+@Page.migration(0)
+def _page_from_unversioned(fields):
+    # The HTML was held as plain attributes, before it could be read back from where it was saved
+    if 'original_html' in fields: fields['_original_html'] = fields.pop('original_html')
+    if 'additional_html_pages' in fields: fields['_additional_html_pages'] = fields.pop('additional_html_pages')
+    fields.setdefault('html_sources', [])
+    fields.setdefault('html_released', False)
+    return fields
@@ -0,0 +1,235 @@
+import hashlib
+import unicodedata
+
+import bikesanity.services.lxml_tree as lxml_tree
+from .toc_extractor import TocExtractor, TocTarget
+
+
+class IndexElement:
+    """An element the header might be read from, with where it is in the document and the text read from it"""
+
+    def __init__(self, tag, attrib, path, depth):
+        self.tag = tag
+        self.attrib = attrib
+        # The index of each element on the way down to it, counting elements only
+        self.path = path
+        self.depth = depth
+        self.string_kind = tag if tag in lxml_tree.STRING_CONTAINER_TAGS else None
+        self.text = []
+        self.following = None
+        self.label = None
+        # Links just after a locales label, and the pictures and captions inside a picture container
+        self.siblings = []
+        self.pics = []
+        self.captions = []
+
+    def get_text(self):
+        return ''.join(self.text)
+
+    def is_removed(self, before):
+        # Removing everything before an element removes its preceding siblings, and everything inside them
+        depth = len(before.path) - 1
+        return len(self.path) > depth and self.path[:depth] == before.path[:depth] and self.path[depth] < before.path[depth]
+
+
+class HeaderTarget(lxml_tree.SoupTarget):
+    """
+    Parser target reading the fields at the top of the journal index out of the parser's events, without
+    building a tree. Every element a field might be read from is noted as the parser reaches it, and the fields
+    are settled at the end, from those still there once everything before the title and subtitle is removed
+    just as the interpreters remove it from their documents.
+    """
+
+    LOCALES_LABELS = ['Locales:', 'Locale:']
+
+    def __init__(self):
+        super().__init__()
+        self.path = []
+        self.child_counts = [0]
+        # How many children each open element has, and the single string inside it while it has just the one
+        self.contents = []
+
+        self.title = None
+        self.subtitles = []
+        self.page_titles = []
+        self.author_links = []
+        self.locales_labels = []
+        self.pic_containers = []
+        self.contents_lists = []
+
+        # Elements whose text is being read, and those waiting on the string or elements that follow them
+        self.reading = []
+        self.awaiting_string = None
+        self.awaiting_siblings = []
+
+    def _subtitle_settled(self):
+        # Subtitles after the title can't be removed, so the first of them is the one
+        return self.title is not None and any(not subtitle.is_removed(self.title) for subtitle in self.subtitles)
+
+    def _read(self, tag, attrib):
+        elem = IndexElement(tag, dict(attrib), tuple(self.path), len(self.open_tags))
+        self.reading.append(elem)
+        return elem
+
+    def add_string(self, value, kind):
+        for elem in self.reading:
+            if kind == elem.string_kind: elem.text.append(value)
+        if self.contents:
+            self.contents[-1][0] += 1
+            self.contents[-1][1] = value
+        if self.awaiting_string is not None:
+            self.awaiting_string.following = value
+            self.awaiting_string = None
+
+    def start_element(self, tag, attrib):
+        self.awaiting_string = None
+        if self.contents: self.contents[-1][0] += 1
+        self.contents.append([0, None])
+        self.path.append(self.child_counts[-1])
+        self.child_counts[-1] += 1
+        self.child_counts.append(0)
+
+        depth = len(self.open_tags)
+        for label in list(self.awaiting_siblings):
+            if label.depth != depth: continue
+            if tag == 'a':
+                label.siblings.append(self._read(tag, attrib))
+            else:
+                self.awaiting_siblings.remove(label)
+
+        if tag == 'h1':
+            if self.title is None: self.title = self._read(tag, attrib)
+        elif tag == 'h3':
+            if not self._subtitle_settled(): self.subtitles.append(self._read(tag, attrib))
+        elif tag == 'title':
+            self.page_titles.append(self._read(tag, attrib))
+        elif tag == 'a':
+            if '&user' in attrib.get('href', ''): self.author_links.append(self._read(tag, attrib))
+        elif tag == 'b':
+            # Every <b> is read, as only its text says whether it labels the locales
+            self._read(tag, attrib)
+        elif tag == 'table':
+            if attrib.get('bgcolor') == 'gainsboro': self.pic_containers.append(self._read(tag, attrib))
+        elif tag == 'dl':
+            self.contents_lists.append(IndexElement(tag, dict(attrib), tuple(self.path), depth))
+
+        # Pictures and captions are noted in every picture container still open around them
+        if tag == 'img' and 'pics/' in attrib.get('src', ''):
+            pic = IndexElement(tag, dict(attrib), tuple(self.path), depth)
+            for container in self.pic_containers:
+                if container in self.reading: container.pics.append(pic)
+        elif tag == 'b':
+            for container in self.pic_containers:
+                if container in self.reading: container.captions.append(self.reading[-1])
+
+    def end_element(self, tag):
+        self.awaiting_string = None
+        count, string = self.contents.pop()
+        string = string if count == 1 else None
+        if self.contents: self.contents[-1][1] = string
+        self.path.pop()
+        self.child_counts.pop()
+
+        depth = len(self.open_tags)
+        self.awaiting_siblings = [label for label in self.awaiting_siblings if label.depth <= depth + 1]
+        for elem in [elem for elem in self.reading if elem.depth > depth]:
+            self.reading.remove(elem)
+            if elem.tag == 'b' and string in self.LOCALES_LABELS:
+                elem.label = string
+                self.locales_labels.append(elem)
+                self.awaiting_siblings.append(elem)
+            elif elem.tag == 'h3':
+                self.awaiting_string = elem
+
+    def result(self):
+        removals = [self.title] if self.title is not None else []
+
+        def first(elems):
+            return next((elem for elem in elems if not any(elem.is_removed(before) for before in removals)), None)
+
+        subtitle = first(self.subtitles)
+        if subtitle is not None: removals.append(subtitle)
+
+        page_title = first(self.page_titles)
+        page_title = page_title.get_text() if page_title is not None else ''
+        if 'by ' in page_title:
+            author = page_title[page_title.rfind('by ')+3:]
+        else:
+            author_link = first(self.author_links)
+            author = author_link.get_text() if author_link is not None else None
+
+        locales = []
+        for label in self.LOCALES_LABELS:
+            locales_label = first(elem for elem in self.locales_labels if elem.label == label)
+            if locales_label is None: continue
+            locales = [unicodedata.normalize("NFKD", link.get_text()) for link in locales_label.siblings]
+            break
+
+        cover = None
+        for container in self.pic_containers:
+            if first([container]) is None: continue
+            pic = first(container.pics)
+            if pic is None: continue
+            caption = first(container.captions)
+            cover = (pic.attrib['src'], caption.get_text() if caption is not None else '')
+            break
+
+        return {
+            'title': self.title.get_text() if self.title is not None else None,
+            'subtitle': subtitle.get_text() if subtitle is not None else None,
+            'distance_statement': subtitle.following.replace('\n', '').replace('\t', '').strip()
+                if subtitle is not None and subtitle.following is not None else None,
+            'author': author,
+            'locales': locales,
+            'cover': cover,
+            'has_contents': first(self.contents_lists) is not None,
+        }
+
+
+class IndexTarget:
+    """Parser target handing every event to a HeaderTarget and a TocTarget, so the index is read in one pass"""
+
+    def __init__(self):
+        self.targets = [HeaderTarget(), TocTarget()]
+
+    def start(self, tag, attrib):
+        for target in self.targets: target.start(tag, attrib)
+
+    def end(self, tag):
+        for target in self.targets: target.end(tag)
+
+    def data(self, data):
+        for target in self.targets: target.data(data)
+
+    def comment(self, text):
+        for target in self.targets: target.comment(text)
+
+    def pi(self, target_name, data):
+        for target in self.targets: target.pi(target_name, data)
+
+    def close(self):
+        return [target.close() for target in self.targets]
+
+
+class IndexExtractor:
+    """
+    Reads the header fields and table of contents of a journal index in a single pass of parser events,
+    building no tree. However big the index is, as it is for single-page journals with all their content on
+    it, reading it needs little more memory than the HTML itself. Fields read just as JournalContent.read_header
+    reads them from a parsed document, and entries as TocExtractor reads them.
+    """
+
+    # Bump when what is read from the index changes, so records saved alongside it are read again
+    VERSION = 2
+
+    def __init__(self):
+        self.toc_extractor = TocExtractor()
+
+    def make_key(self, html):
+        html = html if isinstance(html, bytes) else html.encode('utf8')
+        return hashlib.sha256('{0}:'.format(self.VERSION).encode() + html).hexdigest()
+
+    def extract(self, html):
+        """The header fields, and the ToC entries or None if there's no ToC list at all"""
+        header, items = lxml_tree.parse_events(html, IndexTarget)
+        return header, self.toc_extractor.read_entries(items)
@@ -1,6 +1,14 @@
+from bs4 import BeautifulSoup
+
 
 class InterpreterBase:
 
+    def parse_document(self, html):
+        return BeautifulSoup(html, features="lxml")
+
+    def element_text(self, elem):
+        return elem.get_text()
+
     def remove_everything_before(self, tag, including=False):
         for sibling in tag.find_previous_siblings():
             sibling.decompose()
@@ -17,7 +25,7 @@ class InterpreterBase:
     def remove_everything_before_body_level(self, tag, including=False):
         # Find the ancestor element that has body as a parent
         body_parent, body = self.find_body_ancestor(tag)
-        if body_parent:
+        if body_parent is not None:
             self.remove_everything_before(body_parent, including)
             return body
 
@@ -1,13 +1,14 @@
-from itertools import takewhile
 import unicodedata
 
-from bs4 import BeautifulSoup, NavigableString
+from bs4 import NavigableString
 
 import bikesanity.io_utils.log_handler as log_handler
 from bikesanity.services.retrievers import BaseRetriever
 from bikesanity.entities.content_blocks import Image
 from bikesanity.entities.journal import Journal
+from .index_extractor import IndexExtractor
 from .interpreter_base import InterpreterBase
+from .toc_extractor import TocExtractor
 
 
 class JournalContent(InterpreterBase):
@@ -15,8 +16,11 @@ class JournalContent(InterpreterBase):
     MAX_PAGE_DOWNLOAD_ATTEMPTS = 2
 
 
-    def __init__(self, retriever: BaseRetriever):
+    def __init__(self, retriever: BaseRetriever, use_index_record=True):
         self.retriever = retriever
+        self.use_index_record = use_index_record
+        self.toc_extractor = TocExtractor()
+        self.index_extractor = IndexExtractor()
 
     def find_title(self, doc):
         title = doc.find(name="h1")
@@ -54,77 +58,91 @@ class JournalContent(InterpreterBase):
                 locales.append(locale_name)
         return locales
 
-    def get_cover_pic(self, doc):
+    def find_cover_pic(self, doc):
         pic_containers = doc.findAll("table", {"bgcolor" : lambda l: l and l == 'gainsboro'})
         for pic_container in pic_containers:
             img_elem = pic_container.find('img', {'src': lambda l: l and 'pics/' in l})
             if img_elem:
-                img_path = img_elem.attrs['src']
-                cover_pic_data = self.retriever.retrieve_image_large(img_path)
-
                 caption_elem = pic_container.find('b')
                 caption = caption_elem.get_text() if caption_elem else ''
+                return img_elem.attrs['src'], caption
 
-                return Image(img_path, img_path, caption, cover_pic_data, cover_pic_data)
+    def get_cover_pic(self, cover):
+        if cover is None: return None
+        img_path, caption = cover
+        cover_pic_data = self.retriever.retrieve_image_large(img_path)
+        return Image(img_path, img_path, caption, cover_pic_data, cover_pic_data)
 
 
-    def get_contents_table(self, doc, journal: Journal):
-        content_list_elem = doc.find('dl')
+    def find_contents_list(self, doc):
+        return doc.find('dl')
 
-        # Handle empty documents with no ToC gracefully
-        if not content_list_elem:
-            log_handler.log.warn('Empty table of contents - continuing')
-            return
+    def read_contents_table(self, html):
+        # Read the ToC straight from the HTML
+        return self.toc_extractor.extract(html) or []
 
-        # Replace all the <dd> tags which are completely invalid, well done Neil!
-        self.replace_invalid_tag(content_list_elem, 'dd')
+    def read_header(self, html):
+        """The fields at the top of the index, read from the parsed document"""
+        doc = self.parse_document(html)
 
-        for child in takewhile(lambda x: x, content_list_elem.children):
-            # Ignore basic strings
-            if isinstance(child, NavigableString): continue
+        # Title
+        title = self.find_title(doc)
+        header = {'title': self.element_text(title)}
 
-            # Find whether the ToC entry has a link, or if it's just a title
-            toc_link = child if 'a' == child.name else child.find('a')
+        #  Subtitle
+        header['subtitle'] = self.get_subtitle(doc)
 
-            # Any element that doesn't have an id attribute can be skipped
-            if (not 'id' in child.attrs) and (not toc_link or not 'id' in toc_link.attrs): continue
+        # Distance statement
+        header['distance_statement'] = self.get_distance_statement(doc)
 
-            # Get the URL and ID
-            toc_link_url = self.retriever.base_url + toc_link.attrs['href'] if toc_link else None
-            toc_id = toc_link.attrs['id'] if toc_link else child.attrs['id']
+        # Author user
+        header['author'] = self.get_author_statement(doc)
 
-            # Get the title text, and any other text following it
-            toc_title = child.get_text()
-            toc_title = toc_title + child.next_sibling if isinstance(child.next_sibling, NavigableString) else toc_title
-            toc_title = toc_title.strip()
+        # Locales
+        header['locales'] = self.get_locales(doc)
 
-            journal.add_toc_entry(toc_id, toc_title, toc_link_url)
+        # Cover pic, retrieved once the document is done with
+        header['cover'] = self.find_cover_pic(doc)
 
-    def journal_from_html(self, journal_id, html) -> Journal:
-        journal = Journal(journal_id, html)
-        doc = BeautifulSoup(html, features="lxml")
+        header['has_contents'] = self.find_contents_list(doc) is not None
+        return header
 
-        # Title
-        title = self.find_title(doc)
-        journal.journal_title = title.get_text()
+    def extract_index(self, html):
+        """The header fields of the index, and its ToC entries or None if it has no ToC"""
+        header = self.read_header(html)
+        return header, self.read_contents_table(html) if header['has_contents'] else None
 
-        #  Subtitle
-        journal.journal_subtitle = self.get_subtitle(doc)
+    def read_index(self, html):
+        if not self.use_index_record: return self.extract_index(html)
 
-        # Distance statement
-        journal.distance_statement = self.get_distance_statement(doc)
+        # Read it all from the record saved when the same HTML was read before, if there is one, without parsing it
+        key = self.index_extractor.make_key(html)
+        record = self.retriever.retrieve_index_record(key)
+        if record is not None: return record
 
-        # Author user
-        journal.journal_author = self.get_author_statement(doc)
+        header, toc_entries = self.extract_index(html)
+        self.retriever.save_index_record(key, header, toc_entries)
+        return header, toc_entries
 
-        # Locales
-        journal.locales = self.get_locales(doc)
+    def journal_from_html(self, journal_id, html) -> Journal:
+        journal = Journal(journal_id, html)
+        header, toc_entries = self.read_index(html)
+
+        journal.journal_title = header['title']
+        journal.journal_subtitle = header['subtitle']
+        journal.distance_statement = header['distance_statement']
+        journal.journal_author = header['author']
+        journal.locales = header['locales']
+        journal.add_cover_image(self.get_cover_pic(header['cover']))
 
-        # Cover pic
-        journal.add_cover_image(self.get_cover_pic(doc))
+        # Handle empty documents with no ToC gracefully
+        if toc_entries is None:
+            log_handler.log.warn('Empty table of contents - continuing')
+            return journal
 
-        # Parse the ToC
-        self.get_contents_table(doc, journal)
+        for toc_id, toc_title, toc_href in toc_entries:
+            toc_link_url = self.retriever.base_url + toc_href if toc_href is not None else None
+            journal.add_toc_entry(toc_id, toc_title, toc_link_url)
 
         return journal
 
@@ -142,7 +160,9 @@ class JournalContent(InterpreterBase):
         # Determine the journal ID from the resolved URL
         if not journal_id: journal_id = self._get_journal_id_from_url(resolved_url)
 
-        return self.journal_from_html(journal_id, retrieved_html)
+        journal = self.journal_from_html(journal_id, retrieved_html)
+        journal.set_html_source(self.retriever.locate_index(), self.retriever.locate_directory())
+        return journal
 
     JS = [
         'leaflet.js',
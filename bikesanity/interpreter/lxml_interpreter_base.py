@@ -0,0 +1,30 @@
+import bikesanity.services.lxml_tree as lxml_tree
+from .interpreter_base import InterpreterBase
+
+
+class LxmlInterpreterBase(InterpreterBase):
+    """
+    Interpreter base working on lxml.html trees rather than BeautifulSoup. Documents are read through
+    lxml_tree so that every interpreter built on this produces exactly what its BeautifulSoup counterpart does.
+    """
+
+    def parse_document(self, html):
+        return lxml_tree.parse_document(html)
+
+    def element_text(self, elem):
+        return lxml_tree.get_text(elem)
+
+    def remove_everything_before(self, tag, including=False):
+        for sibling in list(tag.itersiblings(preceding=True)):
+            # Comments and the like are left where they are, as only elements are removed
+            if lxml_tree.is_element(sibling): lxml_tree.remove(sibling)
+        if including: lxml_tree.remove(tag)
+
+    def find_body_ancestor(self, tag):
+        parent = tag.getparent()
+        if parent is None:
+            return None, None
+        elif parent.tag == 'body':
+            return tag, parent
+        else:
+            return self.find_body_ancestor(parent)
@@ -0,0 +1,72 @@
+import unicodedata
+
+from lxml import etree
+
+import bikesanity.services.lxml_tree as lxml_tree
+from .journal_content import JournalContent
+from .lxml_interpreter_base import LxmlInterpreterBase
+
+
+class LxmlJournalContent(LxmlInterpreterBase, JournalContent):
+
+    AUTHOR_LINKS = etree.XPath("//a[contains(@href, '&user')]")
+    COVER_PIC_CONTAINERS = etree.XPath("//table[@bgcolor='gainsboro']")
+    COVER_PICS = etree.XPath(".//img[contains(@src, 'pics/')]")
+    LOCALES_LABELS = ['Locales:', 'Locale:']
+
+    def find_title(self, doc):
+        title = lxml_tree.find(doc, 'h1')
+        self.remove_everything_before(title)
+        return title
+
+    def get_subtitle(self, doc):
+        subtitle_elem = lxml_tree.find(doc, 'h3')
+        if subtitle_elem is not None:
+            self.remove_everything_before(subtitle_elem)
+            return lxml_tree.get_text(subtitle_elem)
+        return None
+
+    def get_distance_statement(self, doc):
+        subtitle_elem = lxml_tree.find(doc, 'h3')
+        if subtitle_elem is None: return None
+        following = lxml_tree.next_sibling(subtitle_elem)
+        if isinstance(following, str):
+            return following.replace('\n', '').replace('\t', '').strip()
+
+    def get_author_statement(self, doc):
+        title = lxml_tree.get_text(lxml_tree.find(doc, 'title'))
+        if 'by ' in title:
+            return title[title.rfind('by ')+3:]
+        else:
+            author_elem = next(iter(self.AUTHOR_LINKS(doc)), None)
+            return lxml_tree.get_text(author_elem) if author_elem is not None else None
+
+    def find_locales_label(self, doc):
+        for label in self.LOCALES_LABELS:
+            for bold_elem in doc.iterdescendants('b'):
+                if lxml_tree.string(bold_elem) == label: return bold_elem
+        return None
+
+    def get_locales(self, doc):
+        locales_elem = self.find_locales_label(doc)
+        locales = []
+        if locales_elem is not None:
+            for sibling in locales_elem.itersiblings():
+                if not lxml_tree.is_element(sibling): continue
+                if sibling.tag != 'a': break
+                locale_name = lxml_tree.get_text(sibling)
+                locale_name = unicodedata.normalize("NFKD", locale_name)
+                locales.append(locale_name)
+        return locales
+
+    def find_cover_pic(self, doc):
+        for pic_container in self.COVER_PIC_CONTAINERS(doc):
+            img_elem = next(iter(self.COVER_PICS(pic_container)), None)
+            if img_elem is not None:
+                caption_elem = lxml_tree.find(pic_container, 'b')
+                caption = lxml_tree.get_text(caption_elem) if caption_elem is not None else ''
+                return img_elem.attrib['src'], caption
+
+
+    def find_contents_list(self, doc):
+        return lxml_tree.find(doc, 'dl')
@@ -0,0 +1,170 @@
+from collections import deque
+
+from lxml import etree
+
+import bikesanity.io_utils.log_handler as log_handler
+import bikesanity.services.lxml_tree as lxml_tree
+from bikesanity.entities.content_blocks import Map
+from bikesanity.services.map_extractor import LxmlMapExtractor, LineExtractor
+from .lxml_interpreter_base import LxmlInterpreterBase
+from .page_interpreter import PageInterpreter
+
+
+class LxmlPageInterpreter(LxmlInterpreterBase, PageInterpreter):
+
+    MAP_DIVS = etree.XPath(".//div[starts-with(@id, 'div_map')]")
+    GPX_DOWNLOAD_LINKS = etree.XPath(".//a[starts-with(@title, 'Download GPX')]")
+
+    def get_title(self, title):
+        title_elem = lxml_tree.find(title, 'h1')
+        return lxml_tree.get_text(title_elem).strip() if title_elem is not None else ''
+
+    def get_distance_statement(self, title):
+        distance_elem = lxml_tree.find(title, 'h3')
+        if distance_elem is None or distance_elem.getparent().tag != 'body': return ''
+        distance_statement = lxml_tree.get_text(distance_elem).strip()
+        return distance_statement
+
+    def get_main_content(self, title):
+        return lxml_tree.find(title, 'div')
+
+    def is_picture_or_map(self, div_elem):
+        table_elem = lxml_tree.find(div_elem, 'table')
+        return table_elem is not None and 'pic' in table_elem.attrib.get('id', '')
+
+    def is_map(self, div_elem):
+        return len(self.MAP_DIVS(div_elem)) > 0
+
+    def get_block_text(self, child):
+        # Read any <br> as a newline
+        return lxml_tree.get_text(child, replace={'br': lambda br: '\n' + lxml_tree.get_text(br)}).strip()
+
+    def iterate_blocks(self, content, children=None):
+        # Reads blocks just as PageInterpreter does, where a buried <div> is matched against one whose <br>s are yet to be read.
+        # Children can be given as they are parsed, and each is only asked for once everything before it has been read
+        children = iter(children if children is not None else lxml_tree.children(content))
+        pending = deque()
+        block = 1
+        text_content = []
+        buried = None
+
+        while True:
+            if not pending:
+                child = next(children, None)
+                if child is None: break
+                pending.append((child, 1))
+            child, depth = pending.popleft()
+            is_tag = lxml_tree.is_element(child)
+
+            if is_tag and child.tag == 'center' and depth <= block:
+                pending.extendleft(reversed([(grandchild, depth + 1) for grandchild in lxml_tree.children(child)]))
+                continue
+
+            if is_tag and buried is not None and lxml_tree.equal(buried, child, breaks_replaced=True):
+                # Read on from here as if from the start of a new block
+                yield text_content, None
+                pending.appendleft((child, depth))
+                text_content, buried = [], None
+                block += 1
+                continue
+
+            if is_tag and buried is None:
+                if child.tag == 'div':
+                    yield text_content or None, child
+                    text_content = []
+                    block += 1
+                    continue
+                buried = lxml_tree.find(child, 'div')
+
+            text_content.append(self.get_block_text(child))
+
+        if text_content: yield text_content, None
+
+    def find_caption(self, pic_elem):
+        # The first <b> that isn't inside a <p>, as those are read as text
+        for caption_elem in pic_elem.iterdescendants('b'):
+            ancestor = caption_elem.getparent()
+            while ancestor is not pic_elem and ancestor.tag != 'p':
+                ancestor = ancestor.getparent()
+            if ancestor is pic_elem: return caption_elem
+        return None
+
+    def process_pic(self, div_elem):
+        pic_elem = lxml_tree.find(div_elem, 'center')
+        if pic_elem is None: return None
+
+        # Get image
+        img_elem = lxml_tree.find(pic_elem, 'img')
+        if img_elem is None: return None
+
+        img_path = img_elem.attrib['src']
+        img_path_fullsize = img_path.replace('/small/', '/large/')
+
+        # Get caption, reading broken P tags as text - NG is an amateur
+        caption_elem = self.find_caption(pic_elem)
+        caption = lxml_tree.get_text(
+            caption_elem.getparent(), replace={'p': lambda p: '\n' + lxml_tree.get_text(p)}
+        ) if caption_elem is not None else ''
+        caption = caption.strip()
+
+        # Download the pics - this hands back a future, resolved once the whole page is parsed
+        return self.retriever.submit_image(img_path, img_path_fullsize, caption)
+
+    def process_map(self, div_elem):
+        map_elem = lxml_tree.find(div_elem, 'center')
+        if map_elem is None: return None
+
+        # Retrieve the map resource path
+        gpx_download_elem = next(iter(self.GPX_DOWNLOAD_LINKS(div_elem)), None)
+        if gpx_download_elem is not None:
+            gpx_path = gpx_download_elem.attrib['href']
+            gpx_url = self.retriever.base_url + gpx_path
+            # Get the map ID from the path
+            map_id = self._get_map_id_from_path(gpx_path)
+        else:
+            gpx_url = None
+            map_id = None
+
+        # Get caption
+        caption_elem = lxml_tree.find(map_elem, 'b')
+        caption = lxml_tree.get_text(caption_elem) if caption_elem is not None else ''
+
+        # Now parse out the data directly from the HTML representation of the map
+        gpx_data, json_data = None, None
+        try:
+            map_extractor = LxmlMapExtractor(map_elem)
+            map_data = next(map_extractor.iterate_map_data(), None)
+            if map_data:
+                line_extractor = LineExtractor(map_data)
+                gpx_data, json_data = line_extractor.generate_map_binary_data()
+        except Exception as exc:
+            log_handler.log.exception('Error extracting map', exc)
+
+        log_handler.log.info('Successfully extracted map {0}'.format(map_id))
+        return Map(map_id, caption, gpx_data=gpx_data, json_data=json_data, url=gpx_url)
+
+    def clear_content(self, content):
+        lxml_tree.clear(content)
+
+    def process_titles(self, doc, page, include_metadata=True):
+        titles = list(doc.iter('big'))
+        for title in titles:
+            parent = lxml_tree.parent(title)
+            if parent is not None and parent.tag == 'body':
+                self.remove_everything_before(title)
+                self.process_title(parent, page, include_metadata=include_metadata)
+
+    def process_titles_single_page(self, doc, page):
+        titles = list(doc.iter('hr'))
+        for title in titles:
+            parent = lxml_tree.parent(title)
+            if parent is not None and parent.tag == 'td':
+                body = self.remove_everything_before_body_level(title, including=True)
+                self.process_title(body, page, include_metadata=False, include_title=True)
+
+    def find_additional_pages(self, doc):
+        for title in list(doc.iter('big')):
+            page_link_elem = lxml_tree.find(title, 'a')
+            if page_link_elem is not None and '>>>' in lxml_tree.get_text(title):
+                url = self.retriever.base_url + page_link_elem.attrib['href']
+                yield url, self.get_additional_part_id(url)
@@ -1,8 +1,8 @@
-from itertools import takewhile
-from bs4 import BeautifulSoup, NavigableString
+from collections import deque
+from bs4 import Tag
 
 import bikesanity.io_utils.log_handler as log_handler
-from bikesanity.entities.content_blocks import TextBlock, Heading, Image, Map
+from bikesanity.entities.content_blocks import TextBlock, Heading, Map
 from bikesanity.entities.page import Page
 from bikesanity.services.retrievers import BaseRetriever
 
@@ -11,6 +11,10 @@ from .interpreter_base import InterpreterBase
 
 
 class PageInterpreter(InterpreterBase):
+
+    # Bump whenever a change to interpretation would produce different pages, so cached pages are redone
+    INTERPRETER_VERSION = 1
+
     def __init__(self, retriever: BaseRetriever, progress_callback=None):
         self.retriever = retriever
         self.progress_callback = progress_callback
@@ -40,40 +44,55 @@ class PageInterpreter(InterpreterBase):
     def is_map(self, div_elem):
         return any(div_elem.findAll("div", {"id" : lambda l: l and l.startswith('div_map')}))
 
-    def remove_children(self, children):
-        for child in children:
-            if isinstance(child, NavigableString):
-                child.extract()
-            else:
-                child.decompose()
+    def get_block_text(self, child):
+        # Convert any <br> into newlines
+        if hasattr(child, 'find_all'):
+            for br in child.find_all('br'):
+                br.replace_with('\n' + br.text)
+
+        if hasattr(child, 'get_text'):
+            return child.get_text().strip()
+        return str(child).strip()
+
+    def iterate_blocks(self, content):
+        """
+        Walks the content's children once, yielding each run of text along with the <div> that ends it.
+        Top-level <center> wrappers are unwrapped a level for each block read. A <div> buried inside other
+        markup yields no block, and everything after it is read as text up to the next top-level <div>
+        that is equal to it.
+        """
+        pending = deque((child, 1) for child in content.children)
+        block = 1
+        text_content = []
+        buried = None
 
-    def get_text_before_next_element(self, content):
-        for dodgy_center in content.find_all(name="center", recursive=False):
-            dodgy_center.unwrap()
+        while pending:
+            child, depth = pending.popleft()
+            is_tag = isinstance(child, Tag)
 
-        div_elem = content.find(name='div')
+            if is_tag and child.name == 'center' and depth <= block:
+                pending.extendleft(reversed([(grandchild, depth + 1) for grandchild in child.children]))
+                continue
 
-        if div_elem == next(content.children, None):
-            return None, div_elem
+            if is_tag and buried is not None and child == buried:
+                # Read on from here as if from the start of a new block
+                yield text_content, None
+                pending.appendleft((child, depth))
+                text_content, buried = [], None
+                block += 1
+                continue
 
-        text_content = []
-        to_remove = []
-        for child in takewhile(lambda x: x != div_elem, content.children):
-            # Convert any <br> into newlines
-            if hasattr(child, 'find_all'):
-                for br in child.find_all('br'):
-                    br.replace_with('\n' + br.text)
-
-            if hasattr(child, 'get_text'):
-                text_content.append( child.get_text().strip())
-                to_remove.append(child)
-            else:
-                text_content.append(str(child).strip())
-                to_remove.append(child)
+            if is_tag and buried is None:
+                if child.name == 'div':
+                    yield text_content or None, child
+                    text_content = []
+                    block += 1
+                    continue
+                buried = child.find(name='div')
 
-        self.remove_children(to_remove)
-        return text_content, div_elem
+            text_content.append(self.get_block_text(child))
 
+        if text_content: yield text_content, None
 
     def process_pic(self, div_elem):
         pic_elem = div_elem.find(name='center')
@@ -86,10 +105,6 @@ class PageInterpreter(InterpreterBase):
         img_path = img_elem.attrs['src']
         img_path_fullsize = img_path.replace('/small/', '/large/')
 
-        # Download the pics
-        pic_small = self.retriever.retrieve_image_small(img_path)
-        pic_fullsize = self.retriever.retrieve_image_large(img_path_fullsize)
-
         # Replace broken P tags - NG is an amateur
         for p in pic_elem.find_all('p'):
             p.replace_with('\n' + p.text)
@@ -99,7 +114,8 @@ class PageInterpreter(InterpreterBase):
         caption = caption_elem.parent.text if caption_elem else ''
         caption = caption.strip()
 
-        return Image(img_path, img_path_fullsize, caption, pic_small, pic_fullsize)
+        # Download the pics - this hands back a future, resolved once the whole page is parsed
+        return self.retriever.submit_image(img_path, img_path_fullsize, caption)
 
     def _get_map_id_from_path(self, map_path):
         for token in map_path.split('?'):
@@ -141,12 +157,7 @@ class PageInterpreter(InterpreterBase):
         return Map(map_id, caption, gpx_data=gpx_data, json_data=json_data, url=gpx_url)
 
 
-    def process_next_bloc(self, main_content, page: Page):
-        text_content, elem = self.get_text_before_next_element(main_content)
-        if text_content: page.add_content(TextBlock(text_content))
-
-        if not elem: return False
-
+    def process_block(self, elem, page: Page):
         if self.is_picture_or_map(elem):
             if self.is_map(elem):
                 map_block = self.process_map(elem)
@@ -155,10 +166,6 @@ class PageInterpreter(InterpreterBase):
                 image_block = self.process_pic(elem)
                 if image_block: page.add_content(image_block)
 
-        self.remove_everything_before(elem, including=True)
-        self.update_progress()
-        return True
-
 
     def process_title(self, title, page: Page, include_metadata=True, include_title=False):
 
@@ -171,8 +178,21 @@ class PageInterpreter(InterpreterBase):
             if title_text: page.add_content(Heading(title_text))
 
         main_content = self.get_main_content(title)
-        while(main_content):
-            if not self.process_next_bloc(main_content, page): break
+        if main_content is None: return
+
+        self.process_blocks(self.iterate_blocks(main_content), page)
+
+        # Later titles on the page search the same tree, and should find this content already read
+        self.clear_content(main_content)
+
+    def process_blocks(self, blocks, page: Page):
+        for text_content, elem in blocks:
+            if text_content: page.add_content(TextBlock(text_content))
+            if elem is not None: self.process_block(elem, page)
+            self.update_progress()
+
+    def clear_content(self, content):
+        content.clear(decompose=True)
 
     def process_titles(self, doc, page: Page, include_metadata=True):
         titles = doc.find_all(name="big")
@@ -190,19 +210,27 @@ class PageInterpreter(InterpreterBase):
                 body = self.remove_everything_before_body_level(title, including=True)
                 self.process_title(body, page, include_metadata=False, include_title=True)
 
+    def process_page_document(self, page: Page, single=False):
+        # Reuse the tree parsed when the page was retrieved, if there is one
+        doc = page.take_parsed_document()
+        if doc is None: doc = self.parse_document(page.original_html)
+        titles_processor = self.process_titles_single_page if single else self.process_titles
+        titles_processor(doc, page)
+
     def parse_page(self, page: Page, single=False):
         log_handler.log.info('Processing page {0} for journal {1}'.format(page.original_id, page.journal_id))
 
-        doc = BeautifulSoup(page.original_html, features="lxml")
-        titles_processor = self.process_titles_single_page if single else self.process_titles
-        titles_processor(doc, page)
+        self.process_page_document(page, single=single)
 
         # If additional pages exist, process these as well
         for additional_html in page.additional_html_pages:
             log_handler.log.info('Processing additional page for journal {0}'.format(page.journal_id))
-            doc = BeautifulSoup(additional_html, features="lxml")
+            doc = self.parse_document(additional_html)
             self.process_titles(doc, page, include_metadata=False)
 
+        # Wait for any images still downloading
+        page.resolve_pending_contents()
+
         return page
 
     def get_additional_part_id(self, url):
@@ -210,9 +238,7 @@ class PageInterpreter(InterpreterBase):
             if term.startswith('part='):
                 return term[5:]
 
-    def find_additional_pages(self, page_html):
-        doc = BeautifulSoup(page_html, features="lxml")
-
+    def find_additional_pages(self, doc):
         titles = doc.find_all(name='big')
         for title in titles:
             page_link_elem = title.find(name='a')
@@ -230,9 +256,14 @@ class PageInterpreter(InterpreterBase):
         self.update_progress()
 
         page = Page(journal_id, original_id, page_html)
+        page.add_html_source(self.retriever.locate_page(original_id), self.retriever.locate_directory())
+
+        # Parse the page just the once, keeping the tree for interpreting the content later
+        doc = self.parse_document(page_html)
+        page.set_parsed_document(doc)
 
         # Download any additional other pages
-        for url, part_id in self.find_additional_pages(page_html):
+        for url, part_id in self.find_additional_pages(doc):
             log_handler.log.info('Additional page for {0} detected: {1}'.format(original_id, url), extra={'journal_id': journal_id})
             self.update_progress()
 
@@ -241,6 +272,7 @@ class PageInterpreter(InterpreterBase):
 
             additional_html = self.retriever.retrieve_page(url, additional_filename, error_message="Error code in retrieving additional page html: {0}")
             page.add_additional_html(additional_html)
+            page.add_html_source(self.retriever.locate_page(additional_filename), self.retriever.locate_directory())
             self.update_progress()
 
         return page
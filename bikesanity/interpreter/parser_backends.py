@@ -0,0 +1,38 @@
+from enum import Enum
+
+from bikesanity.services.retrievers import BaseRetriever
+from .journal_content import JournalContent
+from .lxml_journal_content import LxmlJournalContent
+from .lxml_page_interpreter import LxmlPageInterpreter
+from .page_interpreter import PageInterpreter
+from .streaming_journal_content import StreamingJournalContent
+from .streaming_page_interpreter import StreamingPageInterpreter
+
+
+class ParserBackend(Enum):
+    BS4 = 'bs4'
+    LXML = 'lxml'
+    # lxml, reading the index and single-page journals as they are parsed, without building a tree
+    LXML_STREAMING = 'lxml-streaming'
+
+
+JOURNAL_INTERPRETERS = {
+    ParserBackend.BS4: JournalContent,
+    ParserBackend.LXML: LxmlJournalContent,
+    ParserBackend.LXML_STREAMING: StreamingJournalContent,
+}
+
+PAGE_INTERPRETERS = {
+    ParserBackend.BS4: PageInterpreter,
+    ParserBackend.LXML: LxmlPageInterpreter,
+    ParserBackend.LXML_STREAMING: StreamingPageInterpreter,
+}
+
+
+def create_journal_interpreter(retriever: BaseRetriever, backend=ParserBackend.BS4, use_index_record=True) -> JournalContent:
+    # Backends can be given by name, as they are on the command line
+    return JOURNAL_INTERPRETERS[ParserBackend(backend)](retriever, use_index_record=use_index_record)
+
+
+def create_page_interpreter(retriever: BaseRetriever, backend=ParserBackend.BS4, progress_callback=None) -> PageInterpreter:
+    return PAGE_INTERPRETERS[ParserBackend(backend)](retriever, progress_callback=progress_callback)
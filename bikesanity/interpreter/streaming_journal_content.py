@@ -0,0 +1,13 @@
+from .lxml_journal_content import LxmlJournalContent
+
+
+class StreamingJournalContent(LxmlJournalContent):
+    """
+    Reads the journal index without ever parsing it into a tree. The header fields and ToC are picked out of
+    a single pass of parser events, so a single-page journal, whose index holds all its content, is only ever
+    read as StreamingPageInterpreter reads it, a block at a time.
+    """
+
+    def extract_index(self, html):
+        header, toc_entries = self.index_extractor.extract(html)
+        return header, (toc_entries or []) if header['has_contents'] else None
@@ -0,0 +1,48 @@
+import bikesanity.services.lxml_tree as lxml_tree
+from bikesanity.entities.content_blocks import Heading
+from bikesanity.entities.page import Page
+from bikesanity.services.streaming_document import StreamingDocument
+from .lxml_page_interpreter import LxmlPageInterpreter
+
+
+class StreamingPageInterpreter(LxmlPageInterpreter):
+    """
+    Interprets single-page journals while their page is still being parsed. Each block of content is read
+    as soon as it is complete and removed once it has been, so however long the journal, the tree only ever
+    holds about a block of it. Pages of multi-page journals are short, and are read as LxmlPageInterpreter does.
+    """
+
+    TRACKED_TAGS = ('hr', 'h1', 'div')
+
+    def process_page_document(self, page: Page, single=False):
+        # A tree parsed when the page was retrieved is already all in memory
+        if not single or page.parsed_document is not None:
+            return super().process_page_document(page, single=single)
+
+        stream = StreamingDocument(page.original_html, tracked_tags=self.TRACKED_TAGS)
+        self.process_titles_streaming(stream, page)
+
+    def process_titles_streaming(self, stream: StreamingDocument, page: Page):
+        # Sections are found just as process_titles_single_page finds them, reading only as far as each needs
+        for title in stream.iterate_started('hr'):
+            parent = title.getparent()
+            if parent is None or parent.tag != 'td': continue
+
+            body_parent, body = self.find_body_ancestor(title)
+            if body_parent is not None:
+                stream.read_until(lambda: stream.is_closed(body_parent))
+                self.remove_everything_before(body_parent, including=True)
+            self.process_title_streaming(stream, body, page)
+
+    def process_title_streaming(self, stream: StreamingDocument, title, page: Page):
+        title_elem = stream.find(title, 'h1')
+        if title_elem is not None:
+            stream.read_until(lambda: stream.is_closed(title_elem))
+            title_text = lxml_tree.get_text(title_elem).strip()
+            if title_text: page.add_content(Heading(title_text))
+
+        main_content = stream.find(title, 'div')
+        if main_content is None: return
+
+        self.process_blocks(self.iterate_blocks(main_content, stream.iterate_children(main_content)), page)
+        self.clear_content(main_content)
@@ -0,0 +1,101 @@
+import bikesanity.services.lxml_tree as lxml_tree
+
+
+class TocItem:
+    """An element directly inside the ToC list, once the <dd> tags around it are read through"""
+
+    def __init__(self, tag, attrib):
+        self.tag = tag
+        self.attrib = attrib
+        # The first link inside it, and the kind of string that makes up its text
+        self.link = None
+        self.string_kind = tag if tag in lxml_tree.STRING_CONTAINER_TAGS else None
+        self.text = []
+        self.following = None
+
+
+class TocTarget(lxml_tree.SoupTarget):
+    """
+    Parser target picking the elements of the first <dl> out of the parser's events, without building a tree.
+    Strings are split, collapsed and classed as BeautifulSoup does, so each element reads as it would there.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.items = []
+
+        self.list_depth = None
+        self.list_ended = False
+        # The element being read, how deep inside it the parser is, and the last one until what follows it is known
+        self.item = None
+        self.item_depth = 0
+        self.preceding = None
+
+    def add_string(self, value, kind):
+        if self.list_depth is None or self.list_ended: return
+        if self.item is not None:
+            if kind == self.item.string_kind: self.item.text.append(value)
+        elif self.preceding is not None:
+            self.preceding.following = value
+            self.preceding = None
+
+    def start_element(self, tag, attrib):
+        if self.list_depth is None:
+            if tag == 'dl': self.list_depth = len(self.open_tags)
+            return
+        if self.list_ended: return
+
+        if self.item is not None:
+            self.item_depth += 1
+            if tag == 'a' and self.item.link is None: self.item.link = dict(attrib)
+        elif tag != 'dd':
+            # The <dd> tags are read through, so anything else here is an element of the list
+            self.item = TocItem(tag, dict(attrib))
+            self.item_depth = 1
+            self.items.append(self.item)
+            self.preceding = None
+
+    def end_element(self, tag):
+        if self.list_depth is None or self.list_ended: return
+        if len(self.open_tags) < self.list_depth:
+            self.list_ended = True
+        elif self.item is not None:
+            self.item_depth -= 1
+            if not self.item_depth: self.item, self.preceding = None, self.item
+
+    def result(self):
+        return self.items if self.list_depth is not None else None
+
+
+class TocExtractor:
+    """
+    Reads the table of contents straight out of the journal index, scanning the first <dl> block for the id,
+    link and title of each entry as the parser reaches it. Nothing is built or changed along the way, so this
+    stays quick for journals with thousands of entries, and entries nested deeper than a tree can hold are
+    still read. Each entry is read just as the interpreters read it from their own documents.
+    """
+
+    def extract(self, html):
+        """The (id, title, href) of each entry in order, or None if there's no ToC list at all"""
+        return self.read_entries(lxml_tree.parse_events(html, TocTarget))
+
+    def read_entries(self, items):
+        """The entries of the ToC list read by a TocTarget, or None if there was no list"""
+        if items is None: return None
+
+        entries = []
+        for item in items:
+            # Find whether the ToC entry has a link, or if it's just a title
+            toc_link = item.attrib if 'a' == item.tag else item.link
+
+            # Any element that doesn't have an id attribute can be skipped
+            if (not 'id' in item.attrib) and (toc_link is None or not 'id' in toc_link): continue
+
+            toc_href = toc_link['href'] if toc_link is not None else None
+            toc_id = toc_link['id'] if toc_link is not None else item.attrib['id']
+
+            # Get the title text, and any other text following it
+            toc_title = ''.join(item.text)
+            toc_title = toc_title + item.following if item.following is not None else toc_title
+            entries.append((toc_id, toc_title.strip(), toc_href))
+        return entries
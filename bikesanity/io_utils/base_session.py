@@ -18,10 +18,19 @@ class BaseSession(ABC):
     TOTAL_RETRIES = 2
     REQUEST_TIMEOUT = 20
 
+    # Number of per-host connection pools to cache, and the connections kept open within each
+    POOL_CONNECTIONS = 10
+    POOL_MAXSIZE = 10
+
+    RETRY_STATUSES = [429, 500, 502, 503, 504, 403]
+    RESPECT_RETRY_AFTER = True
+
     SERIALIZED_RESOURCES = 'serialized.pickle'
 
-    def __init__(self):
+    def __init__(self, pool_maxsize=None, response_cache=None):
         self.session = None
+        self.pool_maxsize = pool_maxsize or self.POOL_MAXSIZE
+        self.response_cache = response_cache
         self.user_agent = self.generate_random_user_agent()
         self.headers = unserialize_resource_stream([self.SERIALIZED_RESOURCES])['HEADERS']
 
@@ -33,13 +42,18 @@ class BaseSession(ABC):
 
         retry_strategy = CustomRetry(
             total=self.TOTAL_RETRIES,
-            status_forcelist=[429, 500, 502, 503, 504, 403],
+            status_forcelist=self.RETRY_STATUSES,
             method_whitelist=["HEAD", "GET", "OPTIONS"],
+            respect_retry_after_header=self.RESPECT_RETRY_AFTER,
             backoff_factor=self.BACKOFF_FACTOR
         )
 
         # Mount it for both http and https usage
-        adapter = TimeoutHTTPAdapter(timeout=self.REQUEST_TIMEOUT)
+        adapter = TimeoutHTTPAdapter(
+            timeout=self.REQUEST_TIMEOUT,
+            pool_connections=self.POOL_CONNECTIONS,
+            pool_maxsize=self.pool_maxsize
+        )
         adapter.max_retries = retry_strategy
         session.mount("https://", adapter)
         session.mount("http://", adapter)
@@ -64,6 +78,31 @@ class BaseSession(ABC):
         log.warn('Setting cookies: {0}'.format(browser_cookie))
         self.session.cookies.set('browser', browser_cookie, domain='.crazyguyonabike.com')
 
+    def get_through_cache(self, url, get):
+        # Without a cache, just go straight to the network
+        if not self.response_cache:
+            return get(url, self.headers)
+
+        # Serve fresh entries from disk without making any request at all
+        entry = self.response_cache.lookup(url)
+        if entry and self.response_cache.is_fresh(entry):
+            log.info('Serving {0} from cache'.format(url))
+            return self.response_cache.build_response(entry)
+
+        # Otherwise ask the server whether the cached copy is still current
+        headers = dict(self.headers)
+        if entry: headers.update(self.response_cache.conditional_headers(entry))
+        response = get(url, headers)
+
+        if entry and response.status_code == 304:
+            log.info('Revalidated {0} from cache'.format(url))
+            response.close()
+            return self.response_cache.build_response(self.response_cache.revalidated(entry, response))
+        if response.status_code == 200 and self.response_cache.is_storable(response):
+            entry = self.response_cache.store(url, response)
+            return self.response_cache.build_response(entry)
+        return response
+
     @abstractmethod
     def make_request(self, url):
         self.headers["User-Agent"] = self.user_agent
@@ -21,8 +21,8 @@ class CustomRetry(Retry):
     def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None, ):
         log_handler.log.warn('Retrying through custom retrier')
         if response and response.status == 429:
-            log_handler.log.error('Received 429 - off we go')
-            raise RuntimeError('Have been rate limited')
+            # Back off and try again, honouring any Retry-After the server sent
+            log_handler.log.warn('Received 429 - backing off')
         if response and response.status == 403:
             log_handler.log.error('Received 403 - off we go')
             raise RuntimeError('Got an unauthorized')
@@ -0,0 +1,64 @@
+import json
+import os
+import threading
+
+from bikesanity.io_utils import log_handler as log_handler
+
+
+class DownloadManifest:
+    """
+    Append-only record of everything in a journal download that has been completely written, so that an
+    interrupted download can be restarted and skip exactly the work already done.
+    """
+
+    MANIFEST_FILENAME = 'manifest.jsonl'
+
+    PAGE = 'page'
+    PART = 'part'
+    IMAGE = 'image'
+    MAP = 'map'
+    RESOURCES = 'resources'
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = set()
+        # Re-entrant, as flush() is called from the SIGINT handler which may interrupt a record()
+        self._lock = threading.RLock()
+
+        if os.path.isfile(path):
+            self._load()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.handle = open(path, 'a', encoding='utf8')
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf8') as handle:
+            for line in handle:
+                try:
+                    kind, key = json.loads(line)
+                    self.completed.add((kind, key))
+                except ValueError:
+                    # A line cut short by an interruption just means that item wasn't finished
+                    continue
+        log_handler.log.info('Resuming download with {0} items already complete'.format(len(self.completed)))
+
+    def is_complete(self, kind, key):
+        return (kind, key) in self.completed
+
+    def record(self, kind, key):
+        with self._lock:
+            if (kind, key) in self.completed or not self.handle: return
+            self.completed.add((kind, key))
+            self.handle.write(json.dumps([kind, key]) + '\n')
+
+    def flush(self):
+        with self._lock:
+            if not self.handle: return
+            self.handle.flush()
+            os.fsync(self.handle.fileno())
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.handle.close()
+            self.handle = None
@@ -2,21 +2,78 @@ import hashlib
 import shutil
 import os
 import mimetypes
+import tempfile
+import uuid
+
+from .file_reference import FileReference
+
+
+def _read_umask():
+    # The umask can only be read by setting it, so this is done once, before any other thread writes files
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Files are written through private temporary files, then given the mode they'd have had if created directly
+FILE_MODE = 0o666 & ~_read_umask()
 
 
 class FileHandler:
 
     HASH_BUFFER_SIZE = 6553600
+    STREAM_CHUNK_SIZE = 65536
 
     def __init__(self):
         pass
 
     def output_binary_to_file(self, filename, data):
         os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        # Content already on disk is linked or copied file to file, or left alone if it is already in place
+        if isinstance(data, FileReference):
+            if not data.is_file(filename): self.link_or_copy_file(data.path, filename)
+            return
+
         data.seek(0)
         with open(filename, 'wb') as handle:
             shutil.copyfileobj(data, handle)
 
+    def output_stream_to_file(self, filename, stream) -> FileReference:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        # Write in chunks to a temporary file alongside, so the final file only ever appears complete
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(filename), prefix='.', suffix='.part')
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                shutil.copyfileobj(stream, temp_file, self.STREAM_CHUNK_SIZE)
+            os.chmod(temp_path, FILE_MODE)
+            os.replace(temp_path, filename)
+        except Exception:
+            if os.path.exists(temp_path): os.remove(temp_path)
+            raise
+        return FileReference(filename)
+
+    def link_or_copy_file(self, source, filename):
+        # Linked or copied to a temporary name alongside, then moved into place, so that workers doing the same at
+        # once never remove each other's file or leave one half copied
+        temp_path = os.path.join(
+            os.path.dirname(filename), '.{0}.{1}.part'.format(os.path.basename(filename), uuid.uuid4().hex)
+        )
+        try:
+            # A hard link shares the content without writing it again
+            os.link(source, temp_path)
+        except OSError:
+            with open(source, 'rb') as stream:
+                self.output_stream_to_file(filename, stream)
+            return
+
+        try:
+            os.replace(temp_path, filename)
+        finally:
+            # Replacing a file with another link to itself leaves both names in place
+            if os.path.lexists(temp_path): os.remove(temp_path)
+
     def output_bytes_to_file(self, filename, bytes):
         os.makedirs(os.path.dirname(filename), exist_ok=True)
         with open(filename, 'wb') as handle:
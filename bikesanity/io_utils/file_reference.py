@@ -0,0 +1,24 @@
+import os
+
+
+class FileReference:
+    """
+    Stands in for a binary buffer whose content has already been written to a file, so that large
+    resources like full-size images never need to be held in memory. Closing releases nothing, as
+    the file is only opened while it is being read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def open(self):
+        return open(self.path, 'rb')
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def is_file(self, path):
+        return os.path.abspath(path) == os.path.abspath(self.path)
+
+    def close(self):
+        pass
@@ -0,0 +1,166 @@
+import io
+import os
+import pickle
+import sqlite3
+from collections import OrderedDict
+from contextlib import closing
+
+from bikesanity.entities.page import Page
+from bikesanity.io_utils import log_handler as log_handler
+
+
+class DetailsPickler(pickle.Pickler):
+    """Pickles a journal with a placeholder wherever a page would be, leaving the journal itself untouched"""
+
+    PAGE = 'page'
+
+    def persistent_id(self, obj):
+        return self.PAGE if isinstance(obj, Page) else None
+
+
+class DetailsUnpickler(pickle.Unpickler):
+
+    def persistent_load(self, pid):
+        # Pages are read in separately, so they're left empty here
+        return None
+
+
+class StoredPages:
+    """
+    The pages of a journal store, read in as they're asked for. Only the few most recently used are kept in
+    memory, so going through a journal page by page holds no more than that at any time.
+    """
+
+    RESIDENT_PAGES = 4
+
+    def __init__(self, journal_store, resident_pages=RESIDENT_PAGES):
+        self.journal_store = journal_store
+        self.resident_pages = resident_pages
+        self.pages = OrderedDict()
+
+    def get(self, position):
+        if position in self.pages:
+            self.pages.move_to_end(position)
+            return self.pages[position]
+
+        page = self.journal_store.load_page(position)
+        self.pages[position] = page
+        if len(self.pages) > self.resident_pages: self.pages.popitem(last=False)
+        return page
+
+
+class JournalStore:
+    """
+    A processed journal held in a single SQLite file, with the journal itself - its details and ToC, but none
+    of its pages - in one row, and each page in a row of its own. The details can be read without touching
+    any page, and pages can be read one at a time, in ToC order, rather than all at once.
+    """
+
+    FILENAME = 'journal.sqlite'
+
+    # Bump when the tables, or how entities are stored in them, change
+    FORMAT_VERSION = 1
+
+    SCHEMA = '''
+        CREATE TABLE journal (version INTEGER NOT NULL, data BLOB NOT NULL);
+        CREATE TABLE pages (position INTEGER PRIMARY KEY, original_id TEXT, data BLOB NOT NULL);
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        # The directory of the journal the HTML is read back from, once found from the stored details
+        self.html_root = None
+        self.details_loaded = False
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def _detached_details(self, journal):
+        buffer = io.BytesIO()
+        DetailsPickler(buffer, pickle.HIGHEST_PROTOCOL).dump(journal)
+        return buffer.getvalue()
+
+    def _page_rows(self, journal):
+        for position, toc in enumerate(journal.toc):
+            if toc.has_page(): yield position, toc.page.original_id, pickle.dumps(toc.page, pickle.HIGHEST_PROTOCOL)
+
+    def save_journal(self, journal):
+        journal.locate_html_directory(os.path.dirname(self.path))
+
+        # Write a new file alongside and swap it in, so the journal is never seen half written
+        temp_path = self.path + '.part'
+        if os.path.exists(temp_path): os.remove(temp_path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        try:
+            with closing(sqlite3.connect(temp_path)) as connection:
+                with connection:
+                    connection.executescript(self.SCHEMA)
+                    connection.execute('INSERT INTO journal VALUES (?, ?)', (self.FORMAT_VERSION, self._detached_details(journal)))
+                    connection.executemany('INSERT INTO pages VALUES (?, ?, ?)', self._page_rows(journal))
+            os.replace(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path): os.remove(temp_path)
+            raise
+
+    def _connect(self):
+        if not self.exists(): raise FileNotFoundError(self.path)
+        return closing(sqlite3.connect(self.path))
+
+    def load_details(self):
+        """The journal, with every ToC entry's page left empty"""
+        with self._connect() as connection:
+            row = connection.execute('SELECT version, data FROM journal').fetchone()
+        if not row: raise ValueError('No journal in {0}'.format(self.path))
+
+        version, data = row
+        if version != self.FORMAT_VERSION:
+            raise ValueError('Journal store is version {0}, expected {1} - process it again'.format(version, self.FORMAT_VERSION))
+        journal = DetailsUnpickler(io.BytesIO(data)).load()
+
+        # The HTML is found relative to wherever the store is now
+        self.html_root = journal.resolve_html_root(os.path.dirname(self.path))
+        self.details_loaded = True
+        return journal
+
+    def _with_html_root(self, page):
+        # Pages read on their own still find their HTML through the journal's details
+        if page is None: return None
+        if not self.details_loaded: self.load_details()
+        page.html_root = self.html_root
+        return page
+
+    def page_positions(self):
+        with self._connect() as connection:
+            return [row[0] for row in connection.execute('SELECT position FROM pages ORDER BY position')]
+
+    def load_page(self, position):
+        """The page of the ToC entry at this position, or None if it has none"""
+        with self._connect() as connection:
+            row = connection.execute('SELECT data FROM pages WHERE position = ?', (position,)).fetchone()
+        return self._with_html_root(pickle.loads(row[0])) if row else None
+
+    def iterate_pages(self):
+        """Each (position in the ToC, page) in order, reading one page at a time"""
+        with self._connect() as connection:
+            for position, data in connection.execute('SELECT position, data FROM pages ORDER BY position'):
+                yield position, self._with_html_root(pickle.loads(data))
+
+    def load_journal(self, lazy=False):
+        """
+        The whole journal, or None if it can't be read. Pages are all read in at once, or if lazy, each is read
+        from the store whenever it's used, with only a few kept in memory.
+        """
+        try:
+            journal = self.load_details()
+            if lazy:
+                stored_pages = StoredPages(self)
+                for position in self.page_positions():
+                    journal.toc[position].set_stored_page(stored_pages, position)
+            else:
+                for position, page in self.iterate_pages():
+                    journal.toc[position].set_page(page)
+            return journal
+        except (OSError, ValueError, IndexError, sqlite3.Error, pickle.UnpicklingError, AttributeError, EOFError) as exc:
+            log_handler.log.error('Unable to load journal from {0}: {1}'.format(self.path, exc))
+            return None
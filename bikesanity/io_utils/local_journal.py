@@ -1,8 +1,13 @@
-import io
+import json
 import os
 import prettierfier
 
+from bikesanity.io_utils import log_handler
 from bikesanity.entities.content_blocks import Image, Map
+from .download_manifest import DownloadManifest
+from .file_reference import FileReference
+from .journal_store import JournalStore
+from .resource_store import ResourceStore
 from .resources import get_resource_stream
 from .serializer import Serializer
 from .file_handler import FileHandler
@@ -10,11 +15,18 @@ from .file_handler import FileHandler
 
 class LocalJournalHandler(FileHandler):
 
-    def __init__(self, base_path, journal_id):
+    # What was read from the index, saved in place of just the ToC that older versions saved here
+    INDEX_RECORD_FILENAME = 'index.toc.json'
+    LEGACY_JOURNAL_FILENAME = 'journal.pickle'
+    # Resources shared between every journal alongside
+    SHARED_RESOURCES_DIRECTORY = '.resources'
+
+    def __init__(self, base_path, journal_id, manifest=None):
         super().__init__()
         self.base_path = base_path
         self.journal_id = journal_id
         self.serializer = Serializer()
+        self.manifest = manifest
 
     def get_path(self, filename):
         return os.path.join(self.base_path, self.journal_id, filename)
@@ -23,7 +35,8 @@ class LocalJournalHandler(FileHandler):
         return self.get_path('')
 
     def get_resource_path(self, filename):
-        return os.path.join(self.base_path, self.journal_id, 'resources', filename)
+        # Resources are named by keys separated with forward slashes, as they are in links
+        return os.path.join(self.base_path, self.journal_id, 'resources', *filename.split('/'))
 
     def get_html_path(self, filename):
         return os.path.join(self.base_path, self.journal_id, 'html', filename)
@@ -39,31 +52,93 @@ class LocalJournalHandler(FileHandler):
             os.path.join(self.base_path, self.journal_id, 'index.html')
         )
 
-    def get_html_page_id(self, page_id, additional_path=None):
+    def get_html_page_path(self, page_id, additional_path=None):
         terms = [self.base_path, self.journal_id]
         if additional_path: terms.append(additional_path)
         terms.append(page_id + '.html')
-        return self.get_file_content(os.path.join(*terms))
+        return os.path.join(*terms)
+
+    def get_html_page_id(self, page_id, additional_path=None):
+        return self.get_file_content(self.get_html_page_path(page_id, additional_path))
+
+    def find_html_page_id(self, page_id, additional_path=None):
+        # Where the page's HTML is saved, if it is
+        path = self.get_html_page_path(page_id, additional_path)
+        return path if self.file_exists(path) else None
+
+    def get_page_sources(self, page_id, additional_path=None):
+        # The page's HTML along with any additional parts saved alongside it, in a stable order
+        terms = [self.base_path, self.journal_id]
+        if additional_path: terms.append(additional_path)
+        directory = os.path.join(*terms)
+
+        filename = page_id + '.html'
+        if not self.file_exists(os.path.join(directory, filename)): return None
+        filenames = [filename] + sorted(
+            name for name in os.listdir(directory) if name.startswith(page_id + '_') and name.endswith('.html')
+        )
+        return [(name, self.get_binary_content(os.path.join(directory, name))) for name in filenames]
+
+    def _index_record_path(self, additional_path=None):
+        # Kept next to the index it was read from
+        terms = [self.base_path, self.journal_id]
+        if additional_path: terms.append(additional_path)
+        terms.append(self.INDEX_RECORD_FILENAME)
+        return os.path.join(*terms)
+
+    def get_index_record(self, key, additional_path=None):
+        try:
+            saved = json.loads(self.get_file_content(self._index_record_path(additional_path)))
+        except (RuntimeError, OSError, ValueError):
+            return None
+        # Saved from a different index, or by a different version of the extractor
+        if not isinstance(saved, dict) or saved.get('key') != key: return None
+        entries = saved['entries']
+        return saved['header'], [tuple(entry) for entry in entries] if entries is not None else None
+
+    def save_index_record(self, key, header, entries, additional_path=None):
+        try:
+            record = {'key': key, 'header': header, 'entries': entries}
+            self.output_text_to_file(self._index_record_path(additional_path), json.dumps(record))
+        except OSError as exc:
+            log_handler.log.warning('Unable to save what was read from the index alongside it: {0}'.format(exc))
 
     def get_image_binary(self, path, additional_path=None):
         terms = [self.base_path, self.journal_id]
         if additional_path: terms.append(additional_path)
         terms.append(path)
-        return io.BytesIO(self.get_binary_content(os.path.join(*terms)))
+
+        # Refer to the image where it is rather than reading it all into memory
+        filename = os.path.join(*terms)
+        if not self.file_exists(filename):
+            raise RuntimeError('File did not exist: {0}'.format(filename))
+        return FileReference(filename)
 
     def _resource_key(self, id, extension, suffix=''):
         return '{0}{1}.{2}'.format(id, suffix, extension)
 
+    def is_saved(self, kind, key):
+        return self.manifest is not None and self.manifest.is_complete(kind, key)
+
+    def _record_saved(self, kind, key):
+        if self.manifest: self.manifest.record(kind, key)
+
     def save_html_original(self, filename, html):
         self.output_bytes_to_file(self.get_path(filename), html)
+        self._record_saved(DownloadManifest.PART, filename)
 
     def save_image_original(self, image: Image):
-        if image.image_fullsize:
+        if image.image_fullsize and not self.is_saved(DownloadManifest.IMAGE, image.original_path_fullsize):
             self.output_binary_to_file(self.get_path(image.original_path_fullsize), image.image_fullsize)
-        if image.image_small:
+            self._record_saved(DownloadManifest.IMAGE, image.original_path_fullsize)
+        if image.image_small and not self.is_saved(DownloadManifest.IMAGE, image.original_path_small):
             self.output_binary_to_file(self.get_path(image.original_path_small), image.image_small)
+            self._record_saved(DownloadManifest.IMAGE, image.original_path_small)
 
     def save_map_original(self, map: Map):
+        # Maps saved by an earlier, interrupted run already have a file under another generated ID
+        if map.original_id and self.is_saved(DownloadManifest.MAP, map.original_id): return
+
         if map.gpx_data:
             self.output_binary_to_file(os.path.join(
                 self.base_path, self.journal_id, 'maps', self._resource_key(map.map_id, 'gpx')
@@ -72,34 +147,50 @@ class LocalJournalHandler(FileHandler):
             self.output_binary_to_file(os.path.join(
                 self.base_path, self.journal_id, 'maps', self._resource_key(map.map_id, 'json')
             ), map.json_data)
+        if map.original_id: self._record_saved(DownloadManifest.MAP, map.original_id)
 
-    def save_image_resource(self, image: Image):
-        # Output fullsize image
-        if image.image_fullsize:
-            self.output_binary_to_file(os.path.join(
-                self.base_path, self.journal_id, 'resources', self._resource_key(image.image_id, image.extension)
-            ), image.image_fullsize)
+    def get_resource_store(self):
+        return ResourceStore(
+            self, self.get_resource_path(''), os.path.join(self.base_path, self.SHARED_RESOURCES_DIRECTORY)
+        )
 
-        # Output small image
-        if image.image_small:
-            self.output_binary_to_file(os.path.join(
-                self.base_path, self.journal_id, 'resources', self._resource_key(image.image_id, image.extension, suffix='.small')
-            ), image.image_small)
+    def save_image_resource(self, image: Image):
+        # Saved by content, so an image used twice - or the same for both sizes - is only written once
+        resource_store = self.get_resource_store()
+        if image.image_fullsize: image.resource_fullsize = resource_store.save(image.image_fullsize, image.extension)
+        if image.image_small: image.resource_small = resource_store.save(image.image_small, image.extension)
 
     def save_map_resource(self, map: Map):
-        if map.gpx_data:
-            self.output_binary_to_file(os.path.join(
-                self.base_path, self.journal_id, 'resources', self._resource_key(map.map_id, 'gpx')
-            ), map.gpx_data)
-        if map.json_data:
-            self.output_binary_to_file(os.path.join(
-                self.base_path, self.journal_id, 'resources', self._resource_key(map.map_id, 'json')
-            ), map.json_data)
+        resource_store = self.get_resource_store()
+        if map.gpx_data: map.resource_gpx = resource_store.save(map.gpx_data, 'gpx')
+        if map.json_data: map.resource_json = resource_store.save(map.json_data, 'json')
+
+    def get_resource_filenames(self, content):
+        if isinstance(content, Image):
+            return [content.get_fullsize_resource_path(), content.get_small_resource_path()]
+        if isinstance(content, Map):
+            return [content.get_resource_path(), content.get_json_resource_path()]
+        return []
+
+    def get_saved_resource_filenames(self, content):
+        return [filename for filename in self.get_resource_filenames(content) if self.file_exists(self.get_resource_path(filename))]
+
+    def get_stored_resource_keys(self):
+        # The resources kept in the stores of every other journal in the library
+        keys = set()
+        if not os.path.isdir(self.base_path): return keys
+        for journal_id in os.listdir(self.base_path):
+            if journal_id in (self.journal_id, self.SHARED_RESOURCES_DIRECTORY): continue
+            resource_path = os.path.join(self.base_path, journal_id, 'resources')
+            keys.update(ResourceStore(self, resource_path).iterate_keys())
+        return keys
+
+    def prune_resources(self, keep):
+        # Remove any saved resources no longer referred to, here or in the shared store
+        self.get_resource_store().prune(keep, self.get_stored_resource_keys())
 
     def load_map_gpx(self, map: Map):
-        return self.get_file_content(os.path.join(
-            self.base_path, self.journal_id, 'resources', self._resource_key(map.map_id, 'gpx')
-        ))
+        return self.get_file_content(self.get_resource_path(map.get_resource_path()))
 
     def save_js_resource(self, js, content):
         if content:
@@ -135,18 +226,24 @@ class LocalJournalHandler(FileHandler):
         pdf.output(path)
 
 
+    def get_journal_store(self):
+        return JournalStore(self.get_path(JournalStore.FILENAME))
+
     def serialize_and_save_journal(self, journal):
-        serialized = self.serializer.serialize_journal(journal)
-        self.output_binary_to_file(os.path.join(
-            self.base_path, self.journal_id, 'journal.pickle'
-        ), serialized)
-
-    def load_serialized_journal(self):
-        return self.serializer.unserialize_from_data(
-            self.get_binary(os.path.join(
-                self.base_path, self.journal_id, 'journal.pickle'
-            ))
-        )
+        self.get_journal_store().save_journal(journal)
+
+        # The whole journal in one pickle is what older versions saved, and would now be out of date
+        legacy_path = self.get_path(self.LEGACY_JOURNAL_FILENAME)
+        if self.file_exists(legacy_path): os.remove(legacy_path)
+
+    def load_serialized_journal(self, lazy=False):
+        # Only the store can read pages in lazily; a legacy pickle is read whole
+        journal_store = self.get_journal_store()
+        if journal_store.exists(): return journal_store.load_journal(lazy=lazy)
+
+        legacy_path = self.get_path(self.LEGACY_JOURNAL_FILENAME)
+        if not self.file_exists(legacy_path): return None
+        return self.serializer.unserialize_from_data(self.get_binary(legacy_path))
 
     def remove_directory(self, path):
         super().remove_directory(os.path.join(
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+from bikesanity.io_utils import log_handler as log_handler
+from .serializer import Serializer
+
+
+class ParseCache:
+    """
+    On-disk cache of interpreted pages. Entries are keyed on a hash of everything the interpretation depends
+    on - the page's HTML including any additional parts, and the interpreter and its version - so a changed
+    page simply misses. Least recently used entries are evicted once the cache grows past its maximum size.
+    """
+
+    # Bump when the cached entry layout or the entities pickled in it change
+    FORMAT_VERSION = 1
+
+    MAX_SIZE = 512 * 1024 * 1024
+
+    ENTRY_DIRECTORY = 'pages'
+    INCOMING_DIRECTORY = 'incoming'
+
+    def __init__(self, directory, max_size=MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.serializer = Serializer()
+
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(directory, self.ENTRY_DIRECTORY), exist_ok=True)
+        os.makedirs(os.path.join(directory, self.INCOMING_DIRECTORY), exist_ok=True)
+
+    def make_key(self, *parts):
+        key_hash = hashlib.sha256(str(self.FORMAT_VERSION).encode())
+        for part in parts:
+            part = part if isinstance(part, bytes) else str(part).encode('utf8')
+            # Length-prefix each part, so their boundaries can't shift between keys
+            key_hash.update(str(len(part)).encode() + b':' + part)
+        return key_hash.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, self.ENTRY_DIRECTORY, key[:2], '{0}.pickle'.format(key))
+
+    def lookup(self, key):
+        path = self._entry_path(key)
+        try:
+            entry = self.serializer.unserialize_from_data(open(path, 'rb'))
+        except OSError:
+            return None
+
+        # Touch the entry so eviction sees it as recently used
+        if entry is not None: os.utime(path)
+        return entry
+
+    def store(self, key, entry):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first, as other processes may be reading the same cache
+        handle, temp_path = tempfile.mkstemp(dir=os.path.join(self.directory, self.INCOMING_DIRECTORY))
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                temp_file.write(self.serializer.serialize_to_byteio(entry).getvalue())
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path): os.remove(temp_path)
+            raise
+
+    def _iterate_entries(self):
+        entry_root = os.path.join(self.directory, self.ENTRY_DIRECTORY)
+        for shard in os.listdir(entry_root):
+            shard_path = os.path.join(entry_root, shard)
+            for filename in os.listdir(shard_path):
+                yield os.path.join(shard_path, filename)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drop the least recently used entries until the cache is under its maximum size"""
+        with self._lock:
+            entries = []
+            for path in self._iterate_entries():
+                try:
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                except OSError:
+                    continue
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_size: break
+                self._remove(path)
+                total_size -= size
+
+            log_handler.log.info('Parse cache holds {0:.1f} MB'.format(total_size / (1024 * 1024)))
+
+    def clear(self):
+        """Remove every entry, returning how many there were"""
+        with self._lock:
+            removed = 0
+            for path in list(self._iterate_entries()):
+                self._remove(path)
+                removed += 1
+            return removed
@@ -7,10 +7,14 @@ class PlainSession(BaseSession):
     TOTAL_RETRIES = 3
     REQUEST_TIMEOUT = 4
 
+    def _get(self, url, headers, stream=False):
+        return self.session.get(url, headers=headers, stream=stream)
+
     def make_request(self, url):
         super().make_request(url)
-        return self.session.get(url, headers=self.headers)
+        return self.get_through_cache(url, self._get)
 
     def make_stream_request(self, url):
         super().make_stream_request(url)
-        return self.session.get(url, headers=self.headers, stream=True)
+        # Streamed binaries are written once, where they're downloaded to, rather than into the cache as well
+        return self._get(url, self.headers, stream=True)
@@ -0,0 +1,189 @@
+import json
+import os
+import random
+import threading
+import time
+
+from bikesanity.io_utils import log_handler as log_handler
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, so fall back to msvcrt byte-range locking
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, held for the duration of a with block."""
+
+    RETRY_DELAY = 0.05
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.handle = open(self.path, 'a+')
+        if fcntl:
+            fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    self.handle.seek(0)
+                    msvcrt.locking(self.handle.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(self.RETRY_DELAY)
+        return self.handle
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if fcntl:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+            else:
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.handle.close()
+            self.handle = None
+
+
+class TokenBucketRateLimiter:
+    """
+    Token bucket limiting how often requests may be made, in its "virtual scheduling" form: rather
+    than counting tokens, the bucket tracks the time at which it would next be full. Each slot's refill
+    interval is drawn between the minimum and maximum, so requests don't arrive on a fixed beat.
+
+    Callers reserve their slot while holding the lock and then sleep exactly until it arrives, so nobody
+    polls. One limiter can be shared between sessions and threads, and when given a state file it is
+    shared between processes too.
+    """
+
+    DEFAULT_STATE_KEY = 'default'
+
+    def __init__(self, interval_min, interval_max=None, capacity=1, state_file=None, state_key=DEFAULT_STATE_KEY):
+        self.interval_min = interval_min
+        self.interval_max = interval_max if interval_max is not None else interval_min
+        self.capacity = max(1, capacity)
+        self.state_file = state_file
+        self.state_key = state_key
+
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def _next_interval(self, state):
+        return random.uniform(self.interval_min, self.interval_max)
+
+    def _load_state(self, handle):
+        handle.seek(0)
+        try:
+            return json.loads(handle.read() or '{}')
+        except ValueError:
+            return {}
+
+    def _save_state(self, handle, state):
+        handle.seek(0)
+        handle.truncate()
+        handle.write(json.dumps(state))
+        handle.flush()
+
+    def _transact(self, update):
+        # Apply an update to this limiter's state, which lives in the state file when one is shared
+        with self._lock:
+            if not self.state_file:
+                return update(self._state)
+
+            # Limiters for different keys (e.g. hosts) can share a single state file
+            with FileLock(self.state_file) as handle:
+                states = self._load_state(handle)
+                state = states.get(self.state_key)
+                if not isinstance(state, dict): state = {}
+                result = update(state)
+                states[self.state_key] = state
+                self._save_state(handle, states)
+                return result
+
+    def _schedule(self, state, now):
+        interval = self._next_interval(state)
+        full_at = state.get('full_at') or now
+
+        # A token is available once the bucket is within (capacity - 1) intervals of being full
+        slot = max(now, full_at - ((self.capacity - 1) * interval))
+        state['full_at'] = max(full_at, now) + interval
+        return slot
+
+    def reserve(self):
+        """Reserve the next slot, returning how many seconds to wait until it arrives"""
+        def update(state):
+            now = time.time()
+            return self._schedule(state, now) - now
+        return self._transact(update)
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0: time.sleep(delay)
+        return delay
+
+    def record_response(self, status, latency, retry_after=None):
+        # A fixed rate takes no notice of how the server responds
+        pass
+
+
+class AdaptiveRateLimiter(TokenBucketRateLimiter):
+    """
+    Token bucket whose interval adapts to how the server is coping (AIMD). Each healthy response takes
+    a fixed step off the interval, while rate limiting, server errors or slow responses multiply it, all
+    within the minimum and maximum. A Retry-After from the server holds back every caller until it passes.
+    """
+
+    ADDITIVE_STEP = 1
+    BACKOFF_MULTIPLIER = 2
+    SLOW_MULTIPLIER = 1.25
+
+    # Responses slower than this suggest the server is struggling
+    SLOW_RESPONSE = 10
+    # Each slot is spread randomly up to this fraction above the current interval
+    JITTER = 0.2
+
+    THROTTLED_STATUSES = [429, 503]
+
+    def __init__(self, interval_min, interval_max, interval_start=None, capacity=1, state_file=None,
+                 state_key=TokenBucketRateLimiter.DEFAULT_STATE_KEY):
+        super().__init__(interval_min, interval_max, capacity=capacity, state_file=state_file, state_key=state_key)
+        interval_start = interval_start if interval_start is not None else self.interval_max
+        self.interval_start = min(self.interval_max, max(self.interval_min, interval_start))
+
+    def current_interval(self, state):
+        return state.get('interval', self.interval_start)
+
+    def _next_interval(self, state):
+        return min(self.interval_max, self.current_interval(state) * random.uniform(1, 1 + self.JITTER))
+
+    def _adjust(self, interval, status, latency):
+        if status in self.THROTTLED_STATUSES:
+            return interval * self.BACKOFF_MULTIPLIER
+        if status >= 500 or latency > self.SLOW_RESPONSE:
+            return interval * self.SLOW_MULTIPLIER
+        if status < 400:
+            return interval - self.ADDITIVE_STEP
+        return interval
+
+    def record_response(self, status, latency, retry_after=None):
+        def update(state):
+            now = time.time()
+            previous = self.current_interval(state)
+            interval = min(self.interval_max, max(self.interval_min, self._adjust(previous, status, latency)))
+            state['interval'] = interval
+
+            # Nobody gets a slot until the server says it is ready again
+            if retry_after:
+                state['full_at'] = max(state.get('full_at') or now, now + retry_after)
+
+            if interval > previous:
+                log_handler.log.warning('Slowing requests to one every {0:.1f}s after status {1} in {2:.1f}s'.format(
+                    interval, status, latency
+                ))
+            return interval
+        return self._transact(update)
@@ -0,0 +1,105 @@
+import hashlib
+import os
+
+from .file_reference import FileReference
+
+
+class ResourceStore:
+    """
+    Resources saved under the SHA-1 hash of their content, in directories sharded by the start of the hash, so
+    the same picture or track is only ever saved once however often it's used. Each journal keeps its own store,
+    and every new resource is also hard linked into a store shared by the whole library, where the filesystem
+    allows, so that other journals can link to it rather than saving it again.
+    """
+
+    SHARD_LENGTH = 2
+
+    def __init__(self, file_handler, path, shared_path=None):
+        self.file_handler = file_handler
+        self.path = path
+        self.shared_path = shared_path
+
+    def calculate_hash(self, data):
+        if isinstance(data, FileReference): return self.file_handler.calculate_sha1_hash(data.path)
+
+        sha1 = hashlib.sha1()
+        data.seek(0)
+        for chunk in iter(lambda: data.read(self.file_handler.HASH_BUFFER_SIZE), b''):
+            sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def make_key(self, data, extension):
+        content_hash = self.calculate_hash(data)
+        filename = '{0}.{1}'.format(content_hash, extension) if extension else content_hash
+        # Keys are used in links as well as paths, so always separated with a forward slash
+        return '{0}/{1}'.format(content_hash[:self.SHARD_LENGTH], filename)
+
+    def get_path(self, key):
+        return os.path.join(self.path, *key.split('/'))
+
+    def get_shared_path(self, key):
+        return os.path.join(self.shared_path, *key.split('/'))
+
+    def _write(self, path, data):
+        if isinstance(data, FileReference):
+            self.file_handler.output_binary_to_file(path, data)
+        else:
+            data.seek(0)
+            self.file_handler.output_stream_to_file(path, data)
+
+    def save(self, data, extension):
+        """Save the resource unless it's already in the store, returning the key it's kept under"""
+        key = self.make_key(data, extension)
+        path = self.get_path(key)
+        if self.file_handler.file_exists(path): return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shared_path = self.get_shared_path(key) if self.shared_path else None
+        if shared_path and self.file_handler.file_exists(shared_path):
+            try:
+                self.file_handler.link_or_copy_file(shared_path, path)
+                return key
+            except FileNotFoundError:
+                # Pruned by another journal since, so saved afresh
+                pass
+
+        self._write(path, data)
+        if shared_path:
+            try:
+                os.makedirs(os.path.dirname(shared_path), exist_ok=True)
+                os.link(path, shared_path)
+            except OSError:
+                # Without hard links, sharing would only mean saving everything twice
+                pass
+        return key
+
+    def _iterate_files(self, path):
+        for directory, _, filenames in os.walk(path):
+            for filename in filenames:
+                yield os.path.join(directory, filename)
+
+    def _remove_empty_shards(self, path):
+        for directory, _, _ in os.walk(path, topdown=False):
+            if directory != path and not os.listdir(directory): os.rmdir(directory)
+
+    def iterate_keys(self):
+        """The key of every resource in the store"""
+        if not os.path.isdir(self.path): return
+        for path in self._iterate_files(self.path):
+            yield os.path.relpath(path, self.path).replace(os.sep, '/')
+
+    def prune(self, keep, stored_keys=()):
+        """
+        Remove any resources whose keys aren't kept, and anything shared that isn't kept here or in the store of
+        any other journal, given as the keys stored by every other journal in the library
+        """
+        for key in list(self.iterate_keys()):
+            if key not in keep: os.remove(self.get_path(key))
+        if os.path.isdir(self.path): self._remove_empty_shards(self.path)
+
+        if self.shared_path and os.path.isdir(self.shared_path):
+            # Shared resources may be hard linked into downloads as well, so only the journals' own stores count
+            shared_store = ResourceStore(self.file_handler, self.shared_path)
+            for key in list(shared_store.iterate_keys()):
+                if key not in keep and key not in stored_keys: os.remove(shared_store.get_path(key))
+            self._remove_empty_shards(self.shared_path)
@@ -0,0 +1,263 @@
+import email.utils
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from bikesanity.io_utils import log_handler as log_handler
+
+
+class ResponseCache:
+    """
+    On-disk cache of HTTP responses. Metadata is stored per URL, while bodies are stored under a hash of
+    their content so identical resources are only kept once. Entries are served without touching the network
+    for as long as the server's Cache-Control or Expires headers say they stay fresh - by default not at all -
+    and otherwise revalidated with ETag/If-Modified-Since.
+    """
+
+    MAX_SIZE = 2 * 1024 * 1024 * 1024
+    MAX_AGE = 30 * 24 * 60 * 60
+
+    CHUNK_SIZE = 65536
+
+    # Run eviction again once this fraction of the maximum size has been written
+    EVICTION_THRESHOLD = 0.1
+    EVICTION_GRACE = 60
+
+    # Headers a not modified response updates in the cached one
+    REVALIDATED_HEADERS = ['Cache-Control', 'Expires', 'Date', 'ETag', 'Last-Modified']
+
+    METADATA_DIRECTORY = 'urls'
+    BODY_DIRECTORY = 'bodies'
+    INCOMING_DIRECTORY = 'incoming'
+
+    def __init__(self, directory, max_size=MAX_SIZE, max_age=MAX_AGE):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self._written = 0
+
+        os.makedirs(os.path.join(directory, self.METADATA_DIRECTORY), exist_ok=True)
+        os.makedirs(os.path.join(directory, self.BODY_DIRECTORY), exist_ok=True)
+        os.makedirs(os.path.join(directory, self.INCOMING_DIRECTORY), exist_ok=True)
+        self.evict()
+
+    def _sharded_path(self, subdirectory, key, extension):
+        return os.path.join(self.directory, subdirectory, key[:2], '{0}.{1}'.format(key, extension))
+
+    def _metadata_path(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self._sharded_path(self.METADATA_DIRECTORY, key, 'json')
+
+    def _body_path(self, body_hash):
+        return self._sharded_path(self.BODY_DIRECTORY, body_hash, 'body')
+
+    def _save_metadata(self, entry):
+        path = self._metadata_path(entry['url'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.join(self.directory, self.INCOMING_DIRECTORY))
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(json.dumps(entry).encode())
+        os.replace(temp_path, path)
+
+    def lookup(self, url):
+        path = self._metadata_path(url)
+        try:
+            with open(path, 'rb') as handle:
+                entry = json.loads(handle.read().decode())
+        except (OSError, ValueError):
+            return None
+
+        # Treat entries whose body has been evicted, or which are too old to keep, as absent
+        if not os.path.isfile(self._body_path(entry['body'])) or time.time() - entry['stored'] > self.max_age:
+            return None
+        return entry
+
+    def _cache_directives(self, headers):
+        directives = {}
+        for directive in headers.get('Cache-Control', '').split(','):
+            name, _, value = directive.strip().partition('=')
+            if name: directives[name.lower()] = value.strip('"')
+        return directives
+
+    def is_storable(self, response):
+        return 'no-store' not in self._cache_directives(response.headers)
+
+    def freshness_lifetime(self, headers):
+        """How long a response stays fresh, in seconds, going by its headers - nothing says it does by default"""
+        directives = self._cache_directives(headers)
+        if 'no-cache' in directives: return 0
+        if 'max-age' in directives:
+            try:
+                return max(0, int(directives['max-age']))
+            except ValueError:
+                return 0
+
+        if headers.get('Expires'):
+            try:
+                expires = email.utils.parsedate_to_datetime(headers['Expires']).timestamp()
+                date = email.utils.parsedate_to_datetime(headers['Date']).timestamp() if headers.get('Date') else time.time()
+                return max(0, expires - date)
+            except (TypeError, ValueError):
+                return 0
+        return 0
+
+    def is_fresh(self, entry):
+        # Entries stored before freshness was recorded are always revalidated
+        return time.time() < entry.get('fresh_until', 0)
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        elif not headers:
+            headers['If-Modified-Since'] = email.utils.formatdate(entry['stored'], usegmt=True)
+        return headers
+
+    def store(self, url, response):
+        sha1 = hashlib.sha1()
+        size = 0
+
+        # Stream the body to a temporary file first, as its final name depends on the content
+        handle, temp_path = tempfile.mkstemp(dir=os.path.join(self.directory, self.INCOMING_DIRECTORY))
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                for chunk in response.iter_content(self.CHUNK_SIZE):
+                    sha1.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+
+            entry = {
+                'url': url,
+                'resolved_url': response.url,
+                'status': response.status_code,
+                'headers': dict(response.headers),
+                'body': sha1.hexdigest(),
+                'size': size,
+                'stored': time.time(),
+            }
+            entry['fresh_until'] = entry['stored'] + self.freshness_lifetime(entry['headers'])
+
+            with self._lock:
+                body_path = self._body_path(entry['body'])
+                os.makedirs(os.path.dirname(body_path), exist_ok=True)
+                os.replace(temp_path, body_path)
+                self._save_metadata(entry)
+                self._written += size
+        except Exception:
+            if os.path.exists(temp_path): os.remove(temp_path)
+            raise
+        finally:
+            response.close()
+
+        if self._written > self.max_size * self.EVICTION_THRESHOLD:
+            self.evict()
+        return entry
+
+    def revalidated(self, entry, response):
+        # A not modified response carries the headers the cached one should now have
+        for name in self.REVALIDATED_HEADERS:
+            if response.headers.get(name): entry['headers'][name] = response.headers[name]
+        entry['stored'] = time.time()
+        entry['fresh_until'] = entry['stored'] + self.freshness_lifetime(entry['headers'])
+        self._save_metadata(entry)
+        return entry
+
+    def build_response(self, entry):
+        response = Response()
+        response.status_code = entry['status']
+        response.reason = 'OK'
+        response.url = entry['resolved_url']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = open(self._body_path(entry['body']), 'rb')
+
+        # Touch the body so eviction sees it as recently used
+        os.utime(self._body_path(entry['body']))
+
+        # Read the content in now and release the file
+        response.content
+        response.raw.close()
+        return response
+
+    def _iterate_entries(self):
+        metadata_root = os.path.join(self.directory, self.METADATA_DIRECTORY)
+        for shard in os.listdir(metadata_root):
+            shard_path = os.path.join(metadata_root, shard)
+            for filename in os.listdir(shard_path):
+                path = os.path.join(shard_path, filename)
+                try:
+                    with open(path, 'rb') as handle:
+                        yield path, json.loads(handle.read().decode())
+                except (OSError, ValueError):
+                    continue
+
+    def _iterate_bodies(self):
+        body_root = os.path.join(self.directory, self.BODY_DIRECTORY)
+        for shard in os.listdir(body_root):
+            shard_path = os.path.join(body_root, shard)
+            for filename in os.listdir(shard_path):
+                yield filename[:filename.find('.')], os.path.join(shard_path, filename)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _recently_written(self, path, now):
+        try:
+            return now - os.path.getmtime(path) < self.EVICTION_GRACE
+        except OSError:
+            return False
+
+    def evict(self):
+        """Drop entries older than the maximum age, then the least recently used until under the maximum size"""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for path, entry in self._iterate_entries():
+                if now - entry['stored'] > self.max_age:
+                    self._remove(path)
+                else:
+                    entries.append((path, entry))
+
+            referenced = {entry['body'] for path, entry in entries}
+            bodies = {}
+            for body_hash, path in self._iterate_bodies():
+                if body_hash in referenced:
+                    bodies[body_hash] = path
+                elif not self._recently_written(path, now):
+                    # A body only just written may not have its metadata saved yet, by another cache on the directory
+                    self._remove(path)
+
+            body_access = {body_hash: os.path.getmtime(path) for body_hash, path in bodies.items()}
+            total_size = sum(os.path.getsize(path) for path in bodies.values())
+
+            if total_size > self.max_size:
+                # Remove least recently used bodies, along with every URL that refers to them
+                by_body = {}
+                for path, entry in entries:
+                    by_body.setdefault(entry['body'], []).append(path)
+
+                for body_hash in sorted(bodies, key=lambda key: body_access[key]):
+                    if total_size <= self.max_size: break
+                    # Leave anything used in the last few moments, as it may be about to be served
+                    if now - body_access[body_hash] < self.EVICTION_GRACE: continue
+                    total_size -= os.path.getsize(bodies[body_hash])
+                    for path in by_body.get(body_hash, []):
+                        self._remove(path)
+                    self._remove(bodies[body_hash])
+
+            log_handler.log.info('Response cache holds {0:.1f} MB'.format(total_size / (1024 * 1024)))
+            self._written = 0
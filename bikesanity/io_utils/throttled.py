@@ -1,46 +1,105 @@
-import datetime
-import random
+import email.utils
+import threading
 import time
+from urllib.parse import urlparse
 
 from bikesanity.io_utils import log_handler as log_handler
 from .base_session import BaseSession
+from .rate_limiter import AdaptiveRateLimiter, TokenBucketRateLimiter
 
 
 class ThrottledSession(BaseSession):
 
-    STANDARD_REQUEST_RATE_LIMITER = 25
     STANDARD_REQUEST_RATE_LIMITER_MIN = 25
-    STANDARD_REQUEST_RATE_LIMITER_MAX = 30
     FAILED_REQUEST_RATE_LIMITER = 5
 
-    def __init__(self):
-        super().__init__()
-        self.last_request = None
-        self.current_rate_limit = self.STANDARD_REQUEST_RATE_LIMITER
+    # The request interval backs off from the standard rate as far as this, recovering while the server copes
+    ADAPTIVE_REQUEST_INTERVAL_MAX = 180
 
-    def _stochastic_delay(self):
-        return random.randrange(self.STANDARD_REQUEST_RATE_LIMITER_MIN, self.STANDARD_REQUEST_RATE_LIMITER_MAX)
+    # Rate limiting is handled here rather than by the retrier, so it also slows the shared limiter
+    RETRY_STATUSES = [500, 502, 504, 403]
+    RESPECT_RETRY_AFTER = False
+    THROTTLED_RETRIES = 5
+
+    def __init__(self, rate_limiter=None, response_cache=None):
+        super().__init__(response_cache=response_cache)
+        self.rate_limiter = rate_limiter or self.create_rate_limiter()
+
+    @classmethod
+    def create_rate_limiter(cls, state_file=None, state_key=TokenBucketRateLimiter.DEFAULT_STATE_KEY):
+        # Never faster than the standard rate, however well the server copes
+        return AdaptiveRateLimiter(
+            cls.STANDARD_REQUEST_RATE_LIMITER_MIN, cls.ADAPTIVE_REQUEST_INTERVAL_MAX,
+            interval_start=cls.STANDARD_REQUEST_RATE_LIMITER_MIN, state_file=state_file, state_key=state_key
+        )
 
     def _wait_since_last_request(self):
-        rate_limit_delay = self._stochastic_delay()
+        self.rate_limiter.acquire()
+
+    def _retry_after(self, response):
+        retry_after = response.headers.get('Retry-After')
+        if not retry_after: return None
+        try:
+            return max(0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            return max(0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _throttled_get(self, url, headers, stream=False):
+        attempt = 0
+        while True:
+            try:
+                self._wait_since_last_request()
+                start = time.time()
+                response = self.session.get(url, headers=headers, stream=stream)
+            except Exception as exc:
+                # Log the exception, delay a while, then raise
+                log_handler.log.error("Error connecting when downloading {0}".format(url))
+                time.sleep(self.FAILED_REQUEST_RATE_LIMITER)
+                raise
+
+            # Let the limiter know how the server is coping, so it can speed up or back off
+            retry_after = self._retry_after(response)
+            self.rate_limiter.record_response(response.status_code, time.time() - start, retry_after)
 
-        if not self.last_request:
-            self.last_request = datetime.datetime.now()
-        while (datetime.datetime.now() - self.last_request).total_seconds() < rate_limit_delay:
-            time.sleep(0.2)
-        self.last_request = datetime.datetime.now()
+            attempt += 1
+            if response.status_code not in AdaptiveRateLimiter.THROTTLED_STATUSES or attempt > self.THROTTLED_RETRIES:
+                return response
+
+            # Rate limited - wait for the slowed limiter to hand out another slot and try again
+            log_handler.log.warning('Rate limited on {0} (status {1}) - backing off and retrying'.format(
+                url, response.status_code
+            ))
+            response.close()
+
+    def _get(self, url, headers, stream=False):
+        return self.session.get(url, headers=headers, stream=stream)
 
     def make_request(self, url):
         super().make_request(url)
-        try:
-            self._wait_since_last_request()
-            return self.session.get(url, headers=self.headers)
-        except Exception as exc:
-            # Log the exception, delay a while, then raise
-            log_handler.log.error("Error connecting when downloading {0}".format(url))
-            time.sleep(self.FAILED_REQUEST_RATE_LIMITER)
-            raise
+        # Only requests that actually reach the server use up a throttled slot
+        return self.get_through_cache(url, self._throttled_get)
 
     def make_stream_request(self, url):
         super().make_stream_request(url)
-        return self.session.get(url, headers=self.headers, stream=True)
+        # Streamed binaries are written once, where they're downloaded to, rather than into the cache as well
+        return self._get(url, self.headers, stream=True)
+
+
+class HostRateLimiters:
+    """Hands out one rate limiter per host, so every throttled request to a site shares the same budget"""
+
+    def __init__(self, state_file=None):
+        self.state_file = state_file
+        self.limiters = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self.limiters:
+                self.limiters[host] = ThrottledSession.create_rate_limiter(state_file=self.state_file, state_key=host)
+            return self.limiters[host]
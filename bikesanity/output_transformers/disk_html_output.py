@@ -150,11 +150,11 @@ class DiskHtmlOutput:
         body.append(div_tag)
 
     def output_pic(self, image: Image):
-        return '../resources/{0}.{1}.{2}'.format(image.image_id, 'small', image.extension), \
-               '../resources/{0}.{1}'.format(image.image_id, image.extension)
+        return '../resources/{0}'.format(image.get_small_resource_path()), \
+               '../resources/{0}'.format(image.get_fullsize_resource_path())
 
     def output_map(self, map: Map):
-        return '../resources/{0}.{1}'.format(map.map_id, 'gpx')
+        return '../resources/{0}'.format(map.get_resource_path())
 
     def output_title(self, soup, body, text):
         h2_tag = soup.new_tag('h2')
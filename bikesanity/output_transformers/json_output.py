@@ -76,12 +76,12 @@ class JsonOutput:
         # Iterate over the ToC and process every page
         page_idx = 1
 
-        toc_pages = [toc for toc in journal.toc if toc.page]
+        toc_pages = [toc for toc in journal.toc if toc.has_page()]
         last_toc = toc_pages[-1]
 
         for toc_item in journal.toc:
 
-            if toc_item.page:
+            if toc_item.has_page():
                 json_page = JsonPage(id=toc_item.original_id, url=toc_item.url)
                 self.output_page(json_page, toc_item.page, page_idx, last=toc_item == last_toc)
                 json_journal.add_page(json_page)
@@ -130,7 +130,7 @@ class JsonOutput:
                     JsonSection.pic_section(
                         id=content.image_id,
                         url=content.original_path_fullsize,
-                        filename='{0}.{1}'.format(content.image_id, content.extension),
+                        filename=content.get_fullsize_resource_path(),
                         caption=content.caption
                     )
                 )
@@ -36,7 +36,7 @@ class PdfOutput:
     def output_journal(self, journal: Journal):
 
         # Determine if it needs to be split into parts, and make the split
-        full_pages = [content for content in journal.toc if content.page]
+        full_pages = [content for content in journal.toc if content.has_page()]
         part_progress = 100 / (len(full_pages)/self.MAX_PDF_SECTIONS)
 
         if len(full_pages) <= self.MAX_PDF_SECTIONS:
@@ -91,7 +91,7 @@ class PdfOutput:
 
         for toc_item in contents:
 
-            if toc_item.page:
+            if toc_item.has_page():
                 log_handler.log.info('Processing page {0} to PDF'.format(page_idx))
                 page_idx += 1
 
@@ -173,4 +173,4 @@ class PdfOutput:
         pass
 
     def output_pic(self, image: Image):
-        return self.local_handler.get_resource_path('{0}.{1}'.format(image.image_id, image.extension))
+        return self.local_handler.get_resource_path(image.get_fullsize_resource_path())
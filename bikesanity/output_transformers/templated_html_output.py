@@ -1,20 +1,26 @@
+import json
 import re
 
 from bs4 import BeautifulSoup
+from lxml import etree
 
+import bikesanity.io_utils.log_handler as log_handler
 from bikesanity.entities.content_blocks import Image, Map, TextBlock
 from bikesanity.entities.journal import Journal
 from bikesanity.entities.page import Page
 from bikesanity.io_utils.resources import get_resource_string
+from bikesanity.services.track_encoder import TrackEncoder
 
 
 class TemplatedHtmlOutput:
 
     TEMPLATES_DIRECTORY = 'templates'
 
-    def __init__(self, local_handler, progress_callback=None):
+    def __init__(self, local_handler, progress_callback=None, map_tolerance=None):
         self.local_handler = local_handler
         self.progress_callback = progress_callback
+        # Maps are shown with tracks simplified to this many metres, while their GPX downloads keep every point
+        self.track_encoder = TrackEncoder(simplify_tolerance=map_tolerance)
 
     def progress_update(self, percent):
         if self.progress_callback:
@@ -78,12 +84,12 @@ class TemplatedHtmlOutput:
         page_idx = 1
         ul_tag = None
 
-        toc_pages = [toc for toc in journal.toc if toc.page]
+        toc_pages = [toc for toc in journal.toc if toc.has_page()]
         last_toc = toc_pages[-1]
 
         for toc_item in journal.toc:
 
-            if toc_item.page:
+            if toc_item.has_page():
                 if not ul_tag:
                     ul_tag = soup.new_tag('ul')
 
@@ -229,21 +235,40 @@ class TemplatedHtmlOutput:
 
     MAP_GPX_SCRIPT = "<!--\nvar {0} = '{1}';\n-->"
 
+    MAP_TRACK_SCRIPT = "<!--\nvar {0} = {1};\n-->"
+
     MAP_SCRIPT = "\naddMap('{0}', {1});\n"
 
     def sanitize_gpx(self, gpx):
         gpx = gpx.replace('\n', '')
         return re.sub(r'\s{2,}', ' ', gpx)
 
+    def encode_track(self, gpx, map_id):
+        try:
+            track = self.track_encoder.encode_gpx(gpx)
+        except etree.XMLSyntaxError:
+            return None
+        if not track.points: return None
+
+        payload = json.dumps(track.to_payload(), separators=(',', ':'))
+        log_handler.log.info('Encoded {0} from {1} to {2} points, {3:.1f}KB to {4:.1f}KB'.format(
+            map_id, track.original_points, track.points, len(self.sanitize_gpx(gpx)) / 1024, len(payload) / 1024
+        ))
+        return payload
+
     def create_map_js(self, map: Map, map_id):
         # Add the JavaScript for the map
         map_gpx = self.local_handler.load_map_gpx(map)
-        map_gpx = self.sanitize_gpx(map_gpx)
+        map_var = '{0}_track'.format(map_id).replace('-', '_')
 
-        map_gpx_var = '{0}_gpx'.format(map_id).replace('-', '_')
-        map_js = self.MAP_GPX_SCRIPT.format(map_gpx_var, map_gpx)
+        # Tracks are given as encoded polylines, but GPX without any is handed over for the browser to make what it can of
+        map_track = self.encode_track(map_gpx, map_id)
+        if map_track:
+            map_js = self.MAP_TRACK_SCRIPT.format(map_var, map_track)
+        else:
+            map_js = self.MAP_GPX_SCRIPT.format(map_var, self.sanitize_gpx(map_gpx))
         self.local_handler.save_map_js(map_id, map_js)
-        return map_gpx_var
+        return map_var
 
 
     def output_map(self, soup, page_div, map: Map):
@@ -276,7 +301,7 @@ class TemplatedHtmlOutput:
 
 
         # Create the map wrapped as a JS file, to keep the HTML clean
-        map_gpx_var = self.create_map_js(map, map_id)
+        map_var = self.create_map_js(map, map_id)
         map_js_tag = soup.new_tag('script', attrs={
             'src': 'maps/{0}.js'.format(map_id)
         })
@@ -286,7 +311,7 @@ class TemplatedHtmlOutput:
             'language': 'JavaScript',
             'type': 'text/javascript'
         })
-        script = self.MAP_SCRIPT.format(map_id, map_gpx_var)
+        script = self.MAP_SCRIPT.format(map_id, map_var)
         script_tag.append(soup.new_string(script))
         map_container_div_tag.append(script_tag)
 
@@ -324,12 +349,12 @@ class TemplatedHtmlOutput:
             body.append(div_tag)
 
     def output_pic(self, image: Image):
-        return '../resources/{0}.{1}.{2}'.format(image.image_id, 'small', image.extension), \
-               '../resources/{0}.{1}'.format(image.image_id, image.extension)
+        return '../resources/{0}'.format(image.get_small_resource_path()), \
+               '../resources/{0}'.format(image.get_fullsize_resource_path())
 
 
     def get_map_url(self, map: Map):
-        return '../resources/{0}.{1}'.format(map.map_id, 'gpx')
+        return '../resources/{0}'.format(map.get_resource_path())
 
     def output_title(self, soup, body, text):
         h2_tag = soup.new_tag('h2')
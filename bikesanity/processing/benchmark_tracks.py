@@ -0,0 +1,104 @@
+import glob
+import json
+import os
+import random
+import time
+
+import bikesanity.io_utils.log_handler as log_handler
+from bikesanity.services.map_extractor import LineExtractor
+from .load_disk_journal import LoadDiskJournal
+
+
+class TrackTiming:
+    def __init__(self, name, points):
+        self.name = name
+        self.points = points
+        self.gpxpy_duration = 0
+        self.fast_duration = 0
+        self.matches = True
+
+    @property
+    def speedup(self):
+        return self.gpxpy_duration / self.fast_duration if self.fast_duration else 0
+
+
+class BenchmarkTracks:
+    """
+    Times building GPX from map data with gpxpy against writing it directly, checking the two give exactly
+    the same GPX. Runs over the map data of processed journals, along with a generated track of any length.
+    """
+
+    REPEAT = 3
+    GENERATED_POINTS = 50000
+    GENERATED_SEGMENTS = 5
+
+    def __init__(self, location, repeat=REPEAT):
+        self.processed_location = os.path.join(location, LoadDiskJournal.PROCESSED_DIRECTORY)
+        self.repeat = max(1, repeat)
+
+    def find_map_data(self):
+        # Maps keep the data they were extracted from alongside their GPX
+        for path in sorted(glob.glob(os.path.join(self.processed_location, '*', 'resources', '**', '*.json'), recursive=True)):
+            with open(path, 'r', encoding='utf8') as handle:
+                yield os.path.relpath(path, self.processed_location), handle.read()
+
+    def generate_map_data(self, points, segments=GENERATED_SEGMENTS):
+        # A random walk, split into segments
+        rand = random.Random(points)
+        lat, lng = 51.5, -0.12
+        polylines = []
+        for segment in range(segments):
+            lats, lngs = [], []
+            for _ in range(points // segments):
+                lat += rand.uniform(-0.001, 0.001)
+                lng += rand.uniform(-0.001, 0.001)
+                lats.append(round(lat, 6))
+                lngs.append(round(lng, 6))
+            polylines.append({'lats': lats, 'lngs': lngs})
+        return json.dumps({'lines': [{'line_id': 0, 'polylines': polylines}]})
+
+    def _time(self, generate):
+        durations = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            result = generate()
+            durations.append(time.perf_counter() - start)
+        return result, min(durations)
+
+    def time_track(self, name, map_data):
+        line_extractor = LineExtractor(map_data)
+        polylines = line_extractor.line.get('polylines', []) if line_extractor.line else []
+        timing = TrackTiming(name, sum(len(polyline.get('lats', [])) for polyline in polylines))
+
+        gpxpy_xml, timing.gpxpy_duration = self._time(line_extractor.generate_gpx)
+        fast_xml, timing.fast_duration = self._time(line_extractor.generate_gpx_fast)
+        timing.matches = gpxpy_xml == fast_xml
+
+        log_handler.log.info('  {0:<6} {1}: {2} points, gpxpy {3:.1f}ms, fast {4:.1f}ms ({5:.1f}x)'.format(
+            'OK' if timing.matches else 'DIFFER', timing.name, timing.points,
+            timing.gpxpy_duration * 1000, timing.fast_duration * 1000, timing.speedup
+        ))
+        return timing
+
+    def run(self, generated_points=GENERATED_POINTS):
+        timings = []
+        for name, map_data in self.find_map_data():
+            try:
+                timings.append(self.time_track(name, map_data))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                log_handler.log.warning('  Skipping {0}, which holds no usable track'.format(name))
+
+        if generated_points:
+            timings.append(self.time_track('generated', self.generate_map_data(generated_points)))
+
+        self.log_summary(timings)
+        return timings
+
+    def log_summary(self, timings):
+        if not timings: return
+        gpxpy_total = sum(timing.gpxpy_duration for timing in timings)
+        fast_total = sum(timing.fast_duration for timing in timings)
+        log_handler.log.info('Built {0} tracks of {1} points: gpxpy {2:.2f}s, fast {3:.2f}s ({4:.1f}x), {5} different'.format(
+            len(timings), sum(timing.points for timing in timings), gpxpy_total, fast_total,
+            gpxpy_total / fast_total if fast_total else 0, len([timing for timing in timings if not timing.matches])
+        ))
@@ -0,0 +1,173 @@
+from io import BytesIO
+import os
+import time
+
+import bikesanity.io_utils.log_handler as log_handler
+from bikesanity.entities.entity import Entity
+from bikesanity.entities.page import Page
+from bikesanity.interpreter.parser_backends import ParserBackend, create_journal_interpreter, create_page_interpreter
+from bikesanity.io_utils.local_journal import LocalJournalHandler
+from bikesanity.services.retrievers import LocalRetriever, ExportRetriever
+from .load_disk_journal import LoadDiskJournal
+
+
+class ParsedItem:
+    def __init__(self, journal_id, item_id):
+        self.journal_id = journal_id
+        self.item_id = item_id
+        self.durations = {}
+        self.difference = None
+
+    @property
+    def matches(self):
+        return self.difference is None
+
+    def speedup(self, baseline, candidate):
+        return self.durations[baseline] / self.durations[candidate] if self.durations[candidate] else 0
+
+
+class CompareParsers:
+    """
+    Interprets downloaded journals with two parser backends, timing each on every page and logging any
+    page they interpret differently. The tests check parity with the same comparison, over their fixtures.
+    """
+
+    INDEX_ID = 'index'
+
+    # Attributes that differ on every run, or only hold working state - resources are named by ID until saved
+    IGNORED_ATTRIBUTES = {
+        'image_id', 'map_id', 'parsed_document', 'resource_small', 'resource_fullsize', 'resource_gpx', 'resource_json'
+    }
+
+    def __init__(self, input_location, exported=False, baseline=ParserBackend.BS4, candidate=ParserBackend.LXML):
+        self.input_location = os.path.join(
+            input_location, LoadDiskJournal.EXPORTED_DIRECTORY if exported else LoadDiskJournal.DOWNLOAD_DIRECTORY
+        )
+        self.exported = exported
+        self.baseline = ParserBackend(baseline)
+        self.candidate = ParserBackend(candidate)
+
+    def find_journal_ids(self):
+        if not os.path.isdir(self.input_location): return []
+        return sorted(
+            entry for entry in os.listdir(self.input_location)
+            if os.path.isfile(LocalJournalHandler(self.input_location, entry).get_path('index.html'))
+        )
+
+    def normalize(self, value):
+        # Reduce a model to plain values that can be compared between backends
+        if isinstance(value, BytesIO):
+            return value.getvalue()
+        if isinstance(value, (list, tuple)):
+            return [self.normalize(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.normalize(item) for key, item in value.items()}
+        if isinstance(value, Entity):
+            attributes = {key: item for key, item in value.get_fields().items() if key not in self.IGNORED_ATTRIBUTES}
+            return type(value).__name__, self.normalize(attributes)
+        if hasattr(value, '__dict__'):
+            attributes = {key: item for key, item in vars(value).items() if key not in self.IGNORED_ATTRIBUTES}
+            return type(value).__name__, self.normalize(attributes)
+        return value
+
+    def find_difference(self, expected, actual, path=''):
+        if type(expected) != type(actual):
+            return '{0}: {1!r} != {2!r}'.format(path or 'model', expected, actual)
+        if isinstance(expected, dict):
+            for key in sorted(set(expected) | set(actual)):
+                difference = self.find_difference(expected.get(key), actual.get(key), '{0}.{1}'.format(path, key))
+                if difference: return difference
+            return None
+        if isinstance(expected, (list, tuple)):
+            if len(expected) != len(actual):
+                return '{0}: {1} items != {2} items'.format(path or 'model', len(expected), len(actual))
+            for idx, (expected_item, actual_item) in enumerate(zip(expected, actual)):
+                difference = self.find_difference(expected_item, actual_item, '{0}[{1}]'.format(path, idx))
+                if difference: return difference
+            return None
+        return '{0}: {1!r} != {2!r}'.format(path or 'model', expected, actual) if expected != actual else None
+
+    def _retriever(self, journal_id):
+        input_handler = LocalJournalHandler(self.input_location, journal_id)
+        return ExportRetriever(input_handler) if self.exported else LocalRetriever(input_handler)
+
+    def _interpret_index(self, backend, journal_id):
+        # Each backend reads the index itself, rather than from the record another saved alongside it
+        journal_interpreter = create_journal_interpreter(self._retriever(journal_id), backend, use_index_record=False)
+        start = time.perf_counter()
+        journal = journal_interpreter.retrieve_journal(None, journal_id)
+        return journal, time.perf_counter() - start
+
+    def _interpret_page(self, backend, journal, original_id):
+        page_interpreter = create_page_interpreter(self._retriever(journal.journal_id), backend)
+        start = time.perf_counter()
+        if original_id == journal.journal_id:
+            # Single-page journals have all their content on the title page
+            page = Page(journal.journal_id, journal.journal_id, journal.original_html)
+            page = page_interpreter.parse_page(page, single=True)
+        else:
+            page = page_interpreter.retrieve_page(journal.journal_id, original_id, None)
+            page = page_interpreter.parse_page(page)
+        return page, time.perf_counter() - start
+
+    def _compare(self, item, interpret):
+        models = {}
+        for backend in (self.baseline, self.candidate):
+            model, item.durations[backend] = interpret(backend)
+            models[backend] = self.normalize(model)
+        item.difference = self.find_difference(models[self.baseline], models[self.candidate])
+        self.log_item(item)
+        return item
+
+    def compare_journal(self, journal_id):
+        log_handler.log.info('Comparing {0} and {1} parsers on journal {2}'.format(
+            self.baseline.value, self.candidate.value, journal_id
+        ))
+
+        journals = {}
+        def interpret_index(backend):
+            journals[backend], duration = self._interpret_index(backend, journal_id)
+            return journals[backend], duration
+
+        items = [self._compare(ParsedItem(journal_id, self.INDEX_ID), interpret_index)]
+        journal = journals[self.baseline]
+
+        page_ids = [toc.original_id for toc in journal.toc if toc.url] if journal.toc else [journal.journal_id]
+        for page_id in page_ids:
+            item = self._compare(ParsedItem(journal_id, page_id), lambda backend: self._interpret_page(backend, journal, page_id))
+            items.append(item)
+        return items
+
+    def compare_journals(self, journal_ids=None):
+        items = []
+        for journal_id in journal_ids or self.find_journal_ids():
+            items.extend(self.compare_journal(journal_id))
+        self.log_summary(items)
+        return items
+
+    def log_item(self, item: ParsedItem):
+        log_handler.log.info('  {0:<6} {1}/{2}: {3} {4:.1f}ms, {5} {6:.1f}ms ({7:.1f}x)'.format(
+            'OK' if item.matches else 'DIFFER', item.journal_id, item.item_id,
+            self.baseline.value, item.durations[self.baseline] * 1000,
+            self.candidate.value, item.durations[self.candidate] * 1000,
+            item.speedup(self.baseline, self.candidate)
+        ))
+        if not item.matches: log_handler.log.error('         {0}'.format(item.difference))
+
+    def log_summary(self, items):
+        if not items:
+            log_handler.log.warning('No journals found to compare in {0}'.format(self.input_location))
+            return
+
+        mismatched = [item for item in items if not item.matches]
+        baseline_total = sum(item.durations[self.baseline] for item in items)
+        candidate_total = sum(item.durations[self.candidate] for item in items)
+        speedups = sorted(item.speedup(self.baseline, self.candidate) for item in items)
+
+        log_handler.log.info('Compared {0} documents: {1} identical, {2} different'.format(
+            len(items), len(items) - len(mismatched), len(mismatched)
+        ))
+        log_handler.log.info('{0} {1:.2f}s, {2} {3:.2f}s: {4:.1f}x overall, {5:.1f}x median per page'.format(
+            self.baseline.value, baseline_total, self.candidate.value, candidate_total,
+            baseline_total / candidate_total if candidate_total else 0, speedups[len(speedups) // 2]
+        ))
@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+import bikesanity.io_utils.log_handler as log_handler
+from bikesanity.interpreter.parser_backends import ParserBackend
+from bikesanity.io_utils.response_cache import ResponseCache
+from bikesanity.io_utils.throttled import HostRateLimiters
+from bikesanity.services.retrievers import DownloadingRetriever
+from .download_journal import DownloadJournal
+
+
+class BatchResult:
+    def __init__(self, url):
+        self.url = url
+        self.journal_id = None
+        self.error = None
+        self.duration = 0
+
+    @property
+    def succeeded(self):
+        return self.journal_id is not None and self.error is None
+
+
+class DownloadBatch:
+    """
+    Downloads many journals at once. Each journal's page fetches go through one rate limiter per host,
+    so together they never exceed the site-wide request rate, while image downloads and parsing for all
+    the journals carry on in parallel. A failure in one journal doesn't affect the others.
+    """
+
+    JOURNAL_WORKERS = 4
+
+    def __init__(self, base_location, postprocess_html=True, journal_workers=JOURNAL_WORKERS,
+                 image_workers=DownloadingRetriever.IMAGE_WORKERS, use_cache=True, throttle_state=None,
+                 parser_backend=ParserBackend.BS4):
+        self.base_location = base_location
+        self.postprocess_html = postprocess_html
+        self.journal_workers = max(1, journal_workers)
+        self.image_workers = image_workers
+        self.use_cache = use_cache
+        # Every journal shares one response cache, so none evicts what another has only just stored
+        self.response_cache = ResponseCache(
+            os.path.join(base_location, DownloadJournal.CACHE_DIRECTORY)
+        ) if use_cache else None
+        self.rate_limiters = HostRateLimiters(throttle_state)
+        self.parser_backend = parser_backend
+
+    @staticmethod
+    def read_journal_urls(filename):
+        with open(filename, 'r', encoding='utf8') as handle:
+            lines = [line.strip() for line in handle]
+        return [line for line in lines if line and not line.startswith('#')]
+
+    def _download(self, url) -> BatchResult:
+        result = BatchResult(url)
+        start = time.time()
+        try:
+            journal_downloader = DownloadJournal(
+                self.base_location, postprocess_html=self.postprocess_html, image_workers=self.image_workers,
+                rate_limiter=self.rate_limiters.for_url(DownloadingRetriever.BASE_URL), use_cache=self.use_cache,
+                parser_backend=self.parser_backend, response_cache=self.response_cache
+            )
+            journal = journal_downloader.download_journal_url(url)
+            if journal:
+                result.journal_id = journal.journal_id
+            else:
+                result.error = 'No journal found'
+        except Exception as exc:
+            # Record and carry on - one broken journal shouldn't stop the rest of the batch
+            result.error = str(exc) or exc.__class__.__name__
+        result.duration = time.time() - start
+        return result
+
+    def download_journal_urls(self, urls):
+        log_handler.log.info('Downloading batch of {0} journals'.format(len(urls)))
+        with ThreadPoolExecutor(max_workers=self.journal_workers, thread_name_prefix='journal') as executor:
+            results = list(executor.map(self._download, urls))
+        self.log_summary(results)
+        return results
+
+    def log_summary(self, results):
+        succeeded = [result for result in results if result.succeeded]
+        log_handler.log.info('Batch complete: {0} of {1} journals downloaded'.format(len(succeeded), len(results)))
+        for result in results:
+            if result.succeeded:
+                log_handler.log.info('  OK      {0} -> {1} ({2:.0f}s)'.format(result.url, result.journal_id, result.duration))
+            else:
+                log_handler.log.error('  FAILED  {0}: {1}'.format(result.url, result.error))
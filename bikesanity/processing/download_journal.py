@@ -1,33 +1,57 @@
+from contextlib import contextmanager
 import os
+import signal
+import threading
 
 import bikesanity.io_utils.log_handler as log_handler
-from bikesanity.interpreter.journal_content import JournalContent
-from bikesanity.interpreter.page_interpreter import PageInterpreter
+from bikesanity.interpreter.parser_backends import ParserBackend, create_journal_interpreter, create_page_interpreter
 from bikesanity.entities.journal import Journal
 from bikesanity.entities.page import Page
+from bikesanity.io_utils.download_manifest import DownloadManifest
 from bikesanity.io_utils.local_journal import LocalJournalHandler
+from bikesanity.io_utils.response_cache import ResponseCache
 from bikesanity.io_utils.serializer import Serializer
-from bikesanity.services.retrievers import DownloadingRetriever
+from bikesanity.services.retrievers import DownloadingRetriever, LocalRetriever
 from bikesanity.services.html_postprocessor import HtmlPostProcessor
+from .load_disk_journal import LoadDiskJournal
+from .page_pipeline import PagePipeline
 
 
 class DownloadJournal:
 
     DOWNLOAD_DIRECTORY = 'downloads'
+    CACHE_DIRECTORY = os.path.join('cache', 'http')
 
-    def __init__(self, base_location, postprocess_html=True, progress_callback=None):
+    def __init__(self, base_location, postprocess_html=True, progress_callback=None,
+                 image_workers=DownloadingRetriever.IMAGE_WORKERS, page_workers=PagePipeline.WORKERS, rate_limiter=None,
+                 use_cache=True, process=False, parser_backend=ParserBackend.BS4, response_cache=None):
         self.base_location = os.path.join(base_location, self.DOWNLOAD_DIRECTORY)
         os.makedirs(self.base_location, exist_ok=True)
 
+        # When processing as we go, the processed journal is built from the pages already in memory
+        self.process = process
+        self.process_location = os.path.join(base_location, LoadDiskJournal.PROCESSED_DIRECTORY)
+
+        # Keep a cache of responses, so re-running a download only fetches what has changed - one is passed in
+        # when downloading several journals at once, as each cache evicts what it doesn't know about
+        if not use_cache:
+            response_cache = None
+        elif not response_cache:
+            response_cache = ResponseCache(os.path.join(base_location, self.CACHE_DIRECTORY))
+
         self.serializer = Serializer()
-        self.retriever = DownloadingRetriever()
+        self.retriever = DownloadingRetriever(
+            image_workers=image_workers, rate_limiter=rate_limiter, response_cache=response_cache
+        )
         self.html_postprocessor = HtmlPostProcessor()
 
-        self.journal_indexer = JournalContent(self.retriever)
-        self.page_crawler = PageInterpreter(self.retriever, progress_callback=progress_callback)
+        self.parser_backend = parser_backend
+        self.journal_indexer = create_journal_interpreter(self.retriever, parser_backend)
+        self.page_crawler = create_page_interpreter(self.retriever, parser_backend, progress_callback=progress_callback)
 
         self.postprocess_html = postprocess_html
         self.progress_callback = progress_callback
+        self.page_workers = page_workers
 
     def progress_update(self, percent):
         if self.progress_callback:
@@ -36,6 +60,9 @@ class DownloadJournal:
     def get_download_location(self, journal) -> str:
         return os.path.join(self.base_location, journal.journal_id)
 
+    def get_process_location(self, journal) -> str:
+        return os.path.join(self.process_location, journal.journal_id)
+
     def download_journal_url(self, url, from_page=0):
         try:
             # Retrieve the journal ID from the URL
@@ -44,6 +71,8 @@ class DownloadJournal:
         except Exception as exc:
             log_handler.log.exception('----> Error when processing journal {0}'.format(url))
             raise
+        finally:
+            self.retriever.close()
 
     def _download_journal_url(self, url, from_page):
 
@@ -59,61 +88,143 @@ class DownloadJournal:
         self.progress_update(percent=5)
         log_handler.log.info('Successfully retrieved journal index. Processing journal ID {0}'.format(journal_id))
 
-        local_journal_handler = LocalJournalHandler(base_path=self.base_location, journal_id=journal_id)
+        # Record everything completely written, so a restarted download can pick up where this one stopped
+        manifest = DownloadManifest(os.path.join(self.base_location, journal_id, DownloadManifest.MANIFEST_FILENAME))
+        local_journal_handler = LocalJournalHandler(base_path=self.base_location, journal_id=journal_id, manifest=manifest)
+        self.retriever.save_into(local_journal_handler)
+        processed_handler = self._prepare_processed_handler(journal_id) if self.process else None
 
-        # Retrieve the JS and CSS resources too
-        journal = self.journal_indexer.retrieve_js_css_resources(journal)
+        try:
+            with self._checkpoint_on_interrupt(manifest):
+                # Retrieve the JS and CSS resources too, unless an earlier run already has
+                if not manifest.is_complete(DownloadManifest.RESOURCES, journal_id):
+                    journal = self.journal_indexer.retrieve_js_css_resources(journal)
 
-        # Update progress
-        self.progress_update(percent=10)
-        log_handler.log.info('Successfully pulled JS and CSS resources')
+                # Update progress
+                self.progress_update(percent=10)
+                log_handler.log.info('Successfully pulled JS and CSS resources')
 
-        # Apply HTML post-processing for local browsability, if enabled
-        if self.postprocess_html:
-            self.html_postprocessor.postprocess_journal(journal)
+                # Apply HTML post-processing for local browsability, if enabled
+                if self.postprocess_html:
+                    self.html_postprocessor.postprocess_journal(journal)
 
-        # Save original sources and clear resources
-        journal.save_original_source(local_journal_handler)
-        journal.clear_resources()
+                # Save original sources and clear resources
+                journal.save_original_source(local_journal_handler)
+                if journal.has_js_css_resources(): manifest.record(DownloadManifest.RESOURCES, journal_id)
+                if processed_handler: journal.save_resources(processed_handler)
+                journal.clear_resources()
 
-        # Download all the table of contents
-        journal = self._process_journal(journal, local_journal_handler, from_page)
+                # Download all the table of contents
+                journal = self._process_journal(journal, local_journal_handler, from_page, processed_handler)
+
+                if processed_handler:
+                    self._complete_processing(journal, local_journal_handler, processed_handler)
+        finally:
+            manifest.close()
 
         self.progress_update(percent=100)
 
         return journal
 
-    def _process_journal(self, journal: Journal, local_journal_handler, from_page):
+    @contextmanager
+    def _checkpoint_on_interrupt(self, manifest: DownloadManifest):
+        # Signal handlers can only be installed from the main thread
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+
+        previous_handler = signal.getsignal(signal.SIGINT)
+
+        def checkpoint(signum, frame):
+            log_handler.log.warning('Interrupted - saving download checkpoint')
+            manifest.flush()
+            if callable(previous_handler):
+                previous_handler(signum, frame)
+            elif previous_handler != signal.SIG_IGN:
+                raise KeyboardInterrupt
+
+        signal.signal(signal.SIGINT, checkpoint)
+        try:
+            yield
+        finally:
+            signal.signal(signal.SIGINT, previous_handler if previous_handler is not None else signal.default_int_handler)
+
+    def _prepare_processed_handler(self, journal_id):
+        processed_handler = LocalJournalHandler(base_path=self.process_location, journal_id=journal_id)
+
+        # Ensure the output is clear, as processing from disk would
+        processed_handler.remove_directory('')
+        os.makedirs(self.process_location, exist_ok=True)
+        return processed_handler
+
+    def _complete_processing(self, journal: Journal, local_journal_handler, processed_handler):
+        # Pages downloaded by an earlier run weren't parsed this time, so read those back from disk
+        local_page_crawler = create_page_interpreter(LocalRetriever(local_journal_handler), self.parser_backend)
+        for toc in journal.toc:
+            if not toc.url or toc.has_page(): continue
+            if not local_journal_handler.file_exists(local_journal_handler.get_path(toc.original_id + '.html')):
+                log_handler.log.warning('Page {0} was not downloaded - leaving it out'.format(toc.original_id))
+                continue
+
+            page = local_page_crawler.retrieve_page(journal.journal_id, toc.original_id, None)
+            page = local_page_crawler.parse_page(page)
+            page.release_html()
+            page.save_resources(processed_handler)
+            page.clear_resources()
+            toc.set_page(page)
+
+        # Point the ToC at the saved pages, as it would be when processing the downloaded copy
+        for toc in journal.toc:
+            if not toc.url: continue
+            toc.url = '{0}.html'.format(toc.original_id) if self.postprocess_html else toc.url[len(self.retriever.base_url):]
+
+        journal.release_html()
+        log_handler.log.info('Serializing data for {0}'.format(journal.journal_id), extra={'journal_id': journal.journal_id})
+        processed_handler.serialize_and_save_journal(journal)
+
+    def _process_journal(self, journal: Journal, local_journal_handler, from_page, processed_handler=None):
         journal_id = journal.journal_id
 
         # Handle standard multi-page journals with a ToC
         if journal.toc:
             log_handler.log.info('Processing multiple pages for {0}'.format(journal_id))
-            # Iterate over all the retrieved pages and pull them separately.
-            page_num = 1
-
-            for toc in journal.toc:
+            toc_count = len(journal.toc)
 
+            # Work out which pages to pull first, so progress can count those already done
+            pending = []
+            for page_num, toc in enumerate(journal.toc, 1):
                 # Skip pages previously downloaded if specified
                 if page_num < from_page:
                     log_handler.log.info('Skipping page {0}'.format(page_num))
-                    page_num += 1
-                    continue
-
-                if toc.url:
-                    log_handler.log.info('Processing content {0} of {1}'.format(page_num, len(journal.toc)))
+                # Skip pages completed by an earlier run
+                elif local_journal_handler.is_saved(DownloadManifest.PAGE, toc.original_id):
+                    log_handler.log.info('Page {0} already downloaded'.format(page_num))
+                elif toc.url:
+                    pending.append((page_num, toc))
+
+            # Pages are retrieved on one thread, which spends most of its time waiting out the throttle,
+            # while parsing and saving the pages already retrieved happens on the pipeline's workers
+            def retrieve_pages():
+                for page_num, toc in pending:
+                    log_handler.log.info('Processing content {0} of {1}'.format(page_num, toc_count))
 
                     page = self.page_crawler.retrieve_page(journal_id, toc.original_id, toc.url)
                     toc.set_page(page)
+                    yield page_num, page
 
-                    # Calculate percentage per page, to keep consumers updated
-                    self.progress_update(((page_num / len(journal.toc)) * 80) + 10)
+            # Progress is only reported as pages are finished, so it never goes backwards
+            progress_lock = threading.Lock()
+            completed = [toc_count - len(pending)]
 
-                    self._process_page(toc.page, local_journal_handler)
+            def process_page(item):
+                page_num, page = item
+                self._process_page(page, local_journal_handler, processed_handler=processed_handler)
+                with progress_lock:
+                    completed[0] += 1
                     # Calculate percentage per page, to keep consumers updated
-                    self.progress_update((((page_num + 0.5) / len(journal.toc)) * 80) + 10)
+                    self.progress_update(((completed[0] / toc_count) * 80) + 10)
 
-                page_num += 1
+            PagePipeline(process_page, workers=self.page_workers).run(retrieve_pages)
         else:
             log_handler.log.warning('Processing single page for {0}'.format(journal_id))
 
@@ -124,7 +235,7 @@ class DownloadJournal:
             content_page = Page(journal_id=journal_id, original_id=journal_id, original_html=journal.original_html)
 
             # Process it as a normal page and add it to the ToC
-            content_page = self._process_page(content_page, local_journal_handler, single=True)
+            content_page = self._process_page(content_page, local_journal_handler, single=True, processed_handler=processed_handler)
             journal.add_single_page(content_page)
 
             # Calculate percentage per page, to keep consumers updated
@@ -133,7 +244,7 @@ class DownloadJournal:
         log_handler.log.info('Completed {0}'.format(journal_id), extra={'journal_id': journal_id})
         return journal
 
-    def _process_page(self, page: Page, local_journal_handler, single=False):
+    def _process_page(self, page: Page, local_journal_handler, single=False, processed_handler=None):
 
         # Process the page and associated pics and maps
         page = self.page_crawler.parse_page(page, single=single)
@@ -142,8 +253,19 @@ class DownloadJournal:
         if self.postprocess_html:
             self.html_postprocessor.postprocess_page(page)
 
-        # Save original source and newly formatted resources
+        # Save original source and newly formatted resources, leaving the HTML to be read back from the saved copy
         page.save_originals(local_journal_handler)
+        page.release_html()
+        complete = not page.has_missing_images()
+
+        # Build the processed resources straight from the parsed page, rather than parsing it again later
+        if processed_handler: page.save_resources(processed_handler)
+
         # Clear resources loaded into the page
         page.clear_resources()
+
+        # Only checkpoint pages with every image saved, so a restart retries any that failed
+        if complete and local_journal_handler.manifest:
+            local_journal_handler.manifest.record(DownloadManifest.PAGE, page.original_id)
+            local_journal_handler.manifest.flush()
         return page
@@ -1,12 +1,30 @@
+from concurrent.futures import ProcessPoolExecutor
 import os
 import bikesanity.io_utils.log_handler as log_handler
 from bikesanity.entities.journal import Journal
 from bikesanity.entities.page import Page
 from bikesanity.io_utils.local_journal import LocalJournalHandler
+from bikesanity.io_utils.parse_cache import ParseCache
 from bikesanity.services.retrievers import LocalRetriever, ExportRetriever
 
-from bikesanity.interpreter.journal_content import JournalContent
-from bikesanity.interpreter.page_interpreter import PageInterpreter
+from bikesanity.interpreter.parser_backends import ParserBackend, create_journal_interpreter, create_page_interpreter
+
+
+# Each worker process interprets pages with its own loader, set up once when the worker starts
+_worker_loader = None
+
+
+def _init_worker(input_location, output_location, journal_id, exported, parser_backend, use_cache):
+    global _worker_loader
+    _worker_loader = LoadDiskJournal(
+        input_location, output_location, journal_id, exported=exported, parser_backend=parser_backend,
+        use_cache=use_cache, clear_output=False
+    )
+
+
+def _process_page_in_worker(page_and_key):
+    page_id, cache_key = page_and_key
+    return _worker_loader._process_page(page_id, cache_key=cache_key)
 
 
 class LoadDiskJournal:
@@ -14,8 +32,19 @@ class LoadDiskJournal:
     DOWNLOAD_DIRECTORY = 'downloads'
     EXPORTED_DIRECTORY = 'exported'
     PROCESSED_DIRECTORY = 'processed'
+    CACHE_DIRECTORY = os.path.join('cache', 'parse')
+    RESOURCES_DIRECTORY = 'resources'
 
-    def __init__(self, input_location, output_location, journal_id, exported=False, progress_callback=None):
+    WORKERS = 1
+
+    def __init__(self, input_location, output_location, journal_id, exported=False, progress_callback=None,
+                 parser_backend=ParserBackend.BS4, workers=WORKERS, use_cache=True, clear_output=True):
+        # Kept to set up identical loaders in worker processes
+        self.location_args = (input_location, output_location, journal_id, exported, parser_backend, use_cache)
+        self.workers = max(1, workers)
+
+        # Keep a cache of interpreted pages, so reprocessing only interprets the pages that have changed
+        self.parse_cache = ParseCache(os.path.join(output_location, self.CACHE_DIRECTORY)) if use_cache else None
 
         self.input_location = os.path.join(input_location, self.EXPORTED_DIRECTORY if exported else self.DOWNLOAD_DIRECTORY)
         self.output_location = os.path.join(output_location, self.PROCESSED_DIRECTORY)
@@ -26,19 +55,41 @@ class LoadDiskJournal:
         self.output_handler = LocalJournalHandler(self.output_location, journal_id)
 
         # Ensure the output is clear
-        self.output_handler.remove_directory('')
+        if clear_output: self._clear_output()
         os.makedirs(self.output_location, exist_ok=True)
 
         self.retriever = ExportRetriever(self.input_handler) if exported else LocalRetriever(self.input_handler)
         self.outputter = LocalRetriever(self.output_handler)
 
-        self.journal_crawler = JournalContent(self.retriever)
-        self.page_crawler = PageInterpreter(self.retriever)
+        self.journal_crawler = create_journal_interpreter(self.retriever, parser_backend)
+        self.page_crawler = create_page_interpreter(self.retriever, parser_backend)
 
     def progress_update(self, percent):
         if self.progress_callback:
             self.progress_callback(progress=percent)
 
+    def _clear_output(self):
+        base_path = self.output_handler.get_base_path()
+        if not self.parse_cache or not os.path.isdir(base_path):
+            self.output_handler.remove_directory('')
+            return
+
+        # Cached pages refer to resources already saved, so keep those
+        for filename in os.listdir(base_path):
+            if filename == self.RESOURCES_DIRECTORY: continue
+            path = os.path.join(base_path, filename)
+            if os.path.isdir(path):
+                self.output_handler.remove_directory(filename)
+            else:
+                os.remove(path)
+
+    def _prune_resources(self, journal: Journal):
+        contents = [journal.cover_image] if journal.cover_image else []
+        for toc in journal.toc:
+            if toc.has_page(): contents.extend(toc.page.contents)
+        keep = {filename for content in contents for filename in self.output_handler.get_resource_filenames(content)}
+        self.output_handler.prune_resources(keep)
+
     def get_process_location(self):
         return self.output_handler.get_base_path()
 
@@ -58,14 +109,16 @@ class LoadDiskJournal:
 
             # Iterate over all the retrieved pages and pull them separately.
             page_count = 0
+            pages = self._iterate_processed_pages([toc.original_id for toc in journal.toc if toc.url])
             for toc in journal.toc:
                 if toc.url:
-                    page = self._process_page(toc.original_id)
+                    page = next(pages)
                     toc.set_page(page)
 
                 # Calculate percentage per page, to keep consumers updated
                 self.progress_update(((page_count / len(journal.toc)) * 80) + 10)
                 page_count += 1
+            pages.close()
 
         else:
             log_handler.log.warning('Processing single page for {0}'.format(journal_id))
@@ -75,9 +128,10 @@ class LoadDiskJournal:
 
             # Create a single new page and set with the title page html
             content_page = Page(journal_id=journal_id, original_id=journal_id, original_html=journal.original_html)
+            content_page.add_html_source(journal.html_source_path, journal.html_root)
 
             # Process it as a normal page and add it to the ToC
-            content_page = self._process_page(content_page, single=True)
+            content_page = self._interpret_page(content_page, single=True)
             journal.add_single_page(content_page)
             self.progress_update(percent=90)
 
@@ -85,7 +139,13 @@ class LoadDiskJournal:
         journal.save_resources(self.output_handler)
         journal.clear_resources()
 
-        # Finally serialize the parsed data structure and output
+        if self.parse_cache:
+            # Resources left from pages that have since changed are no longer needed
+            self._prune_resources(journal)
+            self.parse_cache.evict()
+
+        # Finally serialize the parsed data structure, with the raw HTML left where it was read from, and output
+        journal.release_html()
         log_handler.log.info('Serializing data for {0}'.format(journal_id), extra={'journal_id': journal_id})
         self.output_handler.serialize_and_save_journal(journal)
 
@@ -93,15 +153,72 @@ class LoadDiskJournal:
         log_handler.log.info('Completed {0}'.format(journal_id), extra={'journal_id': journal_id})
         return journal
 
-    def _process_page(self, page_id, single=False):
+    def _page_cache_key(self, page_id):
+        if not self.parse_cache: return None
+        sources = self.retriever.retrieve_page_sources(page_id)
+        if not sources: return None
+
+        source_parts = [part for filename, content in sources for part in (filename, content)]
+        return self.parse_cache.make_key(
+            type(self.page_crawler).__name__, self.page_crawler.INTERPRETER_VERSION, type(self.retriever).__name__,
+            self.journal_id, page_id, *source_parts
+        )
+
+    def _load_cached_page(self, cache_key):
+        entry = self.parse_cache.lookup(cache_key) if cache_key else None
+        if not entry: return None
+
+        # Only use the cached page if everything it saved is still in place
+        for filename in entry['resources']:
+            if not self.output_handler.file_exists(self.output_handler.get_resource_path(filename)): return None
+        return entry['page']
+
+    def _iterate_processed_pages(self, page_ids):
+        # Pages come back in the order given, whether cached or however many workers are interpreting them
+        cache_keys = {page_id: self._page_cache_key(page_id) for page_id in page_ids}
+        cached_pages = {page_id: self._load_cached_page(cache_keys[page_id]) for page_id in page_ids}
+        uncached = [(page_id, cache_keys[page_id]) for page_id in page_ids if cached_pages[page_id] is None]
+        if self.parse_cache:
+            log_handler.log.info('{0} of {1} pages unchanged since last processed'.format(
+                len(page_ids) - len(uncached), len(page_ids)
+            ))
+
+        processed = self._iterate_uncached_pages(uncached)
+        for page_id in page_ids:
+            yield cached_pages[page_id] if cached_pages[page_id] is not None else next(processed)
+        processed.close()
+
+    def _iterate_uncached_pages(self, pages_and_keys):
+        if self.workers == 1 or len(pages_and_keys) < 2:
+            for page_id, cache_key in pages_and_keys:
+                yield self._process_page(page_id, cache_key=cache_key)
+            return
+
+        log_handler.log.info('Processing {0} pages with {1} workers'.format(len(pages_and_keys), self.workers))
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=self.location_args) as executor:
+            yield from executor.map(_process_page_in_worker, pages_and_keys)
+
+    def _process_page(self, page_id, cache_key=None):
         log_handler.log.warning('Processing page {0} for {1}'.format(page_id, self.journal_id))
 
-        # Process the page and associated pics and maps
         page = self.page_crawler.retrieve_page(self.journal_id, page_id, None)
+        return self._interpret_page(page, cache_key=cache_key)
+
+    def _interpret_page(self, page: Page, single=False, cache_key=None):
+        # Process the page and associated pics and maps, after which the raw HTML is only needed on disk
         page = self.page_crawler.parse_page(page, single=single)
+        page.release_html()
 
         # Save locally and clear resources loaded into the page
         page.save_resources(self.output_handler)
+        # Pages missing images are left uncached, so the images are picked up once they appear
+        cacheable = cache_key and not page.has_missing_images()
         page.clear_resources()
 
+        if cacheable:
+            resources = [
+                filename for content in page.contents for filename in self.output_handler.get_saved_resource_filenames(content)
+            ]
+            self.parse_cache.store(cache_key, {'page': page, 'resources': resources})
+
         return page
@@ -0,0 +1,70 @@
+import os
+
+import bikesanity.io_utils.log_handler as log_handler
+from bikesanity.entities.journal import Journal
+from bikesanity.entities.page import Page
+from bikesanity.io_utils.local_journal import LocalJournalHandler
+from bikesanity.services.retrievers import LocalRetriever, ExportRetriever
+
+
+class MigrateJournal:
+    """
+    Rewrites a journal processed by an earlier version into the current form, with the raw HTML of the index
+    and every page dropped in favour of the files it was read from, saved relative to the journal's directory.
+    Anything whose HTML can't be found on disk any more keeps it, or where it was last read from, so nothing is lost.
+    """
+
+    DOWNLOAD_DIRECTORY = 'downloads'
+    EXPORTED_DIRECTORY = 'exported'
+    PROCESSED_DIRECTORY = 'processed'
+
+    def __init__(self, input_location, output_location, journal_id, exported=False):
+        self.journal_id = journal_id
+
+        input_location = os.path.join(input_location, self.EXPORTED_DIRECTORY if exported else self.DOWNLOAD_DIRECTORY)
+        self.input_handler = LocalJournalHandler(input_location, journal_id)
+        self.processed_handler = LocalJournalHandler(os.path.join(output_location, self.PROCESSED_DIRECTORY), journal_id)
+
+        self.retriever = ExportRetriever(self.input_handler) if exported else LocalRetriever(self.input_handler)
+
+    def get_process_location(self):
+        return self.processed_handler.get_base_path()
+
+    def _locate_page_sources(self, journal: Journal, page: Page):
+        # A single page journal's page is the index itself
+        if journal.single_page: return [self.retriever.locate_index()]
+
+        # Additional parts are saved numbered on from the page, as they are when downloaded
+        part_count = len(page.html_sources) - 1 if page.html_released else len(page.additional_html_pages)
+        part_ids = ['{0}_{1}'.format(page.original_id, part) for part in range(2, part_count + 2)]
+        return [self.retriever.locate_page(page_id) for page_id in [page.original_id] + part_ids]
+
+    def migrate_journal(self):
+        journal = self.processed_handler.load_serialized_journal()
+        if not journal:
+            log_handler.log.error('Failure to load any journal with ID {0} - have you processed it?'.format(self.journal_id))
+            return None
+
+        # HTML already dropped is found again too, as it was once saved as absolute paths that break when moved
+        root = self.retriever.locate_directory()
+        journal.set_html_source(self.retriever.locate_index(), root)
+        if not journal.release_html():
+            log_handler.log.warning('Index HTML for {0} not found - keeping it in the journal'.format(self.journal_id))
+
+        pages = [toc.page for toc in journal.toc if toc.has_page()]
+        for page in pages:
+            sources = self._locate_page_sources(journal, page)
+            if page.html_released and None in sources:
+                log_handler.log.warning('HTML for page {0} not found - leaving it where it was'.format(page.original_id))
+                continue
+
+            page.html_sources = []
+            for path in sources: page.add_html_source(path, root)
+            if not page.release_html():
+                log_handler.log.warning('HTML for page {0} not found - keeping it in the journal'.format(page.original_id))
+
+        self.processed_handler.serialize_and_save_journal(journal)
+        log_handler.log.info('Migrated {0}, with HTML left on disk for {1} of {2} pages'.format(
+            self.journal_id, len([page for page in pages if page.html_released]), len(pages)
+        ))
+        return journal
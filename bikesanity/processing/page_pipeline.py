@@ -0,0 +1,68 @@
+import queue
+import threading
+
+import bikesanity.io_utils.log_handler as log_handler
+
+
+class PagePipeline:
+    """
+    Runs a producer on its own thread, handing each item it yields through a bounded queue
+    to a small pool of consumer threads. The first error on either side stops the pipeline
+    and is raised again from run().
+    """
+
+    WORKERS = 2
+    QUEUE_SIZE = 4
+
+    _DONE = object()
+
+    def __init__(self, consumer, workers=WORKERS, queue_size=QUEUE_SIZE):
+        self.consumer = consumer
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+
+    def run(self, producer):
+        items = queue.Queue(maxsize=self.queue_size)
+        stopped = threading.Event()
+        errors = []
+
+        def fail(exc):
+            errors.append(exc)
+            stopped.set()
+
+        def produce():
+            try:
+                for item in producer():
+                    if stopped.is_set(): break
+                    items.put(item)
+            except Exception as exc:
+                log_handler.log.error('Pipeline producer failed: {0}'.format(exc))
+                fail(exc)
+            finally:
+                # Consumers keep draining until they see this, so these puts can't block forever
+                for _ in range(self.workers):
+                    items.put(self._DONE)
+
+        def consume():
+            while True:
+                item = items.get()
+                if item is self._DONE: return
+                # Once something has failed, drain without doing any more work
+                if stopped.is_set(): continue
+                try:
+                    self.consumer(item)
+                except Exception as exc:
+                    log_handler.log.error('Pipeline consumer failed: {0}'.format(exc))
+                    fail(exc)
+
+        threads = [threading.Thread(target=produce, name='page-producer', daemon=True)]
+        threads.extend(
+            threading.Thread(target=consume, name='page-consumer-{0}'.format(idx), daemon=True)
+            for idx in range(self.workers)
+        )
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors: raise errors[0]
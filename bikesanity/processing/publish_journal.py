@@ -35,24 +35,24 @@ class PublishJournal:
     def get_publication_location(self):
         return self.publication_location
 
-    def publish_journal_id(self, format: PublicationFormats, reduced=False, progress_callback=None):
-        # Load the journal by unpickling from the processed form
-        journal = self.input_handler.load_serialized_journal()
+    def publish_journal_id(self, format: PublicationFormats, reduced=False, progress_callback=None, map_tolerance=None):
+        # Load the journal from the processed form, reading each page in only as it's published
+        journal = self.input_handler.load_serialized_journal(lazy=True)
         if not journal:
             log_handler.log.error('Failure to load any journal with ID {0} - have you processed it?'.format(self.journal_id))
             return
 
         # Switch based on journal format required
         if format == PublicationFormats.TEMPLATED_HTML:
-            self.publish_journal_templated_html(journal, progress_callback)
+            self.publish_journal_templated_html(journal, progress_callback, map_tolerance)
         elif format == PublicationFormats.JSON_MODEL:
             self.export_json_model(journal, progress_callback)
         elif format == PublicationFormats.PDF:
             self.publish_pdf(journal, reduced, progress_callback)
 
 
-    def publish_journal_templated_html(self, journal: Journal, progress_callback=None):
-        templated_output = TemplatedHtmlOutput(self.output_handler, progress_callback)
+    def publish_journal_templated_html(self, journal: Journal, progress_callback=None, map_tolerance=None):
+        templated_output = TemplatedHtmlOutput(self.output_handler, progress_callback, map_tolerance=map_tolerance)
         templated_output.output_journal(journal)
         self.publication_location = self.output_handler.get_html_path('index.html')
 
@@ -1,5 +1,29 @@
 
-const addMap = function (mapDivId, mapResourceUrl) {
+const decodePolyline = function (encoded, precision) {
+  // Each coordinate is a delta from the last, written five bits to a character with a sign bit shifted in
+  let factor = Math.pow(10, precision);
+  let points = [];
+  let index = 0, lat = 0, lng = 0;
+
+  const decodeValue = function () {
+    let result = 0, shift = 0, byte;
+    do {
+      byte = encoded.charCodeAt(index++) - 63;
+      result |= (byte & 0x1f) << shift;
+      shift += 5;
+    } while (byte >= 0x20);
+    return (result & 1) ? ~(result >> 1) : (result >> 1);
+  };
+
+  while (index < encoded.length) {
+    lat += decodeValue();
+    lng += decodeValue();
+    points.push([lat / factor, lng / factor]);
+  }
+  return points;
+}
+
+const addMap = function (mapDivId, mapTrack) {
 
   let map = L.map(mapDivId);
 
@@ -7,15 +31,25 @@ const addMap = function (mapDivId, mapResourceUrl) {
     attribution: 'Map data &copy; <a href="http://www.osm.org">OpenStreetMap</a>'
   }).addTo(map);
 
-  new L.GPX(mapResourceUrl, {
-    async: true,
-    marker_options: {
-      startIconUrl: null,
-      endIconUrl: null,
-      shadowUrl: null
-    }
-  })
-    .on('loaded', function(e) {
-      map.fitBounds(e.target.getBounds());
-    }).addTo(map);
+  if (typeof mapTrack === 'string') {
+    // GPX without any track in it that could be encoded
+    new L.GPX(mapTrack, {
+      async: true,
+      marker_options: {
+        startIconUrl: null,
+        endIconUrl: null,
+        shadowUrl: null
+      }
+    })
+      .on('loaded', function(e) {
+        map.fitBounds(e.target.getBounds());
+      }).addTo(map);
+    return;
+  }
+
+  let segments = mapTrack.polylines.map(function (encoded) {
+    return decodePolyline(encoded, mapTrack.precision);
+  });
+  let track = L.polyline(segments).addTo(map);
+  map.fitBounds(track.getBounds());
 }
@@ -6,14 +6,23 @@ import os
 from pathlib import Path
 import click
 
+from bikesanity.interpreter.parser_backends import ParserBackend
 from bikesanity.io_utils.log_handler import init_logging, log
+from bikesanity.io_utils.parse_cache import ParseCache
+from bikesanity.io_utils.throttled import HostRateLimiters
 
 from bikesanity.processing.download_journal import DownloadJournal
+from bikesanity.processing.download_batch import DownloadBatch
+from bikesanity.processing.benchmark_tracks import BenchmarkTracks
+from bikesanity.processing.compare_parsers import CompareParsers
 from bikesanity.processing.load_disk_journal import LoadDiskJournal
+from bikesanity.processing.migrate_journal import MigrateJournal
 from bikesanity.processing.publish_journal import PublishJournal, PublicationFormats
+from bikesanity.services.retrievers import DownloadingRetriever
 
 
 BASE_DIRECTORY = 'CycleSanityJournals'
+PARSER_CHOICES = click.Choice([backend.value for backend in ParserBackend])
 
 base_path = os.path.join(Path.home(), BASE_DIRECTORY)
 
@@ -29,37 +38,80 @@ def run():
 @click.option('--location', default=None, help="Custom download location for journal files")
 @click.option('--no-local-readability-postprocessing', is_flag=True, help="Interpret journal content and process resources")
 @click.option('--from-page', default=0, help="Pick up a download from the specified page")
-def download(journal_link, do_process=False, location=None, no_local_readability_postprocessing=False, from_page=0):
+@click.option('--image-workers', default=DownloadingRetriever.IMAGE_WORKERS, help="Number of images to download concurrently")
+@click.option('--throttle-state', default=None, help="Share request throttling with other downloads through this state file")
+@click.option('--no-cache', is_flag=True, help="Don't read or write the local cache of downloaded responses")
+@click.option('--parser', type=PARSER_CHOICES, default=ParserBackend.BS4.value, help="HTML parser backend used to interpret the journal")
+def download(journal_link, do_process=False, location=None, no_local_readability_postprocessing=False, from_page=0,
+             image_workers=DownloadingRetriever.IMAGE_WORKERS, throttle_state=None, no_cache=False,
+             parser=ParserBackend.BS4.value):
     log.info('Starting download task...')
 
     download_path = location if location else base_path
-    journal = None
 
-    # Download the journal
+    # Download the journal, processing it along the way if requested
     try:
-        journal_downloader = DownloadJournal(download_path, postprocess_html=not no_local_readability_postprocessing)
+        journal_downloader = DownloadJournal(
+            download_path, postprocess_html=not no_local_readability_postprocessing, image_workers=image_workers,
+            rate_limiter=HostRateLimiters(throttle_state).for_url(DownloadingRetriever.BASE_URL), use_cache=not no_cache,
+            process=do_process, parser_backend=ParserBackend(parser)
+        )
         journal = journal_downloader.download_journal_url(journal_link, from_page)
 
         log.info('Completed download task! Journal downloaded to {0}'.format(journal_downloader.get_download_location(journal)))
+        if do_process:
+            log.info('Processed journal available in {0}'.format(journal_downloader.get_process_location(journal)))
     except Exception:
         log.exception('Critical error on downloading journal')
 
-    if do_process and journal:
-        process(journal.journal_id, location)
+
+@run.command()
+@click.argument('journal_list', type=click.Path(exists=True, dir_okay=False))
+@click.option('--location', default=None, help="Custom download location for journal files")
+@click.option('--no-local-readability-postprocessing', is_flag=True, help="Interpret journal content and process resources")
+@click.option('--journal-workers', default=DownloadBatch.JOURNAL_WORKERS, help="Number of journals to download at once")
+@click.option('--image-workers', default=DownloadingRetriever.IMAGE_WORKERS, help="Number of images to download concurrently for each journal")
+@click.option('--throttle-state', default=None, help="Share request throttling with other downloads through this state file")
+@click.option('--no-cache', is_flag=True, help="Don't read or write the local cache of downloaded responses")
+@click.option('--parser', type=PARSER_CHOICES, default=ParserBackend.BS4.value, help="HTML parser backend used to interpret the journals")
+def download_batch(journal_list, location=None, no_local_readability_postprocessing=False,
+                   journal_workers=DownloadBatch.JOURNAL_WORKERS, image_workers=DownloadingRetriever.IMAGE_WORKERS,
+                   throttle_state=None, no_cache=False, parser=ParserBackend.BS4.value):
+    download_path = location if location else base_path
+
+    try:
+        urls = DownloadBatch.read_journal_urls(journal_list)
+        log.info('Starting batch download of {0} journals...'.format(len(urls)))
+
+        batch_downloader = DownloadBatch(
+            download_path, postprocess_html=not no_local_readability_postprocessing, journal_workers=journal_workers,
+            image_workers=image_workers, use_cache=not no_cache, throttle_state=throttle_state,
+            parser_backend=ParserBackend(parser)
+        )
+        batch_downloader.download_journal_urls(urls)
+    except Exception:
+        log.exception('Critical error on batch downloading journals')
 
 
 @run.command()
 @click.argument('journal_id')
 @click.option('--input-location', default=None, help="Custom download location of journal")
 @click.option('--output-location', default=None, help="Custom output for processed journals")
-def process(journal_id, input_location=None, output_location=None):
+@click.option('--parser', type=PARSER_CHOICES, default=ParserBackend.BS4.value, help="HTML parser backend used to interpret the journal")
+@click.option('--workers', default=LoadDiskJournal.WORKERS, help="Number of processes interpreting pages at once")
+@click.option('--no-cache', is_flag=True, help="Interpret every page again rather than reusing unchanged ones")
+def process(journal_id, input_location=None, output_location=None, parser=ParserBackend.BS4.value,
+            workers=LoadDiskJournal.WORKERS, no_cache=False):
     log.info('Processing journal id {0}'.format(journal_id))
 
     input_path = input_location if input_location else base_path
     output_path = output_location if output_location else base_path
 
     try:
-        journal_processor = LoadDiskJournal(input_path, output_path, journal_id, exported=False)
+        journal_processor = LoadDiskJournal(
+            input_path, output_path, journal_id, exported=False, parser_backend=ParserBackend(parser), workers=workers,
+            use_cache=not no_cache
+        )
         journal = journal_processor.load_journal_from_disk()
         log.info('Completed processing task! Processed journal available in {0}'.format(journal_processor.get_process_location()))
 
@@ -72,14 +124,21 @@ def process(journal_id, input_location=None, output_location=None):
 @click.argument('journal_id')
 @click.option('--location', help="Custom location of exported journal")
 @click.option('--output-location', default=None, help="Custom output for processed journals")
-def process_exported(journal_id, location, output_location):
+@click.option('--parser', type=PARSER_CHOICES, default=ParserBackend.BS4.value, help="HTML parser backend used to interpret the journal")
+@click.option('--workers', default=LoadDiskJournal.WORKERS, help="Number of processes interpreting pages at once")
+@click.option('--no-cache', is_flag=True, help="Interpret every page again rather than reusing unchanged ones")
+def process_exported(journal_id, location, output_location, parser=ParserBackend.BS4.value, workers=LoadDiskJournal.WORKERS,
+                     no_cache=False):
     log.info('Processing previously exported journal {0}'.format(journal_id))
 
     input_path = location if location else base_path
     output_path = output_location if output_location else base_path
 
     try:
-        journal_processor = LoadDiskJournal(input_path, output_path, journal_id, exported=True)
+        journal_processor = LoadDiskJournal(
+            input_path, output_path, journal_id, exported=True, parser_backend=ParserBackend(parser), workers=workers,
+            use_cache=not no_cache
+        )
         journal = journal_processor.load_journal_from_disk()
         log.info('Completed processing task! Processed journal available in {0}'.format(journal_processor.get_process_location()))
 
@@ -96,7 +155,8 @@ def process_exported(journal_id, location, output_location):
 @click.option('--pdf', is_flag=True, default=False, help="Export as PDF")
 @click.option('--reduced', is_flag=True, default=False, help="Create a PDF with reduced image and text size")
 @click.option('--epub', is_flag=True, default=False, help="Export as EPUB")
-def publish(journal_id, input_location, output_location, html, json, pdf, reduced, epub):
+@click.option('--simplify-maps', type=float, default=None, help="Show HTML maps with tracks simplified to within this many metres")
+def publish(journal_id, input_location, output_location, html, json, pdf, reduced, epub, simplify_maps=None):
     input_path = input_location if input_location else base_path
     output_path = output_location if output_location else base_path
 
@@ -113,7 +173,7 @@ def publish(journal_id, input_location, output_location, html, json, pdf, reduce
         journal_publisher = PublishJournal(input_path, output_path, journal_id)
 
         if html:
-            journal_publisher.publish_journal_id(PublicationFormats.TEMPLATED_HTML)
+            journal_publisher.publish_journal_id(PublicationFormats.TEMPLATED_HTML, map_tolerance=simplify_maps)
             log.info('Completed publishing to HTML! Published journal available in {0}'.format(journal_publisher.get_publication_location()))
         if json:
             journal_publisher.publish_journal_id(PublicationFormats.JSON_MODEL)
@@ -125,6 +185,60 @@ def publish(journal_id, input_location, output_location, html, json, pdf, reduce
     except Exception:
         log.exception('Critical error on publishing journal')
 
+@run.command()
+@click.argument('journal_id')
+@click.option('--input-location', default=None, help="Custom download location of journal")
+@click.option('--output-location', default=None, help="Custom output for processed journals")
+@click.option('--exported', is_flag=True, default=False, help="The journal was processed from an export")
+def migrate(journal_id, input_location=None, output_location=None, exported=False):
+    log.info('Migrating processed journal id {0}'.format(journal_id))
+
+    input_path = input_location if input_location else base_path
+    output_path = output_location if output_location else base_path
+
+    try:
+        journal_migrator = MigrateJournal(input_path, output_path, journal_id, exported=exported)
+        if journal_migrator.migrate_journal():
+            log.info('Completed migration! Processed journal available in {0}'.format(journal_migrator.get_process_location()))
+
+    except Exception:
+        log.exception('Critical error on migrating journal')
+
+
+@run.command()
+@click.option('--location', default=None, help="Custom output location of processed journals")
+def clear_parse_cache(location=None):
+    cache_path = os.path.join(location if location else base_path, LoadDiskJournal.CACHE_DIRECTORY)
+    removed = ParseCache(cache_path).clear()
+    log.info('Cleared {0} cached pages from {1}'.format(removed, cache_path))
+
+
+@run.command()
+@click.argument('journal_ids', nargs=-1)
+@click.option('--location', default=None, help="Custom location of downloaded journals")
+@click.option('--exported', is_flag=True, default=False, help="Compare previously exported journals")
+@click.option('--candidate', type=PARSER_CHOICES, default=ParserBackend.LXML.value, help="Parser backend timed against bs4")
+def compare_parsers(journal_ids, location=None, exported=False, candidate=ParserBackend.LXML.value):
+    input_path = location if location else base_path
+
+    # Times the backends on real journals - parity itself is checked by the tests, against their fixtures
+    comparer = CompareParsers(input_path, exported=exported, candidate=candidate)
+    comparer.compare_journals(list(journal_ids))
+
+
+@run.command()
+@click.option('--location', default=None, help="Custom location of processed journals")
+@click.option('--points', type=int, default=BenchmarkTracks.GENERATED_POINTS, help="Points in the generated track, or 0 for none")
+@click.option('--repeat', type=int, default=BenchmarkTracks.REPEAT, help="Times each track is built, keeping the fastest")
+def benchmark_tracks(location=None, points=BenchmarkTracks.GENERATED_POINTS, repeat=BenchmarkTracks.REPEAT):
+    input_path = location if location else base_path
+
+    timings = BenchmarkTracks(input_path, repeat=repeat).run(generated_points=points)
+    mismatched = [timing for timing in timings if not timing.matches]
+    if mismatched:
+        raise click.ClickException('Fast GPX differs from gpxpy on {0} of {1} tracks'.format(len(mismatched), len(timings)))
+
+
 @run.command()
 def version():
     print('BikeSanity script v1.1.6')
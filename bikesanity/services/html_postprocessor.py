@@ -3,6 +3,7 @@ import re
 from bikesanity.entities.content_blocks import Image
 from bikesanity.entities.journal import Journal
 from bikesanity.entities.page import Page
+from .page_html_rewriter import PageHtmlRewriter
 
 
 class HtmlPostProcessor:
@@ -39,6 +40,12 @@ class HtmlPostProcessor:
 
 
     def postprocess_page_html(self, page: Page, page_html):
+        # Make every rewrite in one pass where the page allows it, as one pass per image is slow on big pages
+        rewritten_html = PageHtmlRewriter(page).rewrite(page_html)
+        if rewritten_html is not None: return rewritten_html.encode()
+        return self.postprocess_page_html_sequentially(page, page_html)
+
+    def postprocess_page_html_sequentially(self, page: Page, page_html):
         # Fix JS and CSS links
         page_html = self.fix_js_css_links(page_html)
 
@@ -0,0 +1,323 @@
+"""
+Reads lxml.html trees the way BeautifulSoup reads the same document through its lxml builder, so that an
+interpreter built on lxml sees exactly the text, children and structure the BeautifulSoup one does.
+"""
+
+from bs4.dammit import EncodingDetector
+from lxml import etree
+from lxml import html as lxml_html
+
+
+# Whitespace-only strings are collapsed to a single character, except inside these
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+# Strings inside these are kept out of the text of the elements around them
+STRING_CONTAINER_TAGS = {'rt', 'rp', 'style', 'script', 'template'}
+# Attributes holding a whitespace-separated list of values
+LIST_ATTRIBUTES = {
+    '*': {'class', 'accesskey', 'dropzone'},
+    'a': {'rel', 'rev'},
+    'link': {'rel', 'rev'},
+    'td': {'headers'},
+    'th': {'headers'},
+    'form': {'accept-charset'},
+    'object': {'archive'},
+    'area': {'rel'},
+    'icon': {'sizes'},
+    'iframe': {'sandbox'},
+    'output': {'for'},
+}
+
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+
+class SoupString(str):
+    """A string between elements, with the details BeautifulSoup would attach to it"""
+
+    def __new__(cls, value, comment=False, container=None):
+        string = super().__new__(cls, value)
+        string.comment = comment
+        string.container = container
+        return string
+
+    def get_text(self):
+        # Comments and strings inside scripts, styles and so on have no text of their own
+        return str(self) if not self.comment and self.container is None else ''
+
+
+def _parse(markup, encoding=None):
+    parser = lxml_html.HTMLParser(recover=True, encoding=encoding)
+    parser.feed(markup)
+    try:
+        root = parser.close()
+    except etree.XMLSyntaxError:
+        root = None
+    # Nothing at all in the document
+    return root if root is not None else lxml_html.Element('html')
+
+
+def parse_document(html):
+    """Parse HTML into a tree, decoding bytes with the same encoding BeautifulSoup would choose"""
+    if isinstance(html, str):
+        try:
+            return _parse(html)
+        except ValueError:
+            # Unicode strings with an encoding declaration are rejected, so parse the encoded form instead
+            return _parse(html.encode('utf8'), 'utf8')
+
+    detector = EncodingDetector(html, is_html=True)
+    for encoding in detector.encodings:
+        try:
+            return _parse(detector.markup, encoding)
+        except (UnicodeDecodeError, LookupError, etree.ParserError):
+            continue
+    raise ValueError('Unable to parse document in any encoding')
+
+
+FEED_CHUNK_SIZE = 64 * 1024
+
+
+def _feed(markup, target, encoding=None):
+    parser = etree.HTMLParser(target=target, recover=True, encoding=encoding)
+    # Fed a chunk at a time, so the parser never holds its own copy of the whole document
+    for position in range(0, len(markup), FEED_CHUNK_SIZE):
+        parser.feed(markup[position:position + FEED_CHUNK_SIZE])
+    return parser.close()
+
+
+def parse_events(html, create_target):
+    """
+    Feed HTML through a parser target instead of building a tree, decoding it as parse_document does. This
+    is how BeautifulSoup reads documents too, and unlike a tree it isn't cut short by deeply nested tags.
+    A new target is created for each attempt, and whatever the one that succeeds returns on close is returned.
+    """
+    if isinstance(html, str):
+        try:
+            return _feed(html, create_target())
+        except ValueError:
+            return _feed(html.encode('utf8'), create_target(), 'utf8')
+
+    detector = EncodingDetector(html, is_html=True)
+    for encoding in detector.encodings:
+        try:
+            return _feed(detector.markup, create_target(), encoding)
+        except (UnicodeDecodeError, LookupError, etree.ParserError):
+            continue
+    raise ValueError('Unable to parse document in any encoding')
+
+
+class SoupTarget:
+    """
+    Base for parser targets given to parse_events. Strings are split, collapsed and classed as BeautifulSoup
+    does, and handed to add_string with the kind of string they are: a comment, the innermost container they
+    are in, or None for plain text. Subclasses see elements through start_element and end_element.
+    """
+
+    COMMENT = 'comment'
+
+    def __init__(self):
+        self.open_tags = []
+        self.string_containers = []
+        self.preserved = 0
+        self.pending = []
+
+    def _end_data(self, kind=None):
+        if not self.pending: return
+        value = ''.join(self.pending)
+        self.pending = []
+
+        # Whitespace-only strings are collapsed, outside <pre> and the like
+        if not self.preserved and not value.strip(ASCII_SPACES): value = '\n' if '\n' in value else ' '
+        if kind is None and self.string_containers: kind = self.string_containers[-1]
+        self.add_string(value, kind)
+
+    def start(self, tag, attrib):
+        self._end_data()
+        self.open_tags.append(tag)
+        if tag in STRING_CONTAINER_TAGS: self.string_containers.append(tag)
+        if tag in PRESERVE_WHITESPACE_TAGS: self.preserved += 1
+        self.start_element(tag, attrib)
+
+    def end(self, tag):
+        self._end_data()
+        tag = self.open_tags.pop()
+        if tag in STRING_CONTAINER_TAGS: self.string_containers.pop()
+        if tag in PRESERVE_WHITESPACE_TAGS: self.preserved -= 1
+        self.end_element(tag)
+
+    def data(self, data):
+        self.pending.append(data)
+
+    def comment(self, text):
+        self._end_data()
+        self.pending.append(text)
+        self._end_data(self.COMMENT)
+
+    def pi(self, target, data):
+        self._end_data()
+        self.pending.append(target + ' ' + data)
+        self._end_data(self.COMMENT)
+
+    def close(self):
+        self._end_data()
+        return self.result()
+
+    def start_element(self, tag, attrib):
+        pass
+
+    def end_element(self, tag):
+        pass
+
+    def add_string(self, value, kind):
+        pass
+
+    def result(self):
+        return None
+
+
+def is_element(node):
+    return not isinstance(node, str) and isinstance(node.tag, str)
+
+
+def string_state(elem):
+    # Whether whitespace is preserved inside this element, and the innermost container of its strings
+    preserve, container = False, None
+    while elem is not None:
+        if elem.tag in PRESERVE_WHITESPACE_TAGS: preserve = True
+        if container is None and elem.tag in STRING_CONTAINER_TAGS: container = elem.tag
+        elem = elem.getparent()
+    return preserve, container
+
+
+def collapse(value, preserve):
+    if preserve or value.strip(ASCII_SPACES): return value
+    return '\n' if '\n' in value else ' '
+
+
+def children(elem, unwrap=()):
+    """The element's children as BeautifulSoup lists them, optionally with some tags unwrapped in place"""
+    preserve, container = string_state(elem)
+    items = []
+
+    def add_children(parent):
+        if parent.text: items.append(SoupString(collapse(parent.text, preserve), container=container))
+        for child in parent:
+            if is_element(child) and child.tag in unwrap:
+                add_children(child)
+            elif is_element(child):
+                items.append(child)
+            else:
+                items.append(SoupString(child.text or '', comment=True))
+            if child.tail: items.append(SoupString(collapse(child.tail, preserve), container=container))
+
+    add_children(elem)
+    return items
+
+
+def next_sibling(elem):
+    following = children(elem.getparent())
+    index = next(idx for idx, item in enumerate(following) if item is elem)
+    return following[index + 1] if index + 1 < len(following) else None
+
+
+def string(elem):
+    """The single string inside an element, or None if it holds anything else"""
+    contents = children(elem)
+    if len(contents) != 1: return None
+    return contents[0] if isinstance(contents[0], str) else string(contents[0])
+
+
+def get_text(elem, replace=None):
+    """
+    The element's text, leaving out comments and strings in scripts and the like. Any descendants named in
+    replace are read as the string their function returns for them instead.
+    """
+    if isinstance(elem, str): return elem.get_text()
+
+    preserve, container = string_state(elem)
+    wanted = container if elem.tag in STRING_CONTAINER_TAGS else None
+    parts = []
+
+    def add_text(parent, preserve, container):
+        if parent.text and container == wanted: parts.append(collapse(parent.text, preserve))
+        for child in parent:
+            if not is_element(child):
+                pass
+            elif replace and child.tag in replace:
+                # Replacement strings are plain text wherever they are
+                if wanted is None: parts.append(replace[child.tag](child))
+            else:
+                add_text(
+                    child,
+                    preserve or child.tag in PRESERVE_WHITESPACE_TAGS,
+                    child.tag if child.tag in STRING_CONTAINER_TAGS else container
+                )
+            if child.tail and container == wanted: parts.append(collapse(child.tail, preserve))
+
+    add_text(elem, preserve, container)
+    return ''.join(parts)
+
+
+def attributes(elem):
+    values = {}
+    for name, value in elem.attrib.items():
+        is_list = name in LIST_ATTRIBUTES['*'] or name in LIST_ATTRIBUTES.get(elem.tag, ())
+        values[name] = value.split() if is_list else value
+    return values
+
+
+def equal(elem, other, breaks_replaced=False):
+    """
+    Structural equality of two elements, as BeautifulSoup compares tags. With breaks_replaced, <br>s in the
+    first element are read as the newline strings they would have been replaced with.
+    """
+    if elem.tag != other.tag or attributes(elem) != attributes(other): return False
+
+    contents, other_contents = children(elem), children(other)
+    if len(contents) != len(other_contents): return False
+
+    for item, other_item in zip(contents, other_contents):
+        if breaks_replaced and is_element(item) and item.tag == 'br': item = '\n'
+        if is_element(item) != is_element(other_item): return False
+        if is_element(item):
+            if not equal(item, other_item, breaks_replaced): return False
+        elif str(item) != str(other_item):
+            return False
+    return True
+
+
+def find(elem, tag):
+    """The first descendant with this tag, if any"""
+    return next(elem.iterdescendants(tag), None)
+
+
+def is_attached(elem):
+    # Removed elements, and everything in them, are cut off from the document root
+    top = elem
+    while top.getparent() is not None:
+        top = top.getparent()
+    return top is elem.getroottree().getroot()
+
+
+def parent(elem):
+    """The element's parent, or None once it or an ancestor has been removed"""
+    return elem.getparent() if is_attached(elem) else None
+
+
+def remove(elem):
+    """Remove an element, leaving the text that follows it in place"""
+    parent_elem = elem.getparent()
+    if parent_elem is None: return
+    if elem.tail:
+        previous = elem.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + elem.tail
+        else:
+            parent_elem.text = (parent_elem.text or '') + elem.tail
+    parent_elem.remove(elem)
+
+
+def clear(elem):
+    """Remove everything inside an element, keeping its attributes and the text that follows it"""
+    for child in list(elem):
+        elem.remove(child)
+    elem.text = None
@@ -2,15 +2,17 @@ from typing import Dict
 import json
 from io import BytesIO
 from bs4 import BeautifulSoup
+from lxml import etree
 import gpxpy
 import gpxpy.gpx
 
+import bikesanity.services.lxml_tree as lxml_tree
 
 
 class MapExtractor:
     def __init__(self, elem=None):
         self.docs = []
-        if elem: self.docs.append(elem)
+        if elem is not None: self.docs.append(elem)
 
     def add_doc(self, html):
         self.docs.append(BeautifulSoup(html, features="lxml"))
@@ -22,6 +24,63 @@ class MapExtractor:
                 yield map_data_elem.text
 
 
+class LxmlMapExtractor(MapExtractor):
+
+    MAP_DATA_DIVS = etree.XPath(".//div[starts-with(@id, 'map') and substring(@id, string-length(@id) - 3) = 'data']")
+
+    def add_doc(self, html):
+        self.docs.append(lxml_tree.parse_document(html))
+
+    def iterate_map_data(self):
+        for doc in self.docs:
+            for map_data_elem in self.MAP_DATA_DIVS(doc):
+                yield lxml_tree.get_text(map_data_elem)
+
+
+class GpxWriter:
+    """
+    Writes a track as GPX text directly, byte for byte as gpxpy serializes the same track, but without a
+    gpxpy object for every point - long tracks have tens of thousands of them.
+    """
+
+    HEADER = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx xmlns="http://www.topografix.com/GPX/1/1" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd" '
+        'version="1.1" creator="gpx.py -- https://github.com/tkrajina/gpxpy">\n'
+        '  <trk>\n'
+        '    <name>Track</name>'
+    )
+    SEGMENT_START = '\n    <trkseg>'
+    SEGMENT_END = '\n    </trkseg>'
+    POINT = '\n      <trkpt lat="%s" lon="%s">\n      </trkpt>'
+    FOOTER = '\n  </trk>\n</gpx>'
+
+    def __init__(self):
+        self.parts = [self.HEADER]
+
+    @staticmethod
+    def format_coordinate(value):
+        # As gpxpy writes them: missing coordinates as 0, and floats never in scientific notation
+        value = value or 0
+        if isinstance(value, float):
+            text = str(value)
+            return text if 'e' not in text else format(value, '.10f').rstrip('0').rstrip('.')
+        return str(value)
+
+    def add_segment(self, lats, lngs):
+        points = ''.join([self.POINT % (lat or 0, lng or 0) for lat, lng in zip(lats, lngs)])
+        # Scientific notation and True both have an 'e', where the markup around them has none
+        if 'e' in points:
+            points = ''.join([
+                self.POINT % (self.format_coordinate(lat), self.format_coordinate(lng)) for lat, lng in zip(lats, lngs)
+            ])
+        self.parts.extend((self.SEGMENT_START, points, self.SEGMENT_END))
+
+    def to_xml(self):
+        return ''.join(self.parts + [self.FOOTER])
+
+
 class LineExtractor:
     def __init__(self, map_data: str):
         self.raw_data = map_data
@@ -38,7 +97,7 @@ class LineExtractor:
         gpx_segment = gpxpy.gpx.GPXTrackSegment()
 
         # Add all the points from this poorly thought-out data structure
-        if 'lngs' not in polyline or 'lats' not in polyline or len(polyline['lngs']) != len(polyline['lats']): return None
+        if not self.is_valid_polyline(polyline): return None
         for lat, long in zip(polyline['lats'], polyline['lngs']):
             point = gpxpy.gpx.GPXTrackPoint(latitude=lat, longitude=long)
             gpx_segment.points.append(point)
@@ -56,7 +115,7 @@ class LineExtractor:
         gpx_track.name = 'Track'
         gpx.tracks.append(gpx_track)
 
-        if 'polylines' not in self.line: return gpx
+        if 'polylines' not in self.line: return self.serialize_gpx(gpx)
 
         # Iterate over all the "polylines", and add them as separate track segment
         for polyline in self.line['polylines']:
@@ -65,6 +124,16 @@ class LineExtractor:
 
         return self.serialize_gpx(gpx)
 
+    def is_valid_polyline(self, polyline: Dict):
+        return 'lngs' in polyline and 'lats' in polyline and len(polyline['lngs']) == len(polyline['lats'])
+
+    def generate_gpx_fast(self):
+        # The same GPX as generate_gpx, written straight from the coordinate lists
+        gpx_writer = GpxWriter()
+        for polyline in self.line.get('polylines', []):
+            if self.is_valid_polyline(polyline): gpx_writer.add_segment(polyline['lats'], polyline['lngs'])
+        return gpx_writer.to_xml()
+
     def generate_map_binary_data(self):
-        gpx_xml = self.generate_gpx()
+        gpx_xml = self.generate_gpx_fast()
         return BytesIO(gpx_xml.encode()) if gpx_xml else None, BytesIO(self.raw_data.encode()) if self.raw_data else None
@@ -0,0 +1,144 @@
+import re
+
+from bikesanity.entities.content_blocks import Image
+from bikesanity.entities.page import Page
+
+
+class PageHtmlRewriter:
+    """
+    Makes all of HtmlPostProcessor's rewrites to a page - script and stylesheet links, multipage part links,
+    the map basemap and image links - in one scan of the HTML, looking images up by path as they are reached.
+    The output is what applying the rewrites one after another gives. The few layouts where one rewrite can
+    swallow what another would have changed, such as two image links on the same line, aren't rewritten -
+    including lines that only become the same line once an image link broken over lines is joined up.
+    """
+
+    LITERALS = {
+        '<script src="/javascript': '<script src="javascript',
+        "<script src='/javascript": "<script src='javascript",
+        '<script type="text/javascript" src="/javascript': '<script type="text/javascript" src="javascript',
+        '<link rel="stylesheet" href="/css/': '<link rel="stylesheet" href="css/',
+        "<link href='/css": "<link href='css",
+        '"basemap":"stadia"': '"basemap":"osm"',
+    }
+    NEXT_PART = '>>> <A HREF="'
+    PREVIOUS_PART = '<<< <A HREF="'
+    LINK = '<a href="'
+    IMAGE = '<img src="/'
+
+    # Links are matched without their quote, as it could also start a basemap
+    TOKENS = re.compile('(?P<literal>{0})|(?P<next>{1})|(?P<previous>{2})|(?P<link>{3})|(?P<image>{4})'.format(
+        '|'.join(re.escape(literal) for literal in LITERALS),
+        re.escape(NEXT_PART), re.escape(PREVIOUS_PART), re.escape(LINK[:-1]) + '(?=")', re.escape(IMAGE)
+    ))
+    NUMBERED_LINK_END = re.compile(r'.*?(\d+)">')
+    LINK_END = re.compile(r'.*?">')
+    NUMBERED_END = re.compile(r'\d">')
+
+    # Characters that would let a rewrite reach into another
+    UNSAFE_PATH_CHARACTERS = '\\\n"<>'
+
+    def __init__(self, page: Page):
+        self.page_id = '{0}'.format(page.original_id)
+        self.images = [content for content in page.contents if isinstance(content, Image)]
+
+        # The first image in the page to have each small path, as that's the one that rewrites it
+        self.image_paths = {}
+        for position, image in reversed(list(enumerate(self.images))):
+            self.image_paths[image.original_path_small] = (position, image)
+        self.image_path_lengths = sorted({len(path) for path in self.image_paths})
+
+    def is_rewritable(self):
+        if '\\' in self.page_id: return False
+        for image in self.images:
+            paths = image.original_path_small + image.original_path_fullsize
+            if image.original_path_small.startswith('/') or any(char in paths for char in self.UNSAFE_PATH_CHARACTERS):
+                return False
+        return True
+
+    def find_image(self, src):
+        # Images are matched by the start of the source, so there may be more than one; the first in the page wins
+        found = None
+        for length in self.image_path_lengths:
+            if length > len(src): break
+            candidate = self.image_paths.get(src[:length])
+            if candidate and (not found or candidate[0] < found[0]): found = candidate
+        return found[1] if found else None
+
+    def rewrite(self, html):
+        """The rewritten HTML, or None if it can't be rewritten in one scan"""
+        if not self.is_rewritable(): return None
+
+        out = []
+        position = 0
+        # The first link on the line of the last one, as (position, index in the output), which image links start from
+        line_link, last_link_position = None, None
+        last_image_line = -1
+        # Starts of the lines an image was on when its link ended on an earlier line, as rewriting joins them
+        joined_lines = set()
+
+        while True:
+            match = self.TOKENS.search(html, position)
+            if not match: break
+            start, end = match.span()
+            out.append(html[position:start])
+            position = end
+
+            if match.lastgroup == 'literal':
+                out.append(self.LITERALS[match.group()])
+
+            elif match.lastgroup == 'next':
+                part_match = self.NUMBERED_LINK_END.match(html, end)
+                if part_match:
+                    out.append('{0}{1}_{2}.html">'.format(self.NEXT_PART, self.page_id, part_match.group(1)))
+                    position = part_match.end()
+                else:
+                    out.append(html[start])
+                    position = start + 1
+
+            elif match.lastgroup == 'previous':
+                part_match = self.LINK_END.match(html, end)
+                if part_match:
+                    # Anything numbered after the link on its line would be swallowed into it as a part number
+                    line_end = html.find('\n', part_match.end())
+                    if html.find(self.NEXT_PART, end, part_match.end()) != -1: return None
+                    if self.NUMBERED_END.search('{0}.html">'.format(self.page_id)): return None
+                    if self.NUMBERED_END.search(html, part_match.end(), line_end if line_end != -1 else len(html)): return None
+                    out.append('{0}{1}.html">'.format(self.PREVIOUS_PART, self.page_id))
+                    position = part_match.end()
+                else:
+                    out.append(html[start])
+                    position = start + 1
+
+            elif match.lastgroup == 'link':
+                if line_link is None or html.find('\n', last_link_position, start) != -1: line_link = (start, len(out))
+                last_link_position = start
+                out.append(match.group())
+
+            else:
+                out.append(match.group())
+                src_end = html.find('"', end)
+                if src_end == -1 or html.find('\n', end, src_end) != -1: continue
+                src = html[end:src_end]
+                image = self.find_image(src)
+                if not image: continue
+
+                # The image must directly follow the end of a link
+                link_end = start
+                while link_end > 0 and html[link_end - 1].isspace(): link_end -= 1
+                if html[link_end - 2:link_end] != '">': continue
+
+                line_start = html.rfind('\n', 0, link_end - 2) + 1
+                if line_start == last_image_line or line_start in joined_lines or '<' in src or '>' in src: return None
+                last_image_line = line_start
+
+                if not line_link or line_link[0] < line_start or line_link[0] + len(self.LINK) > link_end - 2: continue
+                if html.find('\n', link_end, start) != -1: joined_lines.add(html.rfind('\n', 0, start) + 1)
+
+                # Replace everything from the link on, leaving the closing quote to be read on from
+                del out[line_link[1]:]
+                out.append('<a href="{0}"><img src="{1}'.format(image.original_path_fullsize, image.original_path_small))
+                position = src_end
+
+        out.append(html[position:])
+        return ''.join(out)
@@ -1,8 +1,12 @@
 import io
 import os
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
 
+from bikesanity.entities.content_blocks import Image
 from bikesanity.io_utils import log_handler
+from bikesanity.io_utils.download_manifest import DownloadManifest
 from bikesanity.io_utils.plain_session import PlainSession
 from bikesanity.io_utils.throttled import ThrottledSession
 
@@ -27,28 +31,80 @@ class BaseRetriever(ABC):
     def retrieve_image_small(self, path, error_message='{0}'):
         return self.retrieve_image_large(path, error_message)
 
+    def retrieve_image(self, path_small, path_fullsize, caption) -> Image:
+        pic_small = self.retrieve_image_small(path_small)
+        pic_fullsize = self.retrieve_image_large(path_fullsize)
+        return Image(path_small, path_fullsize, caption, pic_small, pic_fullsize)
+
+    def submit_image(self, path_small, path_fullsize, caption) -> Future:
+        # By default retrieve immediately, and hand back an already resolved future
+        future = Future()
+        try:
+            future.set_result(self.retrieve_image(path_small, path_fullsize, caption))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    def retrieve_page_sources(self, original_id):
+        # The saved HTML a page is interpreted from, where it is already on disk
+        return None
+
+    def locate_directory(self):
+        # The directory of the journal being read, which where its files are is saved relative to
+        return None
+
+    def locate_index(self):
+        # The file the index is read from, where it is already on disk
+        return None
+
+    def locate_page(self, original_id):
+        # The file a page is read from, where it is already on disk
+        return None
+
+    def retrieve_index_record(self, key):
+        # The header fields and ToC entries read before from the index with this key, where saved alongside it
+        return None
+
+    def save_index_record(self, key, header, entries):
+        pass
+
     def retrieve_js(self, path):
         pass
 
     def retrieve_css(self, path):
         pass
 
+    def close(self):
+        pass
+
 
 class DownloadingRetriever(BaseRetriever):
 
     BASE_URL = 'https://www.crazyguyonabike.com'
 
-    def __init__(self):
+    IMAGE_WORKERS = 8
+
+    def __init__(self, image_workers=IMAGE_WORKERS, rate_limiter=None, response_cache=None):
         super().__init__(self.BASE_URL)
+        self.image_workers = max(1, image_workers)
+        self.rate_limiter = rate_limiter
+        self.response_cache = response_cache
+        self.local_handler = None
         self.session = self._get_working_session(throttled=True)
-        self.fast_session = self._get_working_session(throttled=False)
+        self.fast_session = self._get_working_session(throttled=False, pool_maxsize=self.image_workers)
+
+        # Images are unthrottled, so fetch them through a bounded pool sharing the fast session - started
+        # with each download's first image, and shut down when the download is done
+        self.image_pool = None
+        self._image_pool_lock = threading.Lock()
 
-    def _get_working_session(self, throttled=True):
+    def _get_working_session(self, throttled=True, pool_maxsize=None):
         session = None
         while not session:
             try:
                 log_handler.log.warning('Attempting to create new session')
-                session = ThrottledSession() if throttled else PlainSession()
+                session = ThrottledSession(self.rate_limiter, response_cache=self.response_cache) if throttled \
+                    else PlainSession(pool_maxsize=pool_maxsize, response_cache=self.response_cache)
                 session.connect_session()
             except Exception as exc:
                 log_handler.log.warning('Session creation failure - retrying: {0}'.format(exc))
@@ -75,25 +131,67 @@ class DownloadingRetriever(BaseRetriever):
             log_handler.log.error(error_message.format(exc))
             raise
 
+    def save_into(self, local_handler):
+        # Once the journal's location is known, binaries are streamed straight into it, and
+        # images saved by an earlier run are read back from disk rather than downloaded again
+        self.local_handler = local_handler
+
+    def _local_path(self, path):
+        local_path = path.split('?')[0]
+        if local_path.startswith('/'): local_path = local_path[1:]
+        return local_path
+
+    def _saved_image_path(self, path):
+        if not self.local_handler: return None
+        local_path = self._local_path(path)
+        return local_path if self.local_handler.is_saved(DownloadManifest.IMAGE, local_path) else None
+
     def retrieve_image_large(self, path, error_message="{0}"):
         try:
+            saved_path = self._saved_image_path(path)
+            if saved_path:
+                return self.local_handler.get_image_binary(saved_path)
+
             url = self.base_url + path
-            return self.download_binary(self.fast_session, url)
+            return self.download_binary(self.fast_session, url, self._local_path(path))
         except Exception as exc:
             log_handler.log.warn(error_message.format(exc))
 
+    def submit_image(self, path_small, path_fullsize, caption) -> Future:
+        with self._image_pool_lock:
+            if not self.image_pool:
+                self.image_pool = ThreadPoolExecutor(max_workers=self.image_workers, thread_name_prefix='image-download')
+            return self.image_pool.submit(self.retrieve_image, path_small, path_fullsize, caption)
+
+    def close(self):
+        with self._image_pool_lock:
+            image_pool, self.image_pool = self.image_pool, None
+        if image_pool: image_pool.shutdown(wait=True)
+
     def retrieve_js(self, path):
-        url = self.base_url + '/javascript/' + path
-        return self.download_binary(self.fast_session, url)
+        return self._retrieve_resource(self.base_url + '/javascript/' + path, os.path.join('javascript', path))
 
     def retrieve_css(self, path):
-        url = self.base_url + '/css/' + path
-        return self.download_binary(self.fast_session, url)
+        return self._retrieve_resource(self.base_url + '/css/' + path, os.path.join('css', path))
+
+    def _retrieve_resource(self, url, local_path):
+        # A missing script or stylesheet only spoils local browsing, so carry on without it
+        try:
+            return self.download_binary(self.fast_session, url, local_path)
+        except Exception as exc:
+            log_handler.log.warning('Unable to retrieve {0}: {1}'.format(url, exc))
+            return None
 
-    def download_binary(self, session, url):
+    def download_binary(self, session, url, local_path=None):
         try:
             log_handler.log.info("Downloading {0}".format(url))
             with session.make_stream_request(url) as response:
+                # Never save an error page in place of the file, or record it as downloaded
+                if response.status_code != 200:
+                    raise RuntimeError('Status {0} downloading {1}'.format(response.status_code, url))
+                # Stream to the final location where there is one, so the content is never held in memory
+                if self.local_handler and local_path:
+                    return self.local_handler.output_stream_to_file(self.local_handler.get_path(local_path), response.raw)
                 bin_bytes = io.BytesIO(response.raw.read())
             return bin_bytes
         except Exception as exc:
@@ -101,8 +199,6 @@ class DownloadingRetriever(BaseRetriever):
             raise
 
 
-
-
 class LocalRetriever(BaseRetriever):
 
     def __init__(self, local_handler):
@@ -118,6 +214,24 @@ class LocalRetriever(BaseRetriever):
         except Exception as exc:
             log_handler.log.error(error_message.format(exc))
 
+    def retrieve_page_sources(self, original_id):
+        return self.local_handler.get_page_sources(original_id)
+
+    def locate_directory(self):
+        return self.local_handler.get_base_path()
+
+    def locate_index(self):
+        return self.local_handler.find_html_page_id('index')
+
+    def locate_page(self, original_id):
+        return self.local_handler.find_html_page_id(original_id)
+
+    def retrieve_index_record(self, key):
+        return self.local_handler.get_index_record(key)
+
+    def save_index_record(self, key, header, entries):
+        self.local_handler.save_index_record(key, header, entries)
+
     def retrieve_image_large(self, path, error_message="{0}"):
         try:
             # Remove any trailing querystrings from the url, or leading slashes
@@ -147,6 +261,24 @@ class ExportRetriever(BaseRetriever):
         except Exception as exc:
             log_handler.log.error(error_message.format(exc))
 
+    def retrieve_page_sources(self, original_id):
+        return self.local_handler.get_page_sources(original_id, additional_path='small/page')
+
+    def locate_directory(self):
+        return self.local_handler.get_base_path()
+
+    def locate_index(self):
+        return self.local_handler.find_html_page_id('index', additional_path='small')
+
+    def locate_page(self, original_id):
+        return self.local_handler.find_html_page_id(original_id, additional_path='small/page')
+
+    def retrieve_index_record(self, key):
+        return self.local_handler.get_index_record(key, additional_path='small')
+
+    def save_index_record(self, key, header, entries):
+        self.local_handler.save_index_record(key, header, entries, additional_path='small')
+
     def retrieve_image_large(self, path, error_message='{0}'):
         try:
             # Take just the filename
@@ -0,0 +1,114 @@
+from bs4.dammit import EncodingDetector
+from lxml import etree
+
+import bikesanity.services.lxml_tree as lxml_tree
+
+
+class StreamingDocument:
+    """
+    An HTML document parsed a chunk at a time, only as far as its reader needs. The tree reads just as the one
+    lxml_tree.parse_document builds, but it grows as more is read, so a reader can work through it from
+    the top and remove whatever it has finished with. Tracked tags are noted in document order as they start.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, html, tracked_tags=(), chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.started = {tag: [] for tag in tracked_tags}
+        self.position = 0
+        self.ended = False
+        self.markup, self.parser = self._create_parser(html, tuple(tracked_tags))
+
+    def _create_parser(self, html, tracked_tags):
+        if isinstance(html, str):
+            encodings, markup = [None], html
+        else:
+            # Decode bytes with the same encoding BeautifulSoup would choose
+            detector = EncodingDetector(html, is_html=True)
+            encodings, markup = detector.encodings, detector.markup
+
+        for encoding in encodings:
+            try:
+                parser = etree.HTMLPullParser(events=('start',), tag=tracked_tags or None, recover=True, encoding=encoding)
+            except LookupError:
+                continue
+            return markup, parser
+        raise ValueError('Unable to parse document in any encoding')
+
+    def read_more(self):
+        """Parse the next chunk of the document, returning False once it has all been read"""
+        if self.ended: return False
+
+        chunk = self.markup[self.position:self.position + self.chunk_size]
+        self.position += len(chunk)
+        if chunk:
+            self.parser.feed(chunk)
+        else:
+            try:
+                self.parser.close()
+            except etree.XMLSyntaxError:
+                pass
+            self.ended = True
+
+        for _, elem in self.parser.read_events():
+            if elem.tag in self.started: self.started[elem.tag].append(elem)
+        # Drop removed elements, so holding on to them doesn't keep what they were removed with in memory
+        for tag, elems in self.started.items():
+            self.started[tag] = [elem for elem in elems if lxml_tree.is_attached(elem)]
+        return True
+
+    def read_until(self, condition):
+        while not condition() and self.read_more():
+            pass
+
+    def is_closed(self, elem):
+        # An element is complete once something after it, or after one of its ancestors, has started
+        if self.ended: return True
+        while elem is not None:
+            if elem.getnext() is not None: return True
+            elem = elem.getparent()
+        return False
+
+    def iterate_started(self, tag):
+        """Each element with a tracked tag, as it starts, that is still in the document when reached"""
+        while True:
+            self.read_until(lambda: self.started[tag])
+            if not self.started[tag]: return
+            elem = self.started[tag].pop(0)
+            if lxml_tree.is_attached(elem): yield elem
+
+    def find(self, elem, tag):
+        """The first descendant with a tracked tag, as lxml_tree.find would give once it has all been read"""
+        while True:
+            for candidate in self.started[tag]:
+                if lxml_tree.is_attached(candidate) and any(ancestor is elem for ancestor in candidate.iterancestors()):
+                    return candidate
+            if not self.read_more(): return None
+
+    def iterate_children(self, elem):
+        """
+        The element's children as lxml_tree.children lists them, each one given once it is complete. Those
+        already given are removed as the next is asked for, unless that would change how strings are read.
+        """
+        preserve, container = lxml_tree.string_state(elem)
+        # Strings in removed children can't see the ancestors that preserve or contain them
+        free = not preserve and container is None
+
+        self.read_until(lambda: len(elem) or self.is_closed(elem))
+        if elem.text: yield lxml_tree.SoupString(lxml_tree.collapse(elem.text, preserve), container=container)
+
+        index = 0
+        while True:
+            # A child and the string after it are complete once the next one has started
+            self.read_until(lambda: len(elem) > index + 1 or self.is_closed(elem))
+            if len(elem) <= index: return
+
+            child = elem[index]
+            yield child if lxml_tree.is_element(child) else lxml_tree.SoupString(child.text or '', comment=True)
+            if child.tail: yield lxml_tree.SoupString(lxml_tree.collapse(child.tail, preserve), container=container)
+
+            if free:
+                elem.remove(child)
+            else:
+                index += 1
@@ -0,0 +1,75 @@
+from lxml import etree
+
+from .track_simplifier import TrackSimplifier
+
+
+class EncodedTrack:
+    def __init__(self, polylines, precision, original_points, points):
+        self.polylines = polylines
+        self.precision = precision
+        self.original_points = original_points
+        self.points = points
+
+    def to_payload(self):
+        return {'precision': self.precision, 'polylines': self.polylines}
+
+
+class TrackEncoder:
+    """
+    Reads the track segments out of GPX and encodes each as a Google encoded polyline: the deltas between
+    successive points, at a fixed precision, written five bits to a character. This is a small fraction of the
+    size of the GPX, and browsers can decode it without parsing any XML. Tracks can be simplified on the way.
+    """
+
+    # Decimal places kept - five is about a metre
+    PRECISION = 5
+
+    SEGMENTS = etree.XPath("//*[local-name() = 'trkseg']")
+    SEGMENT_POINTS = etree.XPath("*[local-name() = 'trkpt']")
+
+    def __init__(self, precision=PRECISION, simplify_tolerance=None):
+        self.precision = precision
+        self.track_simplifier = TrackSimplifier(simplify_tolerance) if simplify_tolerance else None
+
+    def read_segments(self, gpx):
+        """The (lat, lng) points of each track segment in the GPX"""
+        root = etree.fromstring(gpx.encode('utf8') if isinstance(gpx, str) else gpx)
+        segments = []
+        for segment in self.SEGMENTS(root):
+            points = []
+            for point_elem in self.SEGMENT_POINTS(segment):
+                try:
+                    points.append((float(point_elem.attrib['lat']), float(point_elem.attrib['lon'])))
+                except (KeyError, ValueError):
+                    continue
+            segments.append(points)
+        return segments
+
+    def encode_value(self, value):
+        # Shift in a sign bit, then write out five bits at a time, lowest first, each flagged if more follow
+        value = ~(value << 1) if value < 0 else value << 1
+        chars = []
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+        return ''.join(chars)
+
+    def encode_points(self, points):
+        factor = 10 ** self.precision
+        encoded = []
+        previous_lat, previous_lng = 0, 0
+        for lat, lng in points:
+            lat, lng = int(round(lat * factor)), int(round(lng * factor))
+            encoded.append(self.encode_value(lat - previous_lat))
+            encoded.append(self.encode_value(lng - previous_lng))
+            previous_lat, previous_lng = lat, lng
+        return ''.join(encoded)
+
+    def encode_gpx(self, gpx) -> EncodedTrack:
+        segments = [points for points in self.read_segments(gpx) if points]
+        original_points = sum(len(points) for points in segments)
+        if self.track_simplifier: segments = [self.track_simplifier.simplify(points) for points in segments]
+
+        polylines = [self.encode_points(points) for points in segments]
+        return EncodedTrack(polylines, self.precision, original_points, sum(len(points) for points in segments))
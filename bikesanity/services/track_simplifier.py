@@ -0,0 +1,58 @@
+import math
+
+
+class TrackSimplifier:
+    """
+    Reduces the points of a track with Douglas-Peucker, dropping every point that lies within the tolerance
+    (in metres) of the line drawn through the points kept around it. Fine for display, but the original
+    track is the one to keep.
+    """
+
+    EARTH_RADIUS = 6371000
+
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+
+    def project(self, points):
+        # Equirectangular projection to metres, which is close enough over the span of a single track
+        mean_lat = math.radians(sum(lat for lat, _ in points) / len(points))
+        x_scale = self.EARTH_RADIUS * math.cos(mean_lat) * math.pi / 180
+        y_scale = self.EARTH_RADIUS * math.pi / 180
+        return [(lng * x_scale, lat * y_scale) for lat, lng in points]
+
+    def simplify_points(self, points):
+        """Indices of the (lat, lng) points to keep"""
+        if len(points) < 3: return list(range(len(points)))
+
+        projected = self.project(points)
+        tolerance_squared = self.tolerance * self.tolerance
+        keep = [False] * len(points)
+        keep[0] = keep[-1] = True
+
+        # Spans are worked through from a stack, as long tracks would recurse too deep
+        spans = [(0, len(points) - 1)]
+        while spans:
+            first, last = spans.pop()
+            start_x, start_y = projected[first]
+            span_x, span_y = projected[last][0] - start_x, projected[last][1] - start_y
+            span_squared = span_x * span_x + span_y * span_y
+
+            furthest, furthest_squared = None, 0
+            for idx in range(first + 1, last):
+                x, y = projected[idx]
+                # Distance to the nearest point on the span, rather than to the infinite line through it
+                along = ((x - start_x) * span_x + (y - start_y) * span_y) / span_squared if span_squared else 0
+                along = 0 if along < 0 else 1 if along > 1 else along
+                off_x, off_y = start_x + along * span_x - x, start_y + along * span_y - y
+                distance_squared = off_x * off_x + off_y * off_y
+                if distance_squared > furthest_squared: furthest, furthest_squared = idx, distance_squared
+
+            if furthest is not None and furthest_squared > tolerance_squared:
+                keep[furthest] = True
+                spans.append((first, furthest))
+                spans.append((furthest, last))
+
+        return [idx for idx, kept in enumerate(keep) if kept]
+
+    def simplify(self, points):
+        return [points[idx] for idx in self.simplify_points(points)]
@@ -0,0 +1,104 @@
+import hashlib
+import http.server
+import os
+import threading
+import urllib.parse
+
+import pytest
+
+from bikesanity.io_utils.rate_limiter import TokenBucketRateLimiter
+from bikesanity.processing.download_journal import DownloadJournal
+from bikesanity.services.retrievers import DownloadingRetriever
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'downloads')
+
+
+class JournalSite(http.server.ThreadingHTTPServer):
+    """Serves a downloaded journal back as the site it was downloaded from, recording every request"""
+
+    daemon_threads = True
+
+    def __init__(self, journal_id):
+        super().__init__(('127.0.0.1', 0), JournalSiteHandler)
+        self.journal_id = journal_id
+        self.root = os.path.join(FIXTURES, journal_id)
+        self.requests = []
+        # Paths answered with an error status instead
+        self.failures = {}
+        self.extra_headers = {}
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{0}'.format(self.server_address[1])
+
+    @property
+    def journal_url(self):
+        return '{0}/doc/?o=1&doc_id={1}'.format(self.base_url, self.journal_id)
+
+    def requested(self, path):
+        return [request for request in self.requests if urllib.parse.urlparse(request).path == path]
+
+
+class JournalSiteHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        site = self.server
+        site.requests.append(self.path)
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+
+        if url.path in site.failures: return self.send_body(b'error', status=site.failures[url.path])
+        if url.path.startswith('/javascript/') or url.path.startswith('/css/'):
+            return self.send_body('/* {0} */'.format(url.path).encode())
+
+        if url.path.startswith('/doc/page/'):
+            filename = '{0}{1}.html'.format(100 + int(query['p'][0]), '_' + query['part'][0] if 'part' in query else '')
+        elif url.path.startswith('/doc/'):
+            filename = 'index.html'
+        else:
+            filename = url.path.lstrip('/')
+
+        path = os.path.join(site.root, filename)
+        if not os.path.isfile(path): return self.send_body(b'not found', status=404)
+        with open(path, 'rb') as handle:
+            body = handle.read()
+
+        etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_body(body, etag=etag)
+
+    def send_body(self, body, status=200, etag=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if etag: self.send_header('ETag', etag)
+        for name, value in self.server.extra_headers.items(): self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def journal_site(monkeypatch):
+    site = JournalSite('12345')
+    thread = threading.Thread(target=site.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(DownloadingRetriever, 'BASE_URL', site.base_url)
+    yield site
+    site.shutdown()
+    site.server_close()
+
+
+@pytest.fixture
+def make_downloader(tmp_path):
+    # Downloads from the journal site without waiting between requests
+    def make(**kwargs):
+        kwargs.setdefault('rate_limiter', TokenBucketRateLimiter(0))
+        return DownloadJournal(str(tmp_path), **kwargs)
+    return make
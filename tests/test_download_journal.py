@@ -0,0 +1,112 @@
+import os
+import shutil
+import stat
+
+from bikesanity.io_utils.download_manifest import DownloadManifest
+from bikesanity.io_utils.local_journal import LocalJournalHandler
+
+
+def test_downloader_can_be_reused(journal_site, make_downloader):
+    downloader = make_downloader(use_cache=False)
+    first = downloader.download_journal_url(journal_site.journal_url)
+
+    # Starting over, so every image is downloaded again
+    shutil.rmtree(downloader.get_download_location(first))
+    second = downloader.download_journal_url(journal_site.journal_url)
+
+    assert second.journal_id == '12345'
+    assert os.path.isfile(os.path.join(downloader.get_download_location(second), 'pics', 'large', 'p1.jpg'))
+
+
+def test_progress_only_increases(journal_site, make_downloader):
+    reported = []
+
+    def progress_callback(progress=None):
+        # Page interpreters call back without a percentage as they work through content
+        if progress is not None: reported.append(progress)
+
+    downloader = make_downloader(use_cache=False, page_workers=3, progress_callback=progress_callback)
+
+    downloader.download_journal_url(journal_site.journal_url)
+
+    assert reported == sorted(reported)
+    assert reported[-1] == 100
+    # One report per page of the table of contents, as each is finished
+    assert len([progress for progress in reported if 10 < progress < 100]) == 3
+
+
+def load_manifest(downloader, journal):
+    manifest = DownloadManifest(os.path.join(downloader.get_download_location(journal), DownloadManifest.MANIFEST_FILENAME))
+    manifest.close()
+    return manifest
+
+
+def test_failed_image_is_retried_on_resume(journal_site, make_downloader):
+    journal_site.failures['/pics/large/p5.jpg'] = 404
+    downloader = make_downloader(use_cache=False)
+    journal = downloader.download_journal_url(journal_site.journal_url)
+
+    # The error page isn't saved as the image, and neither the image nor its page count as downloaded
+    image_path = os.path.join(downloader.get_download_location(journal), 'pics', 'large', 'p5.jpg')
+    assert not os.path.exists(image_path)
+    manifest = load_manifest(downloader, journal)
+    assert not manifest.is_complete(DownloadManifest.IMAGE, 'pics/large/p5.jpg')
+    assert not manifest.is_complete(DownloadManifest.PAGE, '102')
+    assert manifest.is_complete(DownloadManifest.PAGE, '101')
+
+    del journal_site.failures['/pics/large/p5.jpg']
+    journal_site.requests.clear()
+    make_downloader(use_cache=False).download_journal_url(journal_site.journal_url)
+
+    assert journal_site.requested('/pics/large/p5.jpg')
+    assert not journal_site.requested('/pics/large/p1.jpg')
+    with open(image_path, 'rb') as handle:
+        assert handle.read() == b'large picture 5\n'
+    assert load_manifest(downloader, journal).is_complete(DownloadManifest.PAGE, '102')
+
+
+def test_failed_resources_are_not_recorded(journal_site, make_downloader):
+    journal_site.failures['/css/leaflet.css'] = 404
+    downloader = make_downloader(use_cache=False)
+    journal = downloader.download_journal_url(journal_site.journal_url)
+
+    assert not load_manifest(downloader, journal).is_complete(DownloadManifest.RESOURCES, '12345')
+    assert not os.path.exists(os.path.join(downloader.get_download_location(journal), 'css', 'leaflet.css'))
+
+
+def test_downloaded_files_have_the_usual_mode(journal_site, make_downloader, tmp_path):
+    probe = tmp_path / 'probe'
+    probe.write_bytes(b'')
+    usual_mode = stat.S_IMODE(os.stat(str(probe)).st_mode)
+
+    downloader = make_downloader(use_cache=False, process=True)
+    journal = downloader.download_journal_url(journal_site.journal_url)
+
+    for path in [
+        os.path.join(downloader.get_download_location(journal), 'pics', 'large', 'p1.jpg'),
+        os.path.join(downloader.get_download_location(journal), 'javascript', 'leaflet.js'),
+        os.path.join(downloader.get_process_location(journal), 'resources', journal.cover_image.get_fullsize_resource_path()),
+    ]:
+        assert stat.S_IMODE(os.stat(path).st_mode) == usual_mode, path
+
+
+def move_library(tmp_path):
+    # Everything downloaded and processed moves to another directory together
+    moved = tmp_path / 'moved'
+    for directory in ['downloads', 'processed']: shutil.move(str(tmp_path / directory), str(moved / directory))
+    return moved
+
+
+def test_processed_journal_reads_its_html_after_moving(journal_site, make_downloader, tmp_path):
+    downloader = make_downloader(use_cache=False, process=True)
+    journal = downloader.download_journal_url(journal_site.journal_url)
+    moved = move_library(tmp_path)
+
+    loaded = LocalJournalHandler(str(moved / 'processed'), journal.journal_id).load_serialized_journal(lazy=True)
+    download_location = moved / 'downloads' / journal.journal_id
+    assert loaded.original_html == (download_location / 'index.html').read_bytes()
+
+    first_page = loaded.toc[0].page
+    assert first_page.html_sources == ['101.html', '101_2.html']
+    assert first_page.original_html == (download_location / '101.html').read_bytes()
+    assert first_page.additional_html_pages == [(download_location / '101_2.html').read_bytes()]
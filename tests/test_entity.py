@@ -0,0 +1,43 @@
+import pickle
+
+import pytest
+
+from bikesanity.entities.content_blocks import Image, Map, TextBlock
+from bikesanity.entities.page import Page
+
+
+def test_page_round_trips_through_pickle():
+    page = Page('12345', '101', None)
+    image = Image('pics/small/p1.jpg', 'pics/large/p1.jpg', 'caption', None, None)
+    image.resource_small = 'ab/abcdef.jpg'
+    page.contents = [TextBlock(['text']), image, Map('9', 'map caption')]
+
+    loaded = pickle.loads(pickle.dumps(page, pickle.HIGHEST_PROTOCOL))
+
+    assert [type(content) for content in loaded.contents] == [TextBlock, Image, Map]
+    assert loaded.contents[1].get_fields() == image.get_fields()
+    assert loaded.contents[2].get_fields() == page.contents[2].get_fields()
+
+
+def test_unversioned_image_and_map_are_named_by_id():
+    # Pickled as a dict before entities were versioned, with resources saved under the entity's ID
+    image = Image.__new__(Image)
+    image.__setstate__({
+        'image_id': 'abc', 'original_path_small': 'pics/small/p1.jpg', 'original_path_fullsize': 'pics/large/p1.jpg',
+        'extension': 'jpg', 'caption': 'caption', 'image_small': None, 'image_fullsize': None
+    })
+    assert image.get_small_resource_path() == 'abc.small.jpg'
+    assert image.get_fullsize_resource_path() == 'abc.jpg'
+
+    map_block = Map.__new__(Map)
+    map_block.__setstate__({
+        'map_id': 'def', 'original_id': '9', 'caption': 'caption', 'gpx_data': None, 'json_data': None, 'original_url': None
+    })
+    assert map_block.get_resource_path() == 'def.gpx'
+    assert map_block.get_json_resource_path() == 'def.json'
+
+
+def test_newer_version_is_refused():
+    image = Image.__new__(Image)
+    with pytest.raises(ValueError):
+        image.__setstate__((Image.VERSION + 1, {}))
@@ -0,0 +1,44 @@
+import os
+import shutil
+
+from bikesanity.io_utils.local_journal import LocalJournalHandler
+from bikesanity.processing.load_disk_journal import LoadDiskJournal
+from bikesanity.processing.migrate_journal import MigrateJournal
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'downloads')
+
+
+def process_journal(location, journal_id):
+    shutil.copytree(os.path.join(FIXTURES, journal_id), str(location / 'downloads' / journal_id))
+    LoadDiskJournal(str(location), str(location), journal_id, use_cache=False).load_journal_from_disk()
+    return LocalJournalHandler(str(location / 'processed'), journal_id)
+
+
+def test_single_page_journal_reads_its_html_after_moving(tmp_path):
+    process_journal(tmp_path / 'library', '777')
+    shutil.move(str(tmp_path / 'library'), str(tmp_path / 'moved'))
+
+    journal = LocalJournalHandler(str(tmp_path / 'moved' / 'processed'), '777').load_serialized_journal()
+    index_html = (tmp_path / 'moved' / 'downloads' / '777' / 'index.html').read_bytes()
+    assert journal.html_source == 'index.html'
+    assert journal.original_html == index_html
+    assert journal.toc[0].page.original_html == index_html
+
+
+def test_migrate_saves_absolute_sources_relative(tmp_path):
+    processed_handler = process_journal(tmp_path, '12345')
+
+    # As saved by the version that first left the HTML on disk
+    journal = processed_handler.load_serialized_journal()
+    journal.html_source, journal.html_directory = journal.html_source_path, None
+    for toc in journal.toc:
+        if toc.has_page(): toc.page.html_sources = toc.page.html_source_paths
+    processed_handler.serialize_and_save_journal(journal)
+    assert os.path.isabs(processed_handler.load_serialized_journal().toc[0].page.html_sources[0])
+
+    MigrateJournal(str(tmp_path), str(tmp_path), '12345').migrate_journal()
+    migrated = processed_handler.load_serialized_journal()
+    assert migrated.html_source == 'index.html'
+    assert migrated.toc[0].page.html_sources == ['101.html', '101_2.html']
+    assert migrated.toc[0].page.original_html == (tmp_path / 'downloads' / '12345' / '101.html').read_bytes()
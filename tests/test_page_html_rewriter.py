@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+from bikesanity.entities.content_blocks import Image, TextBlock
+from bikesanity.entities.page import Page
+from bikesanity.services.html_postprocessor import HtmlPostProcessor
+from bikesanity.services.page_html_rewriter import PageHtmlRewriter
+
+
+PATHS = ['pics/small/p1.jpg', 'pics/small/p1.jpg2', 'pics/small/p2.jpg', 'pics/small/p', 'x/y.png']
+FRAGMENTS = [
+    '<script src="/javascript', "<script src='/javascript", '<script type="text/javascript" src="/javascript',
+    '<link rel="stylesheet" href="/css/', "<link href='/css", '"basemap":"stadia"', '"basemap":"', '>>> <A HREF="',
+    '<<< <A HREF="', '<a href="', '<a href=', '<img src="/', '<img src="', '">', '"', '>', '<', '\n', ' ', '  \n ',
+    '12', '3', 'page=', '.jpg', '?v=2', 'abc', '/', '\t', '\xa0'
+] + PATHS + ['/' + path for path in PATHS]
+
+
+def make_page(page_id, images):
+    page = Page('12345', page_id, None)
+    page.contents = images + [TextBlock(['text'])]
+    return page
+
+
+def make_image(small, fullsize):
+    return Image(small, fullsize, 'caption', None, None)
+
+
+def assert_parity(page, html):
+    # The single scan either declines or gives exactly what the rewrites one after another give
+    rewritten = PageHtmlRewriter(page).rewrite(html)
+    if rewritten is not None:
+        assert rewritten.encode() == HtmlPostProcessor().postprocess_page_html_sequentially(page, html)
+    assert HtmlPostProcessor().postprocess_page_html(page, html) == \
+        HtmlPostProcessor().postprocess_page_html_sequentially(page, html)
+    return rewritten
+
+
+def generate_layout(rand):
+    lines = ['<html><head><script src="/javascript/a.js"></script><link rel="stylesheet" href="/css/x.css">']
+    for position in range(rand.randint(0, 8)):
+        separator = rand.choice(['', ' ', '\n', '\n  '])
+        tail = rand.choice(['', '</a> ', '</a> <a href="/doc/page/pic/?o=1&pic_id={0}">'.format(position), '</a> <a href="/x">\n '])
+        lines.append('<a href="/pics/large/{0}">{1}<img src="/{2}?v=2" alt="x">{3}'.format(
+            position, separator, rand.choice(PATHS), tail
+        ))
+        if rand.random() < 0.3: lines.append('<p>text <a href="/other">link</a></p>')
+        if rand.random() < 0.2: lines.append('>>> <A HREF="/doc/page/?o=1&page=5&part={0}">Next'.format(position))
+        if rand.random() < 0.2: lines.append('<<< <A HREF="/doc/page/?o=1&page=5">Prev')
+        if rand.random() < 0.1: lines.append('{"basemap":"stadia"}')
+    return rand.choice(['\n', '', ' ']).join(lines)
+
+
+def generate_fragments(rand):
+    return ''.join(rand.choice(FRAGMENTS) for _ in range(rand.randint(0, 60)))
+
+
+def test_rewrites_typical_page():
+    page = make_page('101', [make_image('pics/small/1.jpg', 'pics/large/1.jpg'), make_image('pics/small/2.jpg', 'pics/large/2.jpg')])
+    html = '\n'.join([
+        '<script src="/javascript/journal.js"></script>',
+        '<link rel="stylesheet" href="/css/journal.css">',
+        '<a href="/doc/page/pic/?o=1&pic_id=1"><img src="/pics/small/1.jpg?v=2"></a>',
+        '<a href="/doc/page/pic/?o=1&pic_id=2">',
+        '  <img src="/pics/small/2.jpg?v=2"></a>',
+        '>>> <A HREF="/doc/page/?o=1&page_id=101&part=2">Next',
+        '{"basemap":"stadia"}',
+    ])
+    rewritten = assert_parity(page, html)
+    assert rewritten is not None
+    assert '<a href="pics/large/2.jpg"><img src="pics/small/2.jpg"' in rewritten
+    assert '101_2.html' in rewritten
+
+
+def test_declines_image_links_joined_onto_one_line():
+    # Rewriting the first link joins its lines, so the second is then found from the first link onwards
+    page = make_page('101', [make_image('pics/1.jpg', 'pics/large/1.jpg'), make_image('pics/2.jpg', 'pics/large/2.jpg')])
+    html = '<a href="/doc/page/pic/?o=1&pic_id=1">\n<img src="/pics/1.jpg?s=1"></a> ' \
+           '<a href="/doc/page/pic/?o=1&pic_id=2">\n<img src="/pics/2.jpg?s=1"></a>'
+    assert assert_parity(page, html) is None
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_matches_sequential_rewrites(seed):
+    rand = random.Random(seed)
+    for case in range(2000):
+        images = [
+            make_image(rand.choice(PATHS + ['/' + rand.choice(PATHS)]), '/pics/large/' + rand.choice(['a.jpg', 'b.jpg', 'c\\1.jpg']))
+            for _ in range(rand.randint(0, 5))
+        ]
+        rand.shuffle(images)
+        page = make_page(rand.choice(['101', '7', 'abc']), images)
+        html = generate_fragments(rand) if case % 2 else generate_layout(rand)
+        try:
+            HtmlPostProcessor().postprocess_page_html_sequentially(page, html)
+        except Exception:
+            # Anything the regexes can't take, the single scan must decline too
+            assert PageHtmlRewriter(page).rewrite(html) is None
+            continue
+        assert_parity(page, html)
@@ -0,0 +1,130 @@
+import os
+import shutil
+
+import pytest
+
+import bikesanity.services.lxml_tree as lxml_tree
+from bikesanity.entities.content_blocks import Heading, Image, Map
+from bikesanity.entities.page import Page
+from bikesanity.interpreter.journal_content import JournalContent
+from bikesanity.interpreter.parser_backends import ParserBackend, create_journal_interpreter, create_page_interpreter
+from bikesanity.io_utils.local_journal import LocalJournalHandler
+from bikesanity.processing.compare_parsers import CompareParsers
+from bikesanity.services.retrievers import LocalRetriever
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'downloads')
+CANDIDATES = [backend for backend in ParserBackend if backend != ParserBackend.BS4]
+
+MULTI_PAGE_JOURNAL = '12345'
+SINGLE_PAGE_JOURNAL = '777'
+
+
+@pytest.fixture
+def downloads(tmp_path):
+    # Interpreting saves the table of contents alongside the index, so work on a copy
+    location = str(tmp_path / 'downloads')
+    shutil.copytree(FIXTURES, location)
+    return location
+
+
+def interpret_journal(downloads, journal_id, backend, use_index_record=False):
+    retriever = LocalRetriever(LocalJournalHandler(downloads, journal_id))
+    return create_journal_interpreter(retriever, backend, use_index_record=use_index_record).retrieve_journal(None, journal_id)
+
+
+def interpret_page(downloads, journal, page_id, backend):
+    page_interpreter = create_page_interpreter(LocalRetriever(LocalJournalHandler(downloads, journal.journal_id)), backend)
+    if page_id == journal.journal_id:
+        return page_interpreter.parse_page(Page(journal.journal_id, journal.journal_id, journal.original_html), single=True)
+    return page_interpreter.parse_page(page_interpreter.retrieve_page(journal.journal_id, page_id, None))
+
+
+def page_ids(journal):
+    return [toc.original_id for toc in journal.toc if toc.url] if journal.toc else [journal.journal_id]
+
+
+def assert_same_model(expected, actual):
+    comparer = CompareParsers(FIXTURES)
+    difference = comparer.find_difference(comparer.normalize(expected), comparer.normalize(actual))
+    assert difference is None, difference
+
+
+@pytest.mark.parametrize('candidate', CANDIDATES, ids=lambda backend: backend.value)
+@pytest.mark.parametrize('journal_id', [MULTI_PAGE_JOURNAL, SINGLE_PAGE_JOURNAL])
+def test_backends_interpret_identically(downloads, journal_id, candidate):
+    expected = interpret_journal(downloads, journal_id, ParserBackend.BS4)
+    actual = interpret_journal(downloads, journal_id, candidate)
+    assert_same_model(expected, actual)
+
+    for page_id in page_ids(expected):
+        assert_same_model(
+            interpret_page(downloads, expected, page_id, ParserBackend.BS4), interpret_page(downloads, actual, page_id, candidate)
+        )
+
+
+def test_corpus_covers_journal_layouts(downloads):
+    # Parity only means something if the backends have every kind of content to interpret
+    journal = interpret_journal(downloads, MULTI_PAGE_JOURNAL, ParserBackend.BS4)
+    assert journal.cover_image is not None
+    assert [toc.original_id for toc in journal.toc if not toc.url]
+    assert len(page_ids(journal)) == 3
+
+    first_page = interpret_page(downloads, journal, '101', ParserBackend.BS4)
+    assert first_page.additional_html_pages
+    assert any(isinstance(content, Image) for content in first_page.contents)
+    assert any(isinstance(content, Map) for content in first_page.contents)
+
+    single = interpret_journal(downloads, SINGLE_PAGE_JOURNAL, ParserBackend.BS4)
+    assert page_ids(single) == [SINGLE_PAGE_JOURNAL]
+    single_page = interpret_page(downloads, single, SINGLE_PAGE_JOURNAL, ParserBackend.BS4)
+    assert len([content for content in single_page.contents if isinstance(content, Heading)]) == 2
+    assert any(isinstance(content, Map) for content in single_page.contents)
+
+
+INDEX_HEADERS = [
+    # Links, subtitles and labels before the title or subtitle are removed before the rest is read
+    '<html><head><title>T</title></head><body><a href="?o=1&user=9">Nav</a><h3>Early</h3><h1>Title <i>x</i><!--c--></h1>'
+    '<a href="?o=1&user=2">Removed</a><h3>Sub</h3><!--dist-->\n<b>Locale:</b> <a>A</a><!--k--><a>Bé</a><i>z</i><a>C</a></body></html>',
+    '<html><head><title>x</title></head><body><div><h3>Removed</h3></div><h1>T</h1>\n<b><i>Locales:</i></b><a>X</a></body></html>',
+    '<html><head><title>x</title></head><body><div><a href="&user=1">u</a><div><h1>Deep</h1></div></div>'
+    '<a href="&user=2">v</a><h3>s</h3></body></html>',
+    # Picture containers nested, and without pictures
+    '<html><head><title>x</title></head><body><table bgcolor="gainsboro"><tr><td><img src="/pics/a.jpg"></td></tr></table>'
+    '<h1>T</h1><h3>S</h3>  \n <table bgcolor="gainsboro"><tr><td><b>cap <script>x</script>y</b><table bgcolor="gainsboro">'
+    '<tr><td><img src="x.jpg"><img src="/pics/b.jpg"><b>inner</b></td></tr></table></td></tr></table><dl><dd>x</dl></body></html>',
+    '<html><head><title>A journey by Someone</title></head><body><dl><dd>x</dl><h1>T</h1><h3>S</h3>tail\t1 mile\n</body></html>',
+]
+
+
+@pytest.mark.parametrize('html', INDEX_HEADERS, ids=[str(number) for number in range(len(INDEX_HEADERS))])
+def test_streamed_index_header_matches_parsed(html):
+    html = html.encode('utf8')
+    expected = create_journal_interpreter(None, ParserBackend.BS4).read_header(html)
+    assert create_journal_interpreter(None, ParserBackend.LXML).read_header(html) == expected
+    assert create_journal_interpreter(None, ParserBackend.LXML_STREAMING).extract_index(html)[0] == expected
+
+
+def test_streaming_never_parses_single_page_journal_whole(downloads, monkeypatch):
+    def parse_document(html):
+        raise AssertionError('Whole document parsed')
+    monkeypatch.setattr(lxml_tree, 'parse_document', parse_document)
+
+    journal = interpret_journal(downloads, SINGLE_PAGE_JOURNAL, ParserBackend.LXML_STREAMING)
+    page = interpret_page(downloads, journal, SINGLE_PAGE_JOURNAL, ParserBackend.LXML_STREAMING)
+    assert journal.journal_title and page.contents
+
+
+@pytest.mark.parametrize('backend', list(ParserBackend), ids=lambda backend: backend.value)
+@pytest.mark.parametrize('journal_id', [MULTI_PAGE_JOURNAL, SINGLE_PAGE_JOURNAL])
+def test_index_is_read_again_from_its_record(downloads, journal_id, backend, monkeypatch):
+    expected = interpret_journal(downloads, journal_id, backend, use_index_record=True)
+    assert os.path.exists(os.path.join(downloads, journal_id, LocalJournalHandler.INDEX_RECORD_FILENAME))
+
+    # The same index is read again without being parsed at all
+    def parse(*args):
+        raise AssertionError('Index parsed again')
+    monkeypatch.setattr(lxml_tree, 'parse_events', parse)
+    monkeypatch.setattr(lxml_tree, 'parse_document', parse)
+    monkeypatch.setattr(JournalContent, 'parse_document', parse)
+    assert_same_model(expected, interpret_journal(downloads, journal_id, backend, use_index_record=True))
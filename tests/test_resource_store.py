@@ -0,0 +1,86 @@
+import io
+import os
+import threading
+
+from bikesanity.io_utils.file_handler import FileHandler
+from bikesanity.io_utils.local_journal import LocalJournalHandler
+
+
+def link_from_threads(source, filename, workers=8, rounds=50):
+    errors = []
+    barrier = threading.Barrier(workers)
+
+    def link():
+        try:
+            for _ in range(rounds):
+                barrier.wait()
+                FileHandler().link_or_copy_file(source, filename)
+        except Exception as exc:
+            errors.append(exc)
+            barrier.abort()
+
+    threads = [threading.Thread(target=link) for _ in range(workers)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return errors
+
+
+def test_linking_the_same_file_at_once(tmp_path):
+    source = tmp_path / 'source.jpg'
+    source.write_bytes(b'picture' * 1000)
+    errors = link_from_threads(str(source), str(tmp_path / 'out' / 'linked.jpg'))
+
+    assert not errors
+    assert (tmp_path / 'out' / 'linked.jpg').read_bytes() == source.read_bytes()
+    assert os.listdir(tmp_path / 'out') == ['linked.jpg']
+
+
+def test_copying_the_same_file_at_once(tmp_path, monkeypatch):
+    def no_links(*args, **kwargs):
+        raise OSError('Hard links not supported')
+    monkeypatch.setattr(os, 'link', no_links)
+
+    source = tmp_path / 'source.jpg'
+    source.write_bytes(b'picture' * 100000)
+    (tmp_path / 'out').mkdir()
+    errors = link_from_threads(str(source), str(tmp_path / 'out' / 'copied.jpg'), rounds=10)
+
+    assert not errors
+    assert (tmp_path / 'out' / 'copied.jpg').read_bytes() == source.read_bytes()
+    assert os.listdir(tmp_path / 'out') == ['copied.jpg']
+
+
+def test_linking_a_file_onto_itself(tmp_path):
+    source = tmp_path / 'source.jpg'
+    source.write_bytes(b'picture')
+    FileHandler().link_or_copy_file(str(source), str(source))
+
+    assert source.read_bytes() == b'picture'
+    assert os.listdir(tmp_path) == ['source.jpg']
+
+
+def save_resource(processed, journal_id, data):
+    handler = LocalJournalHandler(str(processed), journal_id)
+    key = handler.get_resource_store().save(io.BytesIO(data), 'jpg')
+    return handler, key
+
+
+def test_shared_resource_linked_into_downloads_is_pruned(tmp_path):
+    processed = tmp_path / 'processed'
+    first, key = save_resource(processed, '1', b'picture')
+    second, _ = save_resource(processed, '2', b'picture')
+    shared_path = first.get_resource_store().get_shared_path(key)
+
+    # Downloaded pictures are hard linked to the same file, so it's never linked only from the shared store
+    download_path = tmp_path / 'downloads' / '1' / 'pics' / 'picture.jpg'
+    download_path.parent.mkdir(parents=True)
+    os.link(shared_path, download_path)
+
+    # Still kept in the other journal's store
+    first.prune_resources(set())
+    assert os.path.isfile(shared_path)
+
+    second.prune_resources(set())
+    assert not os.path.exists(shared_path)
+    assert not os.listdir(os.path.join(str(processed), LocalJournalHandler.SHARED_RESOURCES_DIRECTORY))
+    assert download_path.read_bytes() == b'picture'
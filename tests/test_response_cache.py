@@ -0,0 +1,103 @@
+import os
+import shutil
+import time
+
+from bikesanity.io_utils.response_cache import ResponseCache
+from bikesanity.processing import download_batch
+from bikesanity.processing.download_journal import DownloadJournal
+
+
+def write_unreferenced_body(cache, body_hash, age):
+    path = cache._body_path(body_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as handle:
+        handle.write(b'body')
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_eviction_leaves_bodies_just_written(tmp_path):
+    # Another cache on the directory may have saved the body but not yet its metadata
+    cache = ResponseCache(str(tmp_path))
+    fresh = write_unreferenced_body(cache, 'ab' * 20, age=0)
+    stale = write_unreferenced_body(cache, 'cd' * 20, age=ResponseCache.EVICTION_GRACE * 2)
+
+    cache.evict()
+
+    assert os.path.isfile(fresh)
+    assert not os.path.exists(stale)
+
+
+def test_batch_journals_share_one_cache(tmp_path, monkeypatch):
+    downloaders = []
+
+    class RecordingDownloader(download_batch.DownloadJournal):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            downloaders.append(self)
+
+        def download_journal_url(self, url, from_page=0):
+            return None
+
+    monkeypatch.setattr(download_batch, 'DownloadJournal', RecordingDownloader)
+    batch = download_batch.DownloadBatch(str(tmp_path))
+    batch.download_journal_urls(['first', 'second'])
+
+    assert len(downloaders) == 2
+    assert all(downloader.retriever.response_cache is batch.response_cache for downloader in downloaders)
+
+
+def cached_bodies(cache_directory):
+    bodies = []
+    for directory, _, filenames in os.walk(os.path.join(cache_directory, ResponseCache.BODY_DIRECTORY)):
+        for filename in filenames:
+            with open(os.path.join(directory, filename), 'rb') as handle:
+                bodies.append(handle.read())
+    return bodies
+
+
+def download_afresh(downloader, journal_site):
+    # Start the download over, so every page is asked for again
+    journal = downloader.download_journal_url(journal_site.journal_url)
+    shutil.rmtree(downloader.get_download_location(journal))
+    return journal
+
+
+def test_only_pages_are_cached(journal_site, make_downloader, tmp_path):
+    make_downloader().download_journal_url(journal_site.journal_url)
+
+    bodies = cached_bodies(str(tmp_path / DownloadJournal.CACHE_DIRECTORY))
+    assert len(bodies) == 5
+    assert all(body.startswith(b'<html>') for body in bodies)
+
+
+def test_pages_are_revalidated_by_default(journal_site, make_downloader):
+    download_afresh(make_downloader(), journal_site)
+    journal_site.requests.clear()
+
+    make_downloader().download_journal_url(journal_site.journal_url)
+
+    assert len(journal_site.requested('/doc/page/')) == 4
+
+
+def test_pages_fresh_by_their_headers_are_served_from_cache(journal_site, make_downloader):
+    journal_site.extra_headers['Cache-Control'] = 'max-age=3600'
+    download_afresh(make_downloader(), journal_site)
+    journal_site.requests.clear()
+
+    make_downloader().download_journal_url(journal_site.journal_url)
+
+    assert journal_site.requested('/doc/page/') == []
+    assert journal_site.requested('/doc/') == []
+
+
+def test_freshness_lifetime_follows_headers(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    assert cache.freshness_lifetime({}) == 0
+    assert cache.freshness_lifetime({'Cache-Control': 'public, max-age=600'}) == 600
+    assert cache.freshness_lifetime({'Cache-Control': 'no-cache, max-age=600'}) == 0
+    assert cache.freshness_lifetime({
+        'Date': 'Mon, 01 Jun 2020 10:00:00 GMT', 'Expires': 'Mon, 01 Jun 2020 11:00:00 GMT'
+    }) == 3600
+    assert cache.freshness_lifetime({'Expires': '0'}) == 0
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Reads the index of a single-page journal with the given number of sections, reporting the HTML size and peak memory growth
+INTERPRET_JOURNAL = '''
+import os, resource, sys
+from bikesanity.interpreter.parser_backends import create_journal_interpreter
+from bikesanity.io_utils.local_journal import LocalJournalHandler
+from bikesanity.services.retrievers import LocalRetriever
+
+backend, location, sections = sys.argv[1], sys.argv[2], int(sys.argv[3])
+os.makedirs(os.path.join(location, '9'))
+section = '<table><tr><td><hr></td></tr></table><big><h1>Part {0}</h1></big><div>' + '<p>Some <b>bold</b> text</p>\\n' * 20 + '</div>\\n'
+with open(os.path.join(location, '9', 'index.html'), 'w') as index_file:
+    index_file.write('<html><head><title>Long by Someone</title></head><body><h1>Long</h1><h3>Sub</h3> 1 mile\\n')
+    for number in range(sections): index_file.write(section.format(number))
+    index_file.write('</body></html>')
+
+retriever = LocalRetriever(LocalJournalHandler(location, '9'))
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+create_journal_interpreter(retriever, backend).retrieve_journal(None, '9')
+growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+print(os.path.getsize(os.path.join(location, '9', 'index.html')) // 1024, growth)
+'''
+
+
+def peak_growth(tmp_path, backend, sections=3000):
+    environment = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.run(
+        [sys.executable, '-c', INTERPRET_JOURNAL, backend, str(tmp_path / backend), str(sections)],
+        env=environment, check=True, capture_output=True, text=True
+    ).stdout
+    return [int(value) for value in output.split()]
+
+
+def test_streaming_index_memory_stays_near_html_size(tmp_path):
+    # Reading the index holds little more than the HTML itself, where a parsed tree needs many times it
+    html_size, streaming_growth = peak_growth(tmp_path, 'lxml-streaming')
+    _, parsed_growth = peak_growth(tmp_path, 'lxml')
+    assert streaming_growth < html_size * 4
+    assert streaming_growth * 4 < parsed_growth
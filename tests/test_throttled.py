@@ -0,0 +1,12 @@
+from bikesanity.io_utils.throttled import ThrottledSession
+
+
+def test_adaptive_limiter_never_beats_the_standard_rate():
+    limiter = ThrottledSession.create_rate_limiter()
+    intervals = [limiter.record_response(200, 0.1) for _ in range(50)]
+    assert min(intervals) == ThrottledSession.STANDARD_REQUEST_RATE_LIMITER_MIN
+
+    # Backing off, then recovering no further than the standard rate
+    assert limiter.record_response(429, 0.1) == ThrottledSession.STANDARD_REQUEST_RATE_LIMITER_MIN * 2
+    intervals = [limiter.record_response(200, 0.1) for _ in range(50)]
+    assert intervals[-1] == ThrottledSession.STANDARD_REQUEST_RATE_LIMITER_MIN